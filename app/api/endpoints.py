@@ -1,9 +1,33 @@
-from fastapi import APIRouter, Form, Request, HTTPException, BackgroundTasks
-import asyncio
+from fastapi import APIRouter, Depends, Form, Request, HTTPException, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from ..services import YtDlpService
-from ..schemas import VideoInfo
+from typing import List, Optional
+from ..services import YtDlpService, AUDIO_ONLY, AUDIO_PROFILES
+from ..schemas import JobInfo, SubscriptionInfo, WorkerPoll, WorkerResult
+from ..jobs import job_scheduler, JobStateError, SUBMIT_EXISTS, SUBMIT_JOINED, SUBMIT_QUEUED, COMPLETED, file_url
+from ..store import download_store, OUTPUT_OPTIONS
+from ..batch import batch_registry, FORMAT_RULES, DEFAULT_FORMAT_RULE
+from ..formats import FormatRule
+from ..clips import ClipRange, parse_clip
+from ..metadata import Video
+from ..subscriptions import subscription_poller, SubscriptionExists
+from ..core.config import settings
+from ..core.executor import extraction_executor, ExecutorSaturated, ClientDisconnected, cancel_on_disconnect
+from ..core.cache import metadata_cache
+from ..core.diskspace import disk_space
+from ..core.fragments import fragment_cache
+from ..core.governor import request_governor, HostBlocked
+from ..core.ydl_pool import extraction_ydl_pool
+from ..core.throttle import bandwidth_limiter, serve_limiter
+from ..core.filestream import (FileStreamResponse, FollowFileResponse, file_stream_slots,
+                               GROWING, COMPLETE, FAILED)
+from ..core.log_manager import log_manager
+from ..core.profiler import sampling_profiler, ProfilerBusy
+import asyncio
+import math
+import mimetypes
 import os
+import secrets
 
 router = APIRouter()
 
@@ -13,28 +37,124 @@ templates = Jinja2Templates(directory=templates_dir)
 
 service = YtDlpService()
 
-@router.post("/preview")
-async def preview_video(request: Request, url: str = Form(...)):
+# Fragmentos de la vista previa que se cargan después del esqueleto (hx-get)
+PREVIEW_FRAGMENTS = {
+    "formats": "partials/preview_formats.html",
+    "subtitles": "partials/preview_subtitles.html",
+}
+
+async def _video_info(request: Request, url: str, key: str) -> Video:
     """
-    Endpoint para HTMX. Recibe una URL, extrae info y devuelve el HTML de la tarjeta de preview.
+    Extracción en el pool de extracción (para no bloquear el event loop), detrás de la
+    caché de metadatos: solicitudes simultáneas del mismo video comparten extracción.
+    `key` es la clave del video (service.video_key_async).
     """
-    try:
-        video_info: VideoInfo = service.get_video_info(url)
+    return await cancel_on_disconnect(
+        metadata_cache.get_or_load(
+            key,
+            lambda: extraction_executor.run(service.get_video_info, url, timeout=settings.EXTRACT_TIMEOUT),
+        ),
+        request.is_disconnected,
+    )
+
+def _render_fragment(request: Request, key: str, video_info: Video, template: str) -> Response:
+    fragment = fragment_cache.get_or_render(
+        key, template, video_info,
+        lambda: templates.get_template(template).render(request=request, video=video_info),
+    )
+    # no-cache: el navegador guarda la respuesta pero revalida siempre con If-None-Match
+    headers = {"ETag": fragment.etag, "Cache-Control": "no-cache"}
+    if fragment_cache.not_modified(request.headers, fragment):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(fragment.html, headers=headers)
+
+def _preview_error(request: Request, e: Exception) -> Response:
+    if isinstance(e, ClientDisconnected):
+        # Nadie espera la respuesta; 499 = "Client Closed Request" (convención nginx)
+        return Response(status_code=499)
+    if isinstance(e, ExecutorSaturated):
         return templates.TemplateResponse(
-            "partials/video_preview.html", 
-            {"request": request, "video": video_info}
+            "partials/error.html",
+            {"request": request, "message": str(e)},
+            status_code=503,
+            headers={"Retry-After": "5"}
         )
-    except Exception as e:
-        # En caso de error, devolvemos un snippet de error para HTMX
+    if isinstance(e, HostBlocked):
+        # El sitio respondió 429 hace poco: no tiene sentido esperar dentro del pool
         return templates.TemplateResponse(
             "partials/error.html",
             {"request": request, "message": str(e)},
-            status_code=400
+            status_code=503,
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    if isinstance(e, TimeoutError):
+        return templates.TemplateResponse(
+            "partials/error.html",
+            {"request": request, "message": str(e)},
+            status_code=504
         )
+    # En caso de error, devolvemos un snippet de error para HTMX
+    return templates.TemplateResponse(
+        "partials/error.html",
+        {"request": request, "message": str(e)},
+        status_code=400
+    )
+
+@router.post("/preview")
+async def preview_video(request: Request, url: str = Form(...)):
+    """
+    Endpoint para HTMX. Recibe una URL, extrae info y devuelve el esqueleto de la
+    tarjeta de preview (miniatura, título, duración). Los selectores de formato y la
+    lista de subtítulos llegan después como fragmentos (GET /preview/{fragmento}).
+    """
+    try:
+        key = await service.video_key_async(url)
+        video_info = await _video_info(request, url, key)
+        return _render_fragment(request, key, video_info, "partials/video_preview.html")
+    except Exception as e:
+        return _preview_error(request, e)
+
+@router.get("/preview/{fragment}")
+async def preview_fragment(request: Request, fragment: str, url: str):
+    """
+    Fragmento de la vista previa ('formats' o 'subtitles'). El HTML renderizado se
+    guarda por video y se sirve con ETag: las vistas previas repetidas reciben 304.
+    """
+    template = PREVIEW_FRAGMENTS.get(fragment)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Fragmento desconocido: {fragment}")
+    try:
+        key = await service.video_key_async(url)
+        video_info = await _video_info(request, url, key)
+        return _render_fragment(request, key, video_info, template)
+    except Exception as e:
+        return _preview_error(request, e)
+
+async def _estimated_size(url: str, format_id: str, options: dict, clip: Optional[ClipRange] = None) -> Optional[int]:
+    """
+    Espacio que necesitará la descarga según los formatos de la vista previa
+    (Format.filesize, en la caché de metadatos): el planificador lo reserva
+    antes de arrancar el trabajo. None si no está en caché o falta algún tamaño.
+    Para un tramo, la parte proporcional (None si depende de los capítulos).
+    """
+    video_info = metadata_cache.peek(await service.video_key_async(url))
+    if video_info is None:
+        return None
+    formats = {f.format_id: f for f in (*video_info.video_formats, *video_info.audio_formats)}
+    chosen = [formats.get(format_id) for format_id in format_id.split("+")]
+    if None in chosen:
+        return None
+    size = service.space_needed([f.filesize for f in chosen], options,
+                                remux=any((f.protocol or "").startswith("m3u8") for f in chosen))
+    if clip is None or size is None:
+        return size
+    seconds = clip.duration(video_info.duration or None)
+    if seconds is None or not video_info.duration:
+        return None
+    return int(size * min(seconds / video_info.duration, 1.0))
 
 @router.post("/download")
 async def download_video(
-    background_tasks: BackgroundTasks,
     url: str = Form(...), 
     title: str = Form(...),
     video_format_id: str = Form(...),
@@ -44,31 +164,458 @@ async def download_video(
     embed_thumbnail: bool = Form(False),
     embed_chapters: bool = Form(False),
     embed_subs: bool = Form(False),
-    sub_format: str = Form("vtt")
+    sub_format: str = Form("vtt"),
+    priority: int = Form(0),
+    # Modo audio (video_format_id = "audio"): perfil de AUDIO_PROFILES y normalización de volumen
+    audio_profile: str = Form(settings.AUDIO_DEFAULT_PROFILE),
+    audio_normalize: bool = Form(False),
+    # Tramo (ver app/clips.py): inicio/fin ('1:30', '90', '1h2m') o capítulos ('3-5' o texto del título)
+    clip_start: Optional[str] = Form(None),
+    clip_end: Optional[str] = Form(None),
+    clip_chapters: Optional[str] = Form(None),
+    clip_keyframes: bool = Form(False),
+    # Perfil de rendimiento (None = valor por defecto de Settings)
+    concurrent_fragments: Optional[int] = Form(None),
+    http_chunk_size_mb: Optional[float] = Form(None),
+    retries: Optional[int] = Form(None),
+    resume: Optional[bool] = Form(None),
+    rate_limit_mbps: Optional[float] = Form(None)
 ):
     """
-    Inicia la descarga combinando video y audio si es necesario.
+    Encola la descarga (combinando video y audio si es necesario) en el planificador de trabajos.
+    Si el archivo ya se descargó responde al instante ('exists'); si ya se está
+    descargando, devuelve el trabajo existente ('joined') para seguir su progreso.
+    Con clip_start/clip_end o clip_chapters solo se descarga ese tramo.
     """
+    try:
+        clip = parse_clip(clip_start, clip_end, clip_chapters, clip_keyframes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # Construir el string de formato para yt-dlp
     # Si hay audio seleccionado explícito: 'video+audio'
     # Si no, solo 'video' (que puede tener audio integrado o no, riesgo del usuario si elije solo video mudo)
-    final_format = f"{video_format_id}+{audio_format_id}" if audio_format_id else video_format_id
-    
-    final_format = f"{video_format_id}+{audio_format_id}" if audio_format_id else video_format_id
-    
-    # Obtenemos el loop actual para pasarlo a la tarea en segundo plano
-    loop = asyncio.get_running_loop()
-    
+    audio_mode = video_format_id == AUDIO_ONLY
+    if audio_mode:
+        # Solo la pista de audio, sin video que combinar
+        final_format = audio_format_id or "bestaudio/best"
+        if audio_profile not in AUDIO_PROFILES:
+            raise HTTPException(status_code=400, detail=f"Perfil de audio desconocido: {audio_profile}")
+    else:
+        final_format = f"{video_format_id}+{audio_format_id}" if audio_format_id else video_format_id
+
     options = {
         'embed_metadata': embed_metadata,
         'embed_thumbnail': embed_thumbnail,
         'embed_chapters': embed_chapters,
         'embed_subs': embed_subs,
-        'sub_format': sub_format
+        'sub_format': sub_format,
+        'concurrent_fragments': concurrent_fragments,
+        'http_chunk_size': int(http_chunk_size_mb * 1024 * 1024) if http_chunk_size_mb is not None else None,
+        'retries': retries,
+        'resume': resume,
+        'rate_limit': int(rate_limit_mbps * 1024 * 1024) if rate_limit_mbps else None,
     }
+    if audio_mode:
+        options.update(audio_profile=audio_profile, audio_normalize=audio_normalize, embed_subs=False)
+    if clip is not None:
+        options["clip"] = clip.to_options()
 
-    background_tasks.add_task(service.download_video_background, url, final_format, subtitles, options, loop)
-    
+    submission = await job_scheduler.submit(url, title, final_format, subtitles, options, priority=priority,
+                                            estimated_size=await _estimated_size(url, final_format, options, clip))
+
+    if submission.status == SUBMIT_EXISTS:
+        stored = submission.stored
+        return {
+            "status": "exists", "job_id": stored.job_id, "path": stored.path, "size": stored.size,
+            "sha256": stored.sha256, "message": f"Ya descargado: {stored.path}",
+            "file_url": file_url(stored.job_id) if stored.job_id is not None else None,
+        }
+    job = submission.job
+    if submission.status == SUBMIT_JOINED:
+        return {"status": "joined", "job_id": job.id, "message": f"Ya se está descargando: {job.title} (trabajo #{job.id})"}
     
-    print(f"Tarea: {title} | Formato: {final_format} | Subs: {subtitles} | Options: {options}")
-    return {"status": "started", "message": f"Descargando {title}..."}
+    print(f"Tarea #{job.id}: {title} | Formato: {final_format} | Subs: {subtitles} | Options: {options}")
+    suffix = f" (tramo {clip.label})" if clip is not None else ""
+    return {"status": "queued", "job_id": job.id, "message": f"Descarga en cola: {title}{suffix}"}
+
+@router.post("/batch")
+async def create_batch(request: Request, urls: str = Form(...)):
+    """
+    Crea un lote a partir de una lista de URLs (una por línea) o de una playlist/canal.
+    Devuelve el HTML del lote; las entradas llegan después por SSE (/batch/{id}/stream).
+    """
+    url_list = [u.strip() for u in urls.replace(",", "\n").splitlines() if u.strip()]
+    if not url_list:
+        return templates.TemplateResponse(
+            "partials/error.html",
+            {"request": request, "message": "No se encontró ninguna URL"},
+            status_code=400
+        )
+    batch = batch_registry.create(url_list)
+    return templates.TemplateResponse(
+        "partials/batch.html",
+        {"request": request, "batch": batch, "format_rules": FORMAT_RULES, "default_rule": DEFAULT_FORMAT_RULE}
+    )
+
+def _sse(event: str, data: str, event_id: Optional[int] = None) -> str:
+    """Serializa un evento Server-Sent Events (cada línea del payload con su prefijo 'data:')."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+@router.get("/batch/{batch_id}/stream")
+async def stream_batch(request: Request, batch_id: str):
+    """
+    Stream SSE con las entradas del lote a medida que se enumeran (extensión sse de HTMX).
+    Respeta Last-Event-ID, así una reconexión del navegador no duplica filas.
+    """
+    batch = batch_registry.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+
+    try:
+        sent = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        sent = 0
+    if batch.done and sent >= len(batch.entries):
+        # 204 indica al EventSource que no vuelva a conectarse
+        return Response(status_code=204)
+
+    row_template = templates.get_template("partials/batch_entry.html")
+
+    async def events():
+        nonlocal sent
+        while True:
+            while sent < len(batch.entries):
+                entry = batch.entries[sent]
+                sent += 1
+                yield _sse("entry", row_template.render(entry=entry, index=sent), sent)
+            status = f"{len(batch.entries)} videos" + ("" if batch.done else " (buscando...)")
+            yield _sse("status", status)
+            if batch.done:
+                if batch.errors:
+                    yield _sse("errors", "<br>".join(batch.errors))
+                yield _sse("done", "")
+                return
+            if await request.is_disconnected():
+                return
+            await batch.wait_for_change()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.post("/batch/{batch_id}/enqueue")
+async def enqueue_batch(
+    batch_id: str,
+    format_rule: str = Form(DEFAULT_FORMAT_RULE),
+    custom_rule: str = Form(""),
+    entries: List[str] = Form([]),
+    priority: int = Form(0),
+    embed_metadata: bool = Form(False),
+    embed_thumbnail: bool = Form(False),
+    embed_chapters: bool = Form(False),
+    audio_profile: str = Form(settings.AUDIO_DEFAULT_PROFILE),
+    audio_normalize: bool = Form(False)
+):
+    """
+    Encola las entradas seleccionadas del lote (todas si no se selecciona ninguna)
+    con una regla de formato (predefinida o `custom_rule`, ej: "prefer av1>vp9, <=1440p, <=2GB, best opus").
+    Con una regla de solo audio se aplica el perfil de audio (`audio_profile`, `audio_normalize`);
+    las conversiones corren en paralelo en el pool de post-procesado (POSTPROCESS_WORKERS).
+    Los metadatos completos de cada video se obtienen al arrancar su trabajo.
+    """
+    batch = batch_registry.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    if not custom_rule.strip() and format_rule not in FORMAT_RULES:
+        raise HTTPException(status_code=400, detail=f"Regla de formato desconocida: {format_rule}")
+    try:
+        rule = FormatRule(custom_rule.strip() or FORMAT_RULES[format_rule][1])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Regla de formato no válida: {e}")
+
+    selected = set(entries)
+    items = [(e.url, e.title) for e in batch.entries if not selected or e.url in selected]
+    options = {
+        'embed_metadata': embed_metadata,
+        'embed_thumbnail': embed_thumbnail,
+        'embed_chapters': embed_chapters,
+    }
+    if rule.audio_only:
+        if audio_profile not in AUDIO_PROFILES:
+            raise HTTPException(status_code=400, detail=f"Perfil de audio desconocido: {audio_profile}")
+        options.update(audio_profile=audio_profile, audio_normalize=audio_normalize)
+    submissions = await job_scheduler.submit_many(items, rule.spec, [], options, priority=priority)
+    queued = [s.job.id for s in submissions if s.status == SUBMIT_QUEUED]
+    joined = [s.job.id for s in submissions if s.status == SUBMIT_JOINED]
+    existing = sum(1 for s in submissions if s.status == SUBMIT_EXISTS)
+    message = f"{len(queued)} descargas en cola"
+    if joined or existing:
+        message += f" ({len(joined)} ya en curso, {existing} ya descargadas)"
+    return {"status": "queued", "job_ids": queued + joined, "joined": len(joined), "exists": existing, "message": message}
+
+@router.get("/jobs", response_model=List[JobInfo])
+async def list_jobs(state: Optional[str] = None, limit: int = 100):
+    """Lista los trabajos de descarga, del más reciente al más antiguo."""
+    return await job_scheduler.list_jobs(state, limit)
+
+async def _job_action(action, job_id: int) -> JobInfo:
+    try:
+        return JobInfo.model_validate(await action(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobInfo)
+async def cancel_job(job_id: int):
+    return await _job_action(job_scheduler.cancel, job_id)
+
+@router.post("/jobs/{job_id}/pause", response_model=JobInfo)
+async def pause_job(job_id: int):
+    return await _job_action(job_scheduler.pause, job_id)
+
+@router.post("/jobs/{job_id}/resume", response_model=JobInfo)
+async def resume_job(job_id: int):
+    return await _job_action(job_scheduler.resume, job_id)
+
+def _worker_auth(request: Request):
+    """Con WORKER_TOKEN configurado, los workers deben enviarlo como `Authorization: Bearer ...`."""
+    if not settings.WORKER_TOKEN:
+        return
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), settings.WORKER_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de worker no válido")
+
+@router.post("/workers/{worker_id}/poll", dependencies=[Depends(_worker_auth)])
+async def worker_poll(worker_id: str, poll: WorkerPoll):
+    """
+    Sondeo de un worker externo (worker.py): latido, logs y progreso de sus
+    trabajos, y trabajos nuevos si tiene cupo. Ver JobScheduler.worker_poll.
+    """
+    return await job_scheduler.worker_poll(worker_id, poll.jobs, poll.slots, poll.events)
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/finish", dependencies=[Depends(_worker_auth)])
+async def worker_finish(worker_id: str, job_id: int, result: WorkerResult):
+    """Resultado de un trabajo cedido a un worker; 409 si su lease ya venció."""
+    try:
+        await job_scheduler.worker_finish(worker_id, job_id, result.model_dump())
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": "ok"}
+
+# Los botones del panel recargan la lista con este evento (cabecera HX-Trigger)
+_SUBSCRIPTIONS_CHANGED = {"HX-Trigger": "subscriptions-changed"}
+
+@router.get("/subscriptions", response_model=List[SubscriptionInfo])
+async def list_subscriptions():
+    return await subscription_poller.list()
+
+@router.get("/subscriptions/panel", response_class=HTMLResponse)
+async def subscriptions_panel(request: Request, list_only: bool = False):
+    """Panel de suscripciones para la interfaz (HTMX): formulario y lista, o solo la lista."""
+    subscriptions = [SubscriptionInfo.model_validate(s) for s in await subscription_poller.list()]
+    return templates.TemplateResponse("partials/subscriptions.html", {
+        "request": request, "subscriptions": subscriptions, "list_only": list_only,
+        "rules": FORMAT_RULES, "default_rule": DEFAULT_FORMAT_RULE, "interval": settings.SUBSCRIPTION_INTERVAL,
+    })
+
+@router.post("/subscriptions", response_model=SubscriptionInfo)
+async def create_subscription(
+    response: Response,
+    url: str = Form(...),
+    format_rule: str = Form(DEFAULT_FORMAT_RULE),
+    custom_rule: str = Form(""),
+    interval_minutes: float = Form(settings.SUBSCRIPTION_INTERVAL / 60),
+    backfill: int = Form(0),
+    embed_metadata: bool = Form(False),
+    embed_thumbnail: bool = Form(False),
+    embed_chapters: bool = Form(False)
+):
+    """
+    Suscribe un canal o playlist: se sondea cada `interval_minutes` y los videos nuevos
+    se encolan con la regla de formato. El primer sondeo solo descarga los `backfill`
+    videos más recientes; el resto de lo ya publicado se da por visto.
+    """
+    if not custom_rule.strip() and format_rule not in FORMAT_RULES:
+        raise HTTPException(status_code=400, detail=f"Regla de formato desconocida: {format_rule}")
+    options = {
+        'embed_metadata': embed_metadata,
+        'embed_thumbnail': embed_thumbnail,
+        'embed_chapters': embed_chapters,
+    }
+    try:
+        subscription = await subscription_poller.add(
+            url, custom_rule.strip() or FORMAT_RULES[format_rule][1], interval_minutes * 60, options, backfill)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Regla de formato no válida: {e}")
+    except SubscriptionExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    response.headers.update(_SUBSCRIPTIONS_CHANGED)
+    return subscription
+
+async def _subscription_action(response: Response, action, subscription_id: int, *args) -> SubscriptionInfo:
+    try:
+        subscription = await action(subscription_id, *args)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Suscripción {subscription_id} no encontrada")
+    response.headers.update(_SUBSCRIPTIONS_CHANGED)
+    return SubscriptionInfo.model_validate(subscription)
+
+@router.post("/subscriptions/{subscription_id}/poll", response_model=SubscriptionInfo)
+async def poll_subscription(response: Response, subscription_id: int):
+    return await _subscription_action(response, subscription_poller.poll_now, subscription_id)
+
+@router.post("/subscriptions/{subscription_id}/enable", response_model=SubscriptionInfo)
+async def enable_subscription(response: Response, subscription_id: int):
+    return await _subscription_action(response, subscription_poller.set_enabled, subscription_id, True)
+
+@router.post("/subscriptions/{subscription_id}/disable", response_model=SubscriptionInfo)
+async def disable_subscription(response: Response, subscription_id: int):
+    return await _subscription_action(response, subscription_poller.set_enabled, subscription_id, False)
+
+@router.delete("/subscriptions/{subscription_id}", response_model=SubscriptionInfo)
+async def delete_subscription(response: Response, subscription_id: int):
+    return await _subscription_action(response, subscription_poller.remove, subscription_id)
+
+async def _job_file(job) -> Optional[str]:
+    """Ruta absoluta del archivo final de un trabajo, si sigue dentro de DOWNLOAD_DIR."""
+    relative = job.output_path
+    if relative is None and job.dedup_key:
+        # Trabajos completados antes de guardar output_path: se busca en el índice
+        stored = await download_store.lookup(job.dedup_key)
+        relative = stored.path if stored else None
+    if relative is None:
+        return None
+    path = os.path.join(settings.DOWNLOAD_DIR, relative)
+    # Rechaza rutas que escapen del directorio (.., enlaces simbólicos)
+    return path if download_store.relative_path(path) is not None else None
+
+async def _file_etag(job, path: str, stat: os.stat_result) -> str:
+    # El SHA-256 del índice si describe este mismo archivo; si no, tamaño + mtime
+    if job.dedup_key:
+        stored = await download_store.lookup(job.dedup_key)
+        if (stored and download_store.full_path(stored) == path
+                and stored.size == stat.st_size and stored.mtime == stat.st_mtime):
+            return f'"{stored.sha256}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def _tee_source(job_id: int, control):
+    def source():
+        if control.stopped or control.progressive is False:
+            return None, FAILED
+        if control.download_finished:
+            return control.live_path, COMPLETE
+        if job_scheduler.live_control(job_id) is not control:
+            return None, FAILED  # Terminó sin completar la descarga
+        return control.live_path, GROWING
+    return source
+
+@router.api_route("/files/{job_id}", methods=["GET", "HEAD"])
+async def get_file(job_id: int, tee: bool = False, download: bool = True):
+    """
+    Sirve el archivo final de un trabajo completado, con Range (206/416), ETag,
+    Last-Modified (304) y el límite de ancho de banda SERVE_RATE_LIMIT.
+
+    Con `tee=1` y el trabajo aún descargando, envía el archivo a medida que se
+    escribe (solo formatos progresivos sin post-procesado: sin combinar video+audio
+    ni incrustar nada). `download=0` lo sirve inline (reproducir en el navegador).
+    """
+    job = await job_scheduler.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+
+    control = job_scheduler.live_control(job_id) if tee and job.state != COMPLETED else None
+    if tee and control is None and job.state != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"El trabajo {job_id} no se está descargando ({job.state})")
+    if control is not None and ("+" in job.format or control.progressive is False
+                                or any((job.options or {}).get(name) for name in OUTPUT_OPTIONS if name != "sub_format")):
+        raise HTTPException(status_code=409, detail="El modo tee solo admite formatos progresivos sin post-procesado")
+
+    path = None
+    if control is None:
+        path = await _job_file(job)
+        if path is None:
+            raise HTTPException(status_code=404, detail=f"El trabajo {job_id} no tiene archivo ({job.state})")
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except OSError:
+            raise HTTPException(status_code=404, detail="El archivo ya no existe")
+
+    if not file_stream_slots.acquire():
+        raise HTTPException(status_code=503, detail="Demasiados envíos simultáneos", headers={"Retry-After": "5"})
+    try:
+        if control is not None:
+            # Nombre provisional a partir del .part (puede no conocerse si aún no empezó)
+            filename = os.path.basename(control.live_path).removesuffix(".part") if control.live_path else None
+            return FollowFileResponse(
+                _tee_source(job_id, control),
+                media_type=(filename and mimetypes.guess_type(filename)[0]) or "application/octet-stream",
+                filename=filename, attachment=download, limiter=serve_limiter,
+                chunk_size=settings.SERVE_CHUNK_SIZE, slots=file_stream_slots,
+            )
+        filename = os.path.basename(path)
+        if job.output_path:
+            await download_store.touch(job.output_path)  # Uso reciente: último en la expulsión LRU
+        return FileStreamResponse(
+            path, stat, await _file_etag(job, path, stat),
+            media_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            filename=filename, attachment=download, limiter=serve_limiter,
+            chunk_size=settings.SERVE_CHUNK_SIZE, slots=file_stream_slots,
+        )
+    except BaseException:
+        file_stream_slots.release()
+        raise
+
+
+@router.post("/bandwidth")
+async def set_bandwidth(global_rate_limit_mbps: float = Form(0), serve_rate_limit_mbps: Optional[float] = Form(None)):
+    """
+    Cambia en caliente el límite global de ancho de banda (MB/s), compartido
+    por todas las descargas en curso, y opcionalmente el de envío de archivos
+    a los clientes (/files). 0 = sin límite.
+    """
+    bandwidth_limiter.set_rate(int(max(global_rate_limit_mbps, 0) * 1024 * 1024))
+    if serve_rate_limit_mbps is not None:
+        serve_limiter.set_rate(int(max(serve_rate_limit_mbps, 0) * 1024 * 1024))
+    return {"bandwidth_limit": bandwidth_limiter.rate, "serve_limit": serve_limiter.rate}
+
+@router.get("/stats")
+async def get_stats():
+    """
+    Estadísticas internas: pool de extracción (hilos e instancias de YoutubeDL), caché de
+    metadatos y de fragmentos de la vista previa, planificador de descargas, regulador de
+    solicitudes por host, suscripciones, WebSockets, índice de descargas y espacio en disco.
+    """
+    return {
+        "extraction": extraction_executor.stats(),
+        "ydl_pool": extraction_ydl_pool.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "preview_fragments": fragment_cache.stats(),
+        "jobs": job_scheduler.stats(),
+        "governor": request_governor.stats(),
+        "subscriptions": subscription_poller.stats(),
+        "websockets": log_manager.stats(),
+        "store": download_store.stats(),
+        "disk": disk_space.stats(),
+    }
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 10.0, interval_ms: float = 5.0, limit: int = 50, include_idle: bool = False):
+    """
+    Perfilado por muestreo de todos los hilos durante `seconds` segundos.
+    Devuelve las pilas más frecuentes en formato "collapsed" (flamegraph.pl / speedscope).
+    Requiere PROFILER_ENABLED=true.
+    """
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Perfilador deshabilitado (PROFILER_ENABLED)")
+    seconds = min(max(seconds, 0.1), settings.PROFILER_MAX_SECONDS)
+    try:
+        return await asyncio.to_thread(
+            sampling_profiler.profile, seconds, max(interval_ms, 1.0) / 1000, limit, include_idle
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
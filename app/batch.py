@@ -0,0 +1,128 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .core.config import settings
+from .core.executor import extraction_executor
+from .core.log_manager import log_manager, make_event, LOG
+from .metadata import Entry
+from .services import YtDlpService
+
+# Reglas de formato para encolar un lote completo (reglas declarativas de app/formats.py).
+# Se resuelven cuando arranca cada trabajo, con los formatos reales del video.
+FORMAT_RULES: Dict[str, tuple] = {
+    "best": ("Mejor calidad disponible", "best"),
+    "1080": ("Mejor ≤1080p + mejor audio", "<=1080p"),
+    "compact": ("≤1440p, AV1/VP9, ≤2 GB, audio Opus", "prefer av1>vp9>avc, <=1440p, <=2GB, best opus"),
+    "720": ("Mejor ≤720p + mejor audio", "<=720p"),
+    "480": ("Mejor ≤480p + mejor audio", "<=480p"),
+    "audio": ("Solo audio (mejor calidad)", "audio only"),
+}
+DEFAULT_FORMAT_RULE = "1080"
+
+
+class BatchSession:
+    """
+    Un lote de URLs enumerado en segundo plano.
+
+    Las entradas se acumulan en `entries` a medida que llegan, de modo que un
+    cliente SSE que se (re)conecta puede reproducir lo ya recibido y seguir
+    esperando las nuevas.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.urls = urls
+        self.entries: List[Entry] = []
+        self.errors: List[str] = []
+        self.done = False
+        self._seen: set = set()
+        self._changed = asyncio.Event()
+        self._cancelled = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, service: YtDlpService):
+        self._task = asyncio.ensure_future(self._enumerate(service))
+
+    def cancel(self):
+        self._cancelled = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def wait_for_change(self):
+        """Espera hasta la próxima entrada nueva o el fin de la enumeración."""
+        await self._changed.wait()
+
+    def _notify(self):
+        # Un Event por "cambio": todos los clientes que esperaban lo ven
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _add(self, entry: Entry):
+        # Una misma entrada puede aparecer en varias URLs del lote
+        if entry.url in self._seen:
+            return
+        self._seen.add(entry.url)
+        self.entries.append(entry)
+        self._notify()
+
+    async def _enumerate(self, service: YtDlpService):
+        loop = asyncio.get_running_loop()
+
+        def produce(url: str):
+            # Corre en un hilo del pool de extracción; entrega cada entrada al loop
+            for entry in service.iter_entries(url, settings.BATCH_MAX_ENTRIES):
+                if self._cancelled:
+                    return
+                loop.call_soon_threadsafe(self._add, entry)
+
+        try:
+            for url in self.urls:
+                try:
+                    await extraction_executor.run(produce, url)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors.append(f"{url}: {e}")
+                    log_manager.publish(make_event(LOG, f"ERROR: [batch {self.id}] {url}: {e}", level="error", batch_id=self.id))
+        finally:
+            self.done = True
+            self._notify()
+
+
+class BatchRegistry:
+    """Lotes recientes en memoria (LRU), accesibles por id desde los endpoints."""
+
+    def __init__(self, service: YtDlpService, max_sessions: int):
+        self.service = service
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, BatchSession]" = OrderedDict()
+
+    def create(self, urls: List[str]) -> BatchSession:
+        session = BatchSession(urls)
+        self._sessions[session.id] = session
+        while len(self._sessions) > self.max_sessions:
+            _, old = self._sessions.popitem(last=False)
+            old.cancel()
+        session.start(self.service)
+        return session
+
+    def get(self, batch_id: str) -> Optional[BatchSession]:
+        session = self._sessions.get(batch_id)
+        if session is not None:
+            self._sessions.move_to_end(batch_id)
+        return session
+
+    async def shutdown(self):
+        """
+        Cancela las enumeraciones en curso y espera a que cierren: sus hilos de extracción
+        paran en la próxima entrada y los streams SSE reciben el fin del lote.
+        """
+        tasks = [session._task for session in self._sessions.values() if session._task is not None]
+        for session in self._sessions.values():
+            session.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+batch_registry = BatchRegistry(YtDlpService(), max_sessions=settings.BATCH_MAX_SESSIONS)
@@ -0,0 +1,156 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Marcas de tiempo aceptadas: '90', '90.5', '1:30', '1:02:03.250', '1h2m3s', '2m', '45s'
+_CLOCK_RE = re.compile(r"^(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)$")
+_UNITS_RE = re.compile(r"^(?:(\d+(?:\.\d+)?)h)?\s*(?:(\d+(?:\.\d+)?)m)?\s*(?:(\d+(?:\.\d+)?)s)?$")
+# Capítulos por número (1-based): '3' o '3-5'
+_CHAPTER_RANGE_RE = re.compile(r"^(\d+)(?:\s*-\s*(\d+))?$")
+
+
+def parse_timestamp(text: str) -> float:
+    """Segundos a partir de una marca de tiempo ('1:02:03', '90', '1h2m3s'). ValueError si no es válida."""
+    text = text.strip().lower()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    match = _CLOCK_RE.match(text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+    match = _UNITS_RE.match(text)
+    if text and match:
+        hours, minutes, seconds = (float(value or 0) for value in match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    raise ValueError(f"Marca de tiempo no válida: {text!r} (ej: 90, 1:30, 1:02:03, 1h2m3s)")
+
+
+def format_timestamp(seconds: float) -> str:
+    """90.5 -> '1:30.5', 3723 -> '1:02:03'."""
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    secs_text = f"{secs:06.3f}".rstrip("0").rstrip(".") if secs % 1 else f"{int(secs):02d}"
+    return f"{hours}:{minutes:02d}:{secs_text}" if hours else f"{minutes}:{secs_text}"
+
+
+def _compact(seconds: float) -> str:
+    """3723 -> '1h02m03s', 90 -> '1m30s', 45.5 -> '45.5s' (apto para nombres de archivo)."""
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    secs_text = f"{secs:g}"
+    if (hours or minutes) and secs < 10:
+        secs_text = "0" + secs_text
+    return (f"{hours}h{minutes:02d}m" if hours else f"{minutes}m" if minutes else "") + secs_text + "s"
+
+
+class ClipRange(NamedTuple):
+    """
+    Parte de un video a descargar en lugar del archivo completo: un tramo
+    start/end en segundos o un rango de capítulos. Se guarda en las opciones
+    del trabajo (`options["clip"]`) y se resuelve contra los capítulos y la
+    duración reales al extraer (ver `section`). yt-dlp descarga solo ese tramo
+    con FFmpeg (download_ranges); `keyframes` re-codifica los bordes para un
+    corte exacto en lugar de cortar en el keyframe anterior.
+    """
+    start: Optional[float] = None
+    end: Optional[float] = None
+    chapters: Optional[str] = None  # '3', '3-5' (números, desde 1) o expresión regular sobre el título
+    keyframes: bool = False
+
+    def to_options(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    @classmethod
+    def from_options(cls, options: Optional[Dict[str, Any]]) -> Optional["ClipRange"]:
+        clip = (options or {}).get("clip")
+        return cls(**clip) if clip else None
+
+    @property
+    def label(self) -> str:
+        """Descripción corta para la UI y los logs: '1:30-2:45', 'desde 10:00', 'cap. 3-5'."""
+        if self.chapters:
+            return f"cap. {self.chapters}"
+        if self.end is None:
+            return f"desde {format_timestamp(self.start or 0)}"
+        return f"{format_timestamp(self.start or 0)}-{format_timestamp(self.end)}"
+
+    @property
+    def file_label(self) -> str:
+        """Etiqueta para el nombre del archivo final ('clip 1m30s-2m45s'); distinta por tramo."""
+        if self.chapters:
+            return "cap " + (re.sub(r"[^\w-]+", "_", self.chapters).strip("_")[:40] or "regex")
+        start = _compact(self.start or 0)
+        return f"clip {start}-{_compact(self.end)}" if self.end is not None else f"clip {start}-fin"
+
+    def duration(self, total: Optional[float]) -> Optional[float]:
+        """Duración del tramo sin conocer los capítulos (None si depende de ellos o del total desconocido)."""
+        if self.chapters:
+            return None
+        end = self.end if self.end is not None else total
+        if end is None:
+            return None
+        if total:
+            end = min(end, total)
+        return max(end - (self.start or 0), 0.0)
+
+    def section(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sección de yt-dlp (start_time, end_time, title) para el video `info`.
+        Un rango de capítulos produce un único tramo continuo, del inicio del
+        primero al final del último. ValueError si no hay capítulos que coincidan.
+        """
+        duration = info.get("duration")
+        if not self.chapters:
+            end = self.end if self.end is not None else duration
+            if duration and end is not None:
+                end = min(end, duration)
+            if end is not None and end <= (self.start or 0):
+                raise ValueError(f"El tramo {self.label} empieza después del final del video")
+            return {"start_time": self.start or 0, "end_time": end if end is not None else float("inf")}
+
+        chapters: List[Dict[str, Any]] = info.get("chapters") or []
+        if not chapters:
+            raise ValueError("El video no tiene capítulos")
+        match = _CHAPTER_RANGE_RE.match(self.chapters.strip())
+        if match:
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            if not 1 <= first <= last <= len(chapters):
+                raise ValueError(f"Capítulos {self.chapters} fuera de rango (el video tiene {len(chapters)})")
+            selected = chapters[first - 1:last]
+        else:
+            pattern = re.compile(self.chapters, re.I)
+            selected = [chapter for chapter in chapters if pattern.search(chapter.get("title") or "")]
+            if not selected:
+                raise ValueError(f"Ningún capítulo coincide con {self.chapters!r}")
+        end = selected[-1].get("end_time")
+        return {
+            "start_time": selected[0].get("start_time") or 0,
+            "end_time": end if end is not None else (duration or float("inf")),
+            "title": selected[0].get("title") if len(selected) == 1 else self.label,
+        }
+
+
+def parse_clip(start: Optional[str] = None, end: Optional[str] = None, chapters: Optional[str] = None,
+               keyframes: bool = False) -> Optional[ClipRange]:
+    """ClipRange a partir de los campos del formulario, o None si están vacíos. ValueError si no son válidos."""
+    start_text, end_text, chapters = (start or "").strip(), (end or "").strip(), (chapters or "").strip()
+    if chapters:
+        if start_text or end_text:
+            raise ValueError("Elige un tramo (inicio/fin) o capítulos, no ambos")
+        if not _CHAPTER_RANGE_RE.match(chapters):
+            try:
+                re.compile(chapters)
+            except re.error as e:
+                raise ValueError(f"Expresión de capítulos no válida: {e}") from None
+        return ClipRange(chapters=chapters, keyframes=keyframes)
+    if not start_text and not end_text:
+        return None
+    start_seconds = parse_timestamp(start_text) if start_text else None
+    end_seconds = parse_timestamp(end_text) if end_text else None
+    if end_seconds is not None and end_seconds <= (start_seconds or 0):
+        raise ValueError("El fin del tramo debe ser posterior al inicio")
+    if not start_seconds and end_seconds is None:
+        return None  # Desde 0 hasta el final: el video completo
+    return ClipRange(start=start_seconds or None, end=end_seconds, keyframes=keyframes)
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete
+
+from .config import settings
+from .database import SessionLocal
+from .metrics import metrics
+from ..models import CachedVideoInfo
+from ..metadata import Video
+
+
+class _Flight:
+    """Extracción en curso para una clave, compartida por todos los que la esperan."""
+
+    def __init__(self, task: "asyncio.Task[Video]"):
+        self.task = task
+        self.waiters = 0
+
+
+class MetadataCache:
+    """
+    Caché de metadatos (app/metadata.py:Video) delante de YtDlpService.get_video_info.
+
+    - Memoria: LRU con TTL, acotada por número de entradas y por tamaño estimado
+      (longitud del JSON serializado).
+    - Disco (opcional): tabla SQLite en DATABASE_URL, sobrevive a reinicios.
+    - Coalescencia: si una clave ya se está extrayendo, las nuevas solicitudes
+      esperan esa misma extracción en lugar de lanzar otra.
+
+    Debe usarse desde el event loop (no es thread-safe); el acceso a disco se
+    delega a hilos con asyncio.to_thread.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, disk_enabled: bool):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_enabled = disk_enabled
+
+        # key -> (info, tamaño estimado, expira_en)
+        self._entries: "OrderedDict[str, Tuple[Video, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._in_flight: Dict[str, _Flight] = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Video]]) -> Video:
+        """
+        Devuelve el Video de `key`, llamando a `loader()` solo si no está en
+        memoria, ni en disco, ni siendo extraído por otra solicitud.
+
+        Si todos los que esperan una extracción se van (cancelación), la
+        extracción compartida también se cancela.
+        """
+        info = self._memory_get(key)
+        if info is not None:
+            self.hits += 1
+            return info
+
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._load(key, loader)))
+            # Evita el aviso "exception was never retrieved" si todos se fueron
+            flight.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = flight
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                # Fuera ya: una nueva solicitud de la clave no debe unirse a la extracción cancelada
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+
+    def peek(self, key: str) -> Optional[Video]:
+        """Video en memoria si está vigente, sin extraer ni contar como acierto."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None and entry[2] > time.time() else None
+
+    def invalidate(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Video]]) -> Video:
+        try:
+            if self.disk_enabled:
+                stored = await asyncio.to_thread(self._disk_get, key)
+                if stored is not None:
+                    self.disk_hits += 1
+                    info, size, expires_at = stored
+                    self._memory_put(key, info, size, expires_at)
+                    return info
+
+            self.misses += 1
+            info = await loader()
+            data = info.to_json()
+            expires_at = time.time() + self.ttl
+            self._memory_put(key, info, len(data), expires_at)
+            if self.disk_enabled:
+                await asyncio.to_thread(self._disk_put, key, data, expires_at)
+            return info
+        finally:
+            # Solo si sigue siendo la extracción registrada (si se canceló, puede haber otra nueva)
+            flight = self._in_flight.get(key)
+            if flight is not None and flight.task is asyncio.current_task():
+                del self._in_flight[key]
+
+    # --- Memoria -----------------------------------------------------------
+
+    def _memory_get(self, key: str) -> Optional[Video]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        info, size, expires_at = entry
+        if expires_at <= time.time():
+            self.invalidate(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return info
+
+    def _memory_put(self, key: str, info: Video, size: int, expires_at: float) -> None:
+        self.invalidate(key)
+        self._entries[key] = (info, size, expires_at)
+        self._bytes += size
+        # Expulsar las menos usadas recientemente (nunca la recién insertada)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    # --- Disco (se ejecuta en hilos) ---------------------------------------
+
+    def _disk_get(self, key: str) -> Optional[Tuple[Video, int, float]]:
+        with SessionLocal() as db:
+            row = db.get(CachedVideoInfo, key)
+            if row is None:
+                return None
+            if row.expires_at <= time.time():
+                db.delete(row)
+                db.commit()
+                return None
+            return Video.from_json(row.data), len(row.data), row.expires_at
+
+    def _disk_put(self, key: str, data: str, expires_at: float) -> None:
+        with SessionLocal() as db:
+            db.execute(delete(CachedVideoInfo).where(CachedVideoInfo.expires_at <= time.time()))
+            db.merge(CachedVideoInfo(key=key, data=data, expires_at=expires_at))
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+metadata_cache = MetadataCache(
+    ttl=settings.CACHE_TTL,
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    max_bytes=settings.CACHE_MAX_BYTES,
+    disk_enabled=settings.CACHE_DISK_ENABLED,
+)
+metrics.counter("metadata_cache_lookups_total", "Consultas a la caché de metadatos por resultado", ["result"]).set_function(
+    lambda: {"hit": metadata_cache.hits, "disk_hit": metadata_cache.disk_hits,
+             "miss": metadata_cache.misses, "coalesced": metadata_cache.coalesced}
+)
+metrics.gauge("metadata_cache_entries", "Entradas en la caché de metadatos en memoria").set_function(
+    lambda: len(metadata_cache._entries)
+)
@@ -18,6 +18,95 @@ class Settings(BaseSettings):
     # URL de conexión a la base de datos (SQLite asíncrono por defecto)
     DATABASE_URL: str = "sqlite+aiosqlite:///./sql_app.db"
 
+    # Pool de extracción de metadatos (/preview). yt-dlp es bloqueante, así que
+    # se ejecuta en hilos aparte para no congelar el event loop.
+    EXTRACT_WORKERS: int = 4          # Extracciones simultáneas
+    EXTRACT_MAX_PENDING: int = 16     # Solicitudes en espera antes de responder 503
+    EXTRACT_TIMEOUT: float = 60.0     # Segundos máximos por solicitud (cola + extracción)
+    YDL_POOL_ENABLED: bool = True     # Reutilizar una instancia de YoutubeDL por hilo de extracción
+    YDL_POOL_MAX_USES: int = 200      # Usos antes de reciclar la instancia
+    YDL_POOL_MAX_AGE: float = 600.0   # Segundos antes de reciclar la instancia
+
+    # Caché de metadatos (app/metadata.py:Video) por video
+    CACHE_TTL: float = 3600.0                 # Segundos de validez de una entrada
+    CACHE_MAX_ENTRIES: int = 256              # Límite LRU en memoria (entradas)
+    CACHE_MAX_BYTES: int = 32 * 1024 * 1024   # Límite LRU en memoria (tamaño estimado)
+    CACHE_DISK_ENABLED: bool = True           # Nivel persistente en la base de datos SQLite
+    FRAGMENT_CACHE_MAX_ENTRIES: int = 512     # HTML renderizado de la vista previa (fragmentos)
+
+    # Planificador de descargas (cola persistente en la base de datos)
+    MAX_CONCURRENT_DOWNLOADS: int = 3   # Descargas simultáneas en total
+    MAX_DOWNLOADS_PER_HOST: int = 2     # Descargas simultáneas contra un mismo sitio
+    POSTPROCESS_WORKERS: int = os.cpu_count() or 2  # Merge/FFmpeg simultáneos (etapa de CPU, aparte de la red)
+
+    # Workers de descarga externos (worker.py): otros procesos o equipos piden trabajos
+    # a este proceso, que hace de cola (leases renovados en cada sondeo) y de front end
+    LOCAL_DOWNLOADS: bool = True          # False = este proceso no descarga, solo reparte trabajos a los workers
+    WORKER_TOKEN: str = ""                # Si no está vacío, los workers deben enviarlo (Authorization: Bearer ...)
+    WORKER_LEASE_SECONDS: float = 60.0    # Un trabajo cedido que no se renueva en este tiempo vuelve a la cola
+    WORKER_POLL_INTERVAL: float = 1.0     # Segundos entre sondeos de un worker (latido, eventos y trabajos nuevos)
+
+    # Perfil de rendimiento de descarga (valores por defecto del formulario /download)
+    DOWNLOAD_CONCURRENT_FRAGMENTS: int = 4           # Fragmentos DASH/HLS descargados en paralelo
+    DOWNLOAD_CHUNK_SIZE: int = 10 * 1024 * 1024      # Tamaño de chunk HTTP en bytes (0 = sin chunks)
+    DOWNLOAD_RETRIES: int = 10                       # Reintentos por archivo y por fragmento
+    DOWNLOAD_RETRY_BACKOFF: float = 1.0              # Espera base (s) del backoff exponencial
+    DOWNLOAD_RETRY_BACKOFF_MAX: float = 30.0         # Espera máxima (s) entre reintentos
+    DOWNLOAD_RESUME: bool = True                     # Continuar desde el .part si existe
+    DOWNLOAD_RATE_LIMIT: int = 0                     # Límite global en bytes/s, compartido (0 = sin límite)
+
+    # Regulador de solicitudes por host (ver app/core/governor.py), compartido por extracción y descargas
+    GOVERNOR_HOST_RATE: float = 2.0          # Solicitudes por segundo a un mismo host (0 = sin límite)
+    GOVERNOR_HOST_BURST: float = 5.0         # Ráfaga máxima de solicitudes sin esperar
+    GOVERNOR_BACKOFF: float = 5.0            # Espera base (s) tras un 429; crece exponencialmente con jitter
+    GOVERNOR_BACKOFF_MAX: float = 300.0      # Espera máxima (s) de un host penalizado
+    THROTTLE_MIN_SPEED: int = 0              # Bytes/s por debajo de los que la descarga se considera estrangulada (0 = no detectar)
+    THROTTLE_WINDOW: float = 15.0            # Segundos seguidos por debajo del umbral antes de reconectar
+    THROTTLE_RETRIES: int = 3                # Reconexiones por descarga estrangulada (URLs nuevas, sigue desde el .part)
+    JOB_MAX_RETRIES: int = 3                 # Reencolados automáticos de un trabajo fallido por causa transitoria
+    JOB_RETRY_BACKOFF: float = 30.0          # Espera base (s) antes de reencolar; crece exponencialmente con jitter
+    JOB_RETRY_BACKOFF_MAX: float = 1800.0    # Espera máxima (s) antes de reencolar
+
+    # Modo audio (formato "Solo audio": extracción y perfiles de conversión, ver AUDIO_PROFILES en app/services.py)
+    AUDIO_DEFAULT_PROFILE: str = "original"          # Perfil preseleccionado en el formulario
+    AUDIO_LOUDNORM: str = "I=-16:TP=-1.5:LRA=11"     # Objetivo de normalización (filtro loudnorm de FFmpeg, EBU R128)
+
+    # Almacenamiento (ver app/core/diskspace.py y DownloadStore.evict)
+    OUTPUT_LAYOUT: str = "flat"                    # flat | uploader_date | id_hash | plantilla de yt-dlp propia
+    DISK_RESERVE_MARGIN: int = 256 * 1024 * 1024   # Espacio libre que las descargas nunca ocupan
+    STORAGE_MAX_BYTES: int = 0                     # Tope de archivos indexados + reservas (0 = sin tope)
+    STORAGE_EVICT: bool = False                    # Borrar los archivos menos usados (LRU) para hacer sitio
+    STORAGE_RETENTION_DAYS: float = 0.0            # Borrar archivos sin usar en N días (0 = nunca)
+    STORAGE_RETENTION_INTERVAL: float = 3600.0     # Segundos entre pasadas de retención
+
+    # Envío de archivos descargados a los clientes (/files/{id})
+    SERVE_RATE_LIMIT: int = 0       # Límite global en bytes/s, compartido por todas las conexiones (0 = sin límite)
+    SERVE_MAX_STREAMS: int = 8      # Envíos simultáneos antes de responder 503 (0 = sin límite)
+    SERVE_CHUNK_SIZE: int = 256 * 1024
+
+    # Difusión de logs por WebSocket
+    WS_QUEUE_SIZE: int = 256        # Mensajes pendientes por cliente antes de expulsarlo
+    WS_SEND_TIMEOUT: float = 5.0    # Segundos máximos por envío antes de considerar el socket muerto
+    WS_PROGRESS_RATE: float = 4.0   # Actualizaciones de progreso por segundo y por descarga
+
+    # Ingesta por lotes (/batch)
+    BATCH_MAX_ENTRIES: int = 1000   # Máximo de entradas enumeradas por URL de playlist/canal
+    BATCH_MAX_SESSIONS: int = 20    # Lotes recientes conservados en memoria
+
+    # Suscripciones (canales/playlists vigilados, ver app/subscriptions.py)
+    SUBSCRIPTIONS_ENABLED: bool = True
+    SUBSCRIPTION_INTERVAL: float = 3600.0       # Segundos entre sondeos por defecto
+    SUBSCRIPTION_MIN_INTERVAL: float = 300.0    # Intervalo mínimo aceptado
+    SUBSCRIPTION_MAX_POLLS: int = 2             # Sondeos simultáneos (deja hilos de extracción para /preview)
+    SUBSCRIPTION_SCAN_LIMIT: int = 50           # Entradas más recientes revisadas en cada sondeo
+    SUBSCRIPTION_SEEN_MAX: int = 500            # Ids recordados por suscripción
+    SUBSCRIPTION_JITTER: float = 0.1            # Variación aleatoria del intervalo (±10%)
+    SUBSCRIPTION_BACKOFF_MAX: float = 24 * 3600.0  # Espera máxima tras errores seguidos
+
+    # Diagnóstico
+    PROFILER_ENABLED: bool = False      # Habilita /api/v1/debug/profile (perfilador por muestreo)
+    PROFILER_MAX_SECONDS: float = 60.0  # Ventana máxima de un perfilado
+
     class Config:
         """Configuración interna de Pydantic."""
         case_sensitive = True
@@ -33,6 +122,7 @@ def get_settings():
 
 settings = get_settings()
 
-# Verificación inicial: Crear directorio de descargas si no existe
-if not os.path.exists(settings.DOWNLOAD_DIR):
-    os.makedirs(settings.DOWNLOAD_DIR)
+
+def ensure_download_dir():
+    """Crea el directorio de descargas si no existe (al arrancar, no al importar la configuración)."""
+    os.makedirs(settings.DOWNLOAD_DIR, exist_ok=True)
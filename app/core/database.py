@@ -0,0 +1,63 @@
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
+
+from .config import settings
+
+
+def sync_database_url(url: str) -> str:
+    """
+    Convierte la URL asíncrona configurada (sqlite+aiosqlite) en su equivalente síncrono.
+    Todo el acceso a la base de datos ocurre desde hilos de trabajo (yt-dlp es síncrono),
+    así que usamos el driver síncrono de SQLite sobre el mismo archivo.
+    """
+    return url.replace("+aiosqlite", "")
+
+
+engine = create_engine(
+    sync_database_url(settings.DATABASE_URL),
+    connect_args={"check_same_thread": False},
+)
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL permite lecturas concurrentes mientras otro hilo escribe
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+
+class Base(DeclarativeBase):
+    """Base declarativa de los modelos SQLAlchemy (ver app/models.py)."""
+
+
+def init_db():
+    """Crea las tablas que falten. Se llama una vez al arrancar la aplicación."""
+    from .. import models  # noqa: F401  (registra los modelos en Base.metadata)
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
+def _add_missing_columns():
+    """
+    Migración mínima: create_all no modifica tablas existentes, así que las
+    columnas nuevas de los modelos se añaden con ALTER TABLE (deben ser nullable
+    o tener server_default), junto con sus índices.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                default = f" DEFAULT '{column.server_default.arg}'" if column.server_default is not None else ""
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}{default}'))
+            # Los índices de columnas añadidas tampoco los crea create_all
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -0,0 +1,170 @@
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from .config import settings
+from .metrics import metrics
+
+DISK_ADMISSIONS = metrics.counter(
+    "disk_admissions_total", "Intentos de reserva de espacio en disco por resultado", ["result"])
+
+
+class InsufficientSpace(Exception):
+    """
+    La descarga no cabe en DOWNLOAD_DIR. Si `needed` supera la capacidad total no
+    cabrá nunca (se rechaza); si no, el trabajo espera a que se libere espacio.
+    """
+
+    def __init__(self, needed: int, available: int, capacity: int):
+        self.needed = needed
+        self.available = available
+        self.capacity = capacity
+        mb = 1024 * 1024
+        if self.fits_ever:
+            message = f"Sin espacio en disco: se necesitan {needed / mb:.1f} MB, hay {max(available, 0) / mb:.1f} MB disponibles"
+        else:
+            message = f"La descarga ({needed / mb:.1f} MB) supera la capacidad de almacenamiento ({capacity / mb:.1f} MB)"
+        super().__init__(message)
+
+    @property
+    def fits_ever(self) -> bool:
+        return self.needed <= self.capacity
+
+
+class Reservation(NamedTuple):
+    size: int                   # Espacio máximo que ocupará la descarga (ver YtDlpService.space_needed)
+    written: Callable[[], int]  # Bytes ya escritos: dejan de contar como pendientes del espacio libre
+
+
+class DiskSpace:
+    """
+    Control de admisión por espacio en disco para DOWNLOAD_DIR.
+
+    Cada descarga reserva su tamaño estimado antes de escribir nada. Disponible es:
+      - el espacio libre del volumen, menos `margin`, menos lo que aún les falta
+        por escribir a las reservas vigentes (lo escrito ya lo descuenta el sistema);
+      - con `max_bytes`, además, el tope menos lo indexado (`used`) y las reservas completas.
+
+    Si una reserva no cabe, `evict(bytes)` (retención LRU del índice, la registra
+    app/store.py) puede liberar espacio antes de rendirse.
+
+    Thread-safe: se reserva desde los hilos de descarga y se consulta desde el
+    event loop (solo `reserve(..., evict=True)` puede bloquear, al expulsar archivos).
+    """
+
+    def __init__(self, directory: str, margin: int, max_bytes: int = 0):
+        self.directory = directory
+        self.margin = margin
+        self.max_bytes = max_bytes
+        # Los registra app/store.py: bytes indexados y expulsión LRU (None = desactivada)
+        self.used: Callable[[], int] = lambda: 0
+        self.evict: Optional[Callable[[int], int]] = None
+
+        self._lock = threading.Lock()
+        self._reservations: Dict[int, Reservation] = {}
+        self.admitted = 0
+        self.refused = 0
+        self.evicted_bytes = 0
+
+    def usage(self):
+        # DOWNLOAD_DIR puede no existir aún: se mide el volumen del primer ancestro existente
+        path = self.directory
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path)
+
+    def capacity(self) -> int:
+        """Lo máximo que podría ocupar una descarga con todo lo demás vacío."""
+        capacity = self.usage().total - self.margin
+        return min(capacity, self.max_bytes) if self.max_bytes else capacity
+
+    def available(self, exclude: Optional[int] = None) -> int:
+        """Bytes que se pueden reservar ahora (sin expulsar nada); `exclude` ignora la reserva de ese trabajo."""
+        with self._lock:
+            return self._available_locked(exclude)
+
+    def evictable(self) -> int:
+        """Bytes que la expulsión LRU podría liberar (todo lo indexado, si está activada)."""
+        return self.used() if self.evict is not None else 0
+
+    def fits(self, size: int, exclude: Optional[int] = None) -> bool:
+        """True si `size` cabe ahora o tras expulsar archivos del índice (no reserva ni expulsa)."""
+        return size <= self.available(exclude) + self.evictable()
+
+    def reserve(self, job_id: int, size: int, written: Callable[[], int] = lambda: 0, evict: bool = True,
+                count_held: bool = True) -> bool:
+        """
+        Reserva (o actualiza la reserva de) `size` bytes para `job_id`. Si no cabe
+        y `evict`, expulsa lo necesario del índice y lo vuelve a intentar.
+        Lanza InsufficientSpace si `size` supera la capacidad; False si ahora no cabe
+        (sin `count_held` no se cuenta: quien reintenta llama a held() una vez por espera).
+        """
+        capacity = self.capacity()
+        if size > capacity:
+            self.refused += 1
+            DISK_ADMISSIONS.inc(result="rejected")
+            raise InsufficientSpace(size, self.available(job_id), capacity)
+        for attempt in range(2):
+            with self._lock:
+                # Comprobar y reservar sin soltar el lock: dos hilos no reservan el mismo hueco
+                shortfall = size - self._available_locked(job_id)
+                if shortfall <= 0:
+                    self._reservations[job_id] = Reservation(size, written)
+                    self.admitted += 1
+                    DISK_ADMISSIONS.inc(result="admitted")
+                    return True
+            if attempt or not evict or self.evict is None:
+                break
+            # Fuera del lock: expulsar es E/S (borrar archivos, base de datos)
+            self.evicted_bytes += self.evict(shortfall)
+        if count_held:
+            self.held()
+        return False
+
+    def held(self):
+        """Cuenta una descarga que se queda esperando espacio."""
+        self.refused += 1
+        DISK_ADMISSIONS.inc(result="held")
+
+    def _available_locked(self, exclude: Optional[int]) -> int:
+        others = [r for job_id, r in self._reservations.items() if job_id != exclude]
+        available = self.usage().free - self.margin - sum(max(r.size - r.written(), 0) for r in others)
+        if self.max_bytes:
+            available = min(available, self.max_bytes - self.used() - sum(r.size for r in others))
+        return available
+
+    def release(self, job_id: int):
+        with self._lock:
+            self._reservations.pop(job_id, None)
+
+    def reserved(self) -> int:
+        with self._lock:
+            return sum(r.size for r in self._reservations.values())
+
+    def stats(self) -> Dict[str, Any]:
+        usage = self.usage()
+        with self._lock:
+            reservations = len(self._reservations)
+        return {
+            "directory": self.directory,
+            "total": usage.total,
+            "free": usage.free,
+            "margin": self.margin,
+            "max_bytes": self.max_bytes,
+            "used": self.used(),
+            "reserved": self.reserved(),
+            "reservations": reservations,
+            "available": self.available(),
+            "admitted": self.admitted,
+            "refused": self.refused,
+            "evict_enabled": self.evict is not None,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+disk_space = DiskSpace(settings.DOWNLOAD_DIR, settings.DISK_RESERVE_MARGIN, settings.STORAGE_MAX_BYTES)
+metrics.gauge("disk_free_bytes", "Espacio libre en el volumen de DOWNLOAD_DIR").set_function(
+    lambda: disk_space.usage().free
+)
+metrics.gauge("disk_reserved_bytes", "Espacio reservado por descargas en curso").set_function(disk_space.reserved)
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import settings
+from .metrics import metrics
+
+
+class ExecutorSaturated(Exception):
+    """La cola del pool está llena; el cliente debe reintentar más tarde (backpressure)."""
+
+
+class ClientDisconnected(Exception):
+    """El cliente HTTP cerró la conexión antes de recibir el resultado."""
+
+
+async def _watch(disconnected: Callable[[], Awaitable[bool]], interval: float) -> None:
+    while not await disconnected():
+        await asyncio.sleep(interval)
+
+
+async def cancel_on_disconnect(
+    aw: Awaitable[Any],
+    disconnected: Callable[[], Awaitable[bool]],
+    interval: float = 0.5,
+) -> Any:
+    """
+    Espera `aw` consultando `disconnected()` cada `interval` segundos.
+    Si el cliente se desconecta, cancela `aw` y lanza ClientDisconnected.
+    """
+    task = asyncio.ensure_future(aw)
+    watcher = asyncio.ensure_future(_watch(disconnected, interval))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
+class BoundedExecutor:
+    """
+    Pool de hilos de tamaño fijo con cola acotada.
+
+    yt-dlp es completamente síncrono: ejecutarlo dentro de un endpoint `async def`
+    bloquea el event loop (y con él el resto de peticiones y los WebSockets).
+    Este pool ejecuta ese trabajo fuera del loop, limita cuántas tareas pueden
+    esperar turno y lleva contadores de profundidad de cola para observabilidad.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        # Contadores (protegidos por _lock)
+        self.in_flight = 0  # Encoladas + en ejecución
+        self.active = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    @property
+    def queued(self) -> int:
+        return max(self.in_flight - self.active, 0)
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: Optional[float] = None,
+        disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> Any:
+        """
+        Ejecuta `fn(*args)` en el pool y espera su resultado sin bloquear el loop.
+
+        Args:
+            timeout: Segundos máximos de espera (cola + ejecución).
+            disconnected: Corrutina opcional (ej: `request.is_disconnected`) que se
+                consulta periódicamente para abandonar la espera si el cliente se fue.
+
+        Raises:
+            ExecutorSaturated: Si la cola está llena.
+            TimeoutError: Si se supera `timeout`.
+            ClientDisconnected: Si `disconnected()` devuelve True.
+
+        Nota: una tarea que ya está corriendo no puede interrumpirse (yt-dlp no lo
+        permite); solo se cancela si aún estaba en cola. En ese caso el hilo queda
+        ocupado hasta terminar y los contadores lo reflejan.
+        """
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise ExecutorSaturated(
+                    f"Demasiadas solicitudes en curso ({self.in_flight}). Intenta de nuevo en unos segundos."
+                )
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        try:
+            cfuture = self._pool.submit(self._call, fn, args)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        cfuture.add_done_callback(self._release)
+        waiter = asyncio.wrap_future(cfuture)
+
+        try:
+            if disconnected is not None:
+                return await cancel_on_disconnect(asyncio.wait_for(waiter, timeout), disconnected)
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"La operación superó el límite de {timeout:.0f}s")
+        finally:
+            if not waiter.done():
+                # Desconexión del cliente o cancelación externa (ej: apagado del servidor)
+                waiter.cancel()
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        with self._lock:
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _release(self, cfuture) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if cfuture.cancelled():
+                # Solo ocurre si la tarea seguía en cola cuando se abandonó la espera
+                self.cancelled += 1
+                return
+            if cfuture.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Instantánea de los contadores, para el endpoint de estadísticas."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "active": self.active,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+extraction_executor = BoundedExecutor(
+    "extract",
+    max_workers=settings.EXTRACT_WORKERS,
+    max_pending=settings.EXTRACT_MAX_PENDING,
+)
+metrics.gauge("extraction_pool", "Extracciones en curso y en espera", ["state"]).set_function(
+    lambda: {"active": extraction_executor.active, "queued": extraction_executor.queued}
+)
+metrics.counter("extraction_requests_total", "Solicitudes al pool de extracción por resultado", ["outcome"]).set_function(
+    lambda: {key: value for key, value in extraction_executor.stats().items()
+             if key in ("completed", "failed", "rejected", "timeouts", "cancelled")}
+)
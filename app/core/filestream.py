@@ -0,0 +1,259 @@
+import asyncio
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .config import settings
+from .metrics import metrics
+from .throttle import BandwidthLimiter
+
+FILES_BYTES_SENT = metrics.counter("files_bytes_sent_total", "Bytes enviados por /files", ["mode"])
+FILES_RESPONSES = metrics.counter("files_responses_total", "Respuestas de /files por código de estado", ["status"])
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Estados que devuelve la fuente de follow_file
+GROWING = "growing"     # El escritor sigue añadiendo bytes
+COMPLETE = "complete"   # El archivo ya no cambiará
+FAILED = "failed"       # El escritor falló: el cliente no debe recibir un archivo truncado como si fuera completo
+
+
+class RangeNotSatisfiable(Exception):
+    """El rango pedido empieza después del final del archivo (416)."""
+
+
+class StreamSlots:
+    """Cupo de envíos simultáneos (0 = sin límite). Solo se usa desde el event loop."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def acquire(self) -> bool:
+        if self.limit and self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active = max(self.active - 1, 0)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (inicio, fin exclusivo) de una cabecera Range con un solo rango. None = archivo
+    completo: sin cabecera, o una que se ignora (varios rangos, sintaxis inválida),
+    como permite el RFC 9110. Lanza RangeNotSatisfiable si empieza fuera del archivo.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last) + 1, size) if last else size
+    else:
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        start, end = max(size - suffix, 0), size
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def content_disposition(filename: str, attachment: bool = True) -> str:
+    """Cabecera Content-Disposition con nombre ASCII de respaldo y el nombre real en UTF-8 (RFC 6266)."""
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "'").replace("?", "_")
+    kind = "attachment" if attachment else "inline"
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _read_at(path: str, offset: int, size: int) -> bytes:
+    # Se abre en cada lectura: el escritor puede renombrar el archivo (también en Windows)
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    except FileNotFoundError:
+        return b""
+
+
+class FileStreamResponse(Response):
+    """
+    Envía un archivo del disco con soporte de Range (206/416), ETag y
+    Last-Modified (304 con If-None-Match / If-Modified-Since, If-Range) y HEAD.
+
+    Sin rango ni límite de ancho de banda usa la extensión ASGI
+    `http.response.pathsend` si el servidor la ofrece (envío sin copias con
+    sendfile); si no, lee por bloques en un hilo y respeta `limiter`.
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, etag: str, media_type: str,
+                 filename: Optional[str] = None, attachment: bool = True,
+                 limiter: Optional[BandwidthLimiter] = None, chunk_size: int = 256 * 1024,
+                 slots: Optional[StreamSlots] = None):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.stat_result = stat_result
+        self.etag = etag
+        self.limiter = limiter
+        self.chunk_size = chunk_size
+        self.slots = slots
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = self.last_modified
+        self.headers["cache-control"] = "no-cache"  # Puede cambiar (nueva descarga): revalidar siempre
+        if filename:
+            self.headers["content-disposition"] = content_disposition(filename, attachment)
+
+    def _not_modified(self, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._respond(scope, send)
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+    async def _respond(self, scope: Scope, send: Send):
+        request_headers = Headers(scope=scope)
+        size = self.stat_result.st_size
+        head = scope["method"] == "HEAD"
+
+        if self._not_modified(request_headers):
+            await self._send_headers(send, 304, drop=("content-type", "content-disposition"))
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        byte_range = None
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range in (self.etag, self.last_modified):
+            try:
+                byte_range = parse_range(request_headers.get("range"), size)
+            except RangeNotSatisfiable:
+                self.headers["content-range"] = f"bytes */{size}"
+                await self._send_headers(send, 416, drop=("content-disposition",), length=0)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        start, end = byte_range or (0, size)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+        status = 206 if byte_range is not None else 200
+        await self._send_headers(send, status, length=end - start)
+        if head:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        if byte_range is None and pathsend and not (self.limiter and self.limiter.rate):
+            await send({"type": "http.response.pathsend", "path": self.path})
+            FILES_BYTES_SENT.inc(size, mode="file")
+            return
+
+        with open(self.path, "rb") as f:
+            offset = start
+            while offset < end:
+                chunk = await asyncio.to_thread(self._read, f, offset, min(self.chunk_size, end - offset))
+                if not chunk:
+                    break  # El archivo se acortó mientras se enviaba
+                offset += len(chunk)
+                if self.limiter is not None:
+                    await self.limiter.consume_async(len(chunk))
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset < end})
+                FILES_BYTES_SENT.inc(len(chunk), mode="file")
+        if offset < end:
+            # Truncado: cerrar sin completar el cuerpo para que el cliente lo note
+            raise RuntimeError(f"{self.path} cambió de tamaño durante el envío")
+
+    @staticmethod
+    def _read(f, offset: int, size: int) -> bytes:
+        f.seek(offset)
+        return f.read(size)
+
+    async def _send_headers(self, send: Send, status: int, drop: Tuple[str, ...] = (), length: Optional[int] = None):
+        FILES_RESPONSES.inc(status=str(status))
+        for name in drop:
+            if name in self.headers:
+                del self.headers[name]
+        if length is not None:
+            self.headers["content-length"] = str(length)
+        elif "content-length" in self.headers:
+            del self.headers["content-length"]
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+
+
+async def follow_file(source: Callable[[], Tuple[Optional[str], str]], limiter: Optional[BandwidthLimiter] = None,
+                      chunk_size: int = 256 * 1024, poll_interval: float = 0.25) -> AsyncIterator[bytes]:
+    """
+    Produce los bytes de un archivo que todavía se está escribiendo, desde el
+    principio y a medida que crece (como `tail -f`). `source()` devuelve la ruta
+    actual (puede cambiar, p. ej. '.part' -> final) y GROWING | COMPLETE | FAILED.
+    Termina al alcanzar el final con COMPLETE; con FAILED lanza RuntimeError para
+    cortar la conexión en lugar de entregar un archivo truncado como completo.
+    """
+    offset = 0
+    while True:
+        path, state = source()
+        if state == FAILED:
+            raise RuntimeError("La descarga que se estaba siguiendo falló")
+        chunk = await asyncio.to_thread(_read_at, path, offset, chunk_size) if path else b""
+        if chunk:
+            offset += len(chunk)
+            if limiter is not None:
+                await limiter.consume_async(len(chunk))
+            FILES_BYTES_SENT.inc(len(chunk), mode="tee")
+            yield chunk
+        elif state == COMPLETE:
+            return
+        else:
+            await asyncio.sleep(poll_interval)
+
+
+class FollowFileResponse(StreamingResponse):
+    """Respuesta del modo "tee": cuerpo por chunks desde follow_file, sin Content-Length ni Range."""
+
+    def __init__(self, source: Callable[[], Tuple[Optional[str], str]], media_type: str,
+                 filename: Optional[str] = None, attachment: bool = True,
+                 limiter: Optional[BandwidthLimiter] = None, chunk_size: int = 256 * 1024,
+                 slots: Optional[StreamSlots] = None):
+        headers = {"cache-control": "no-store"}
+        if filename:
+            headers["content-disposition"] = content_disposition(filename, attachment)
+        super().__init__(follow_file(source, limiter, chunk_size), media_type=media_type, headers=headers)
+        self.slots = slots
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        FILES_RESPONSES.inc(status="200")
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+
+file_stream_slots = StreamSlots(settings.SERVE_MAX_STREAMS)
+metrics.gauge("files_active_streams", "Envíos de /files en curso").set_function(lambda: file_stream_slots.active)
@@ -0,0 +1,70 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from starlette.datastructures import Headers
+
+from .config import settings
+from .metrics import metrics
+
+
+class Fragment(NamedTuple):
+    html: str
+    etag: str
+
+
+class FragmentCache:
+    """
+    HTML ya renderizado de los fragmentos de la vista previa, por (clave del video,
+    nombre del fragmento). Una entrada es válida mientras `source` (el Video
+    de la caché de metadatos) sea el mismo objeto: si la caché de metadatos lo
+    renueva, el fragmento se vuelve a renderizar.
+
+    El ETag es un hash del HTML, así que se mantiene entre renderizados
+    idénticos (reinicios, recargas desde disco) y el navegador recibe 304.
+
+    Debe usarse desde el event loop (no es thread-safe).
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        # (clave, fragmento) -> (source, Fragment)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, Fragment]]" = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+        self.not_modified_count = 0
+
+    def get_or_render(self, key: str, name: str, source: Any, render: Callable[[], str]) -> Fragment:
+        entry = self._entries.get((key, name))
+        if entry is not None and entry[0] is source:
+            self._entries.move_to_end((key, name))
+            self.hits += 1
+            return entry[1]
+        html = render()
+        fragment = Fragment(html, '"' + hashlib.blake2b(html.encode(), digest_size=16).hexdigest() + '"')
+        self._entries[(key, name)] = (source, fragment)
+        self._entries.move_to_end((key, name))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.renders += 1
+        return fragment
+
+    def not_modified(self, request_headers: Headers, fragment: Fragment) -> bool:
+        """True si el navegador ya tiene este fragmento (If-None-Match): se responde 304."""
+        if_none_match: Optional[str] = request_headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        if any(tag.strip().removeprefix("W/") in (fragment.etag, "*") for tag in if_none_match.split(",")):
+            self.not_modified_count += 1
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "renders": self.renders,
+                "not_modified": self.not_modified_count}
+
+
+fragment_cache = FragmentCache(settings.FRAGMENT_CACHE_MAX_ENTRIES)
+metrics.counter("preview_fragments_total", "Fragmentos de vista previa servidos por resultado", ["result"]).set_function(
+    lambda: {"hit": fragment_cache.hits, "render": fragment_cache.renders, "not_modified": fragment_cache.not_modified_count}
+)
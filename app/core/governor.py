@@ -0,0 +1,255 @@
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from .config import settings
+from .metrics import metrics
+
+GOVERNOR_REQUESTS = metrics.counter(
+    "governor_requests_total", "Solicitudes a cada host (extracción y descarga) por resultado", ["host", "outcome"])
+GOVERNOR_WAIT_SECONDS = metrics.histogram(
+    "governor_wait_seconds", "Espera por el token bucket o el backoff del host antes de cada solicitud")
+
+# Motivo clasificado de un fallo (DownloadJob.error_reason)
+RATE_LIMITED = "rate_limited"   # HTTP 429 / "Too Many Requests"
+THROTTLED = "throttled"         # Velocidad de transferencia anormalmente baja (ver ThrottleDetector)
+FORBIDDEN = "forbidden"         # HTTP 403: URL firmada caducada, bloqueo temporal
+NETWORK = "network"             # Timeouts, conexiones cortadas, errores 5xx
+UNAVAILABLE = "unavailable"     # Video privado, eliminado, geobloqueado, requiere cuenta
+UNSUPPORTED = "unsupported"     # URL no soportada / ningún formato disponible
+POSTPROCESS = "postprocess"     # FFmpeg y demás post-procesadores
+OTHER = "other"
+
+# Fallos que suelen resolverse solos: el trabajo vuelve a la cola con backoff
+RETRYABLE = (RATE_LIMITED, THROTTLED, FORBIDDEN, NETWORK)
+
+# Resultado de una solicitud que salió bien (el resto se registran con su motivo)
+OK = "ok"
+
+# Reglas en orden: la primera que coincide con el mensaje de error gana
+_ERROR_RULES = [
+    (RATE_LIMITED, re.compile(r"HTTP Error 429|Too Many Requests|rate[- ]limit", re.I)),
+    (THROTTLED, re.compile(r"throttl|estrangulada", re.I)),
+    (FORBIDDEN, re.compile(r"HTTP Error 403|Forbidden", re.I)),
+    (UNAVAILABLE, re.compile(r"Private video|Video unavailable|not available|has been removed|members[- ]only|"
+                             r"Sign in to confirm|geo[- ]?restrict|copyright|HTTP Error 404|HTTP Error 410", re.I)),
+    (UNSUPPORTED, re.compile(r"Unsupported URL|Requested format is not available|No video formats", re.I)),
+    (POSTPROCESS, re.compile(r"ffmpeg|ffprobe|Postprocessing|audio conversion failed", re.I)),
+    (NETWORK, re.compile(r"timed? ?out|Connection (reset|refused|aborted)|Remote end closed|Temporary failure|"
+                         r"Name or service not known|HTTP Error 5\d\d|IncompleteRead|Unable to download|"
+                         r"Network is unreachable|EOF occurred", re.I)),
+]
+
+# Alias de dominio que comparten el mismo servidor de origen
+_HOST_ALIASES = {"youtu.be": "youtube.com"}
+
+
+def host_key(url: str) -> str:
+    """Host normalizado para los límites por host ('www.youtube.com' y 'youtu.be' -> 'youtube.com')."""
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return _HOST_ALIASES.get(host, host)
+
+
+def classify_error(error: Any) -> str:
+    """Motivo de un fallo a partir de la excepción o su mensaje (los workers externos solo envían el texto)."""
+    message = str(error or "")
+    for reason, pattern in _ERROR_RULES:
+        if pattern.search(message):
+            return reason
+    return OTHER
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Backoff exponencial con jitter completo: aleatorio entre base/2 y min(base * 2^(attempt-1), maximum)."""
+    ceiling = min(base * 2 ** max(attempt - 1, 0), maximum)
+    return random.uniform(min(base / 2, ceiling), ceiling)
+
+
+class Throttled(Exception):
+    """La transferencia lleva una ventana entera por debajo del umbral de velocidad (se reconecta)."""
+
+    def __init__(self, host: str, speed: float, window: float, threshold: float):
+        self.host = host
+        self.speed = speed
+        super().__init__(f"Descarga estrangulada por {host}: {speed / 1024:.0f} KiB/s durante {window:.0f}s "
+                         f"(umbral {threshold / 1024:.0f} KiB/s)")
+
+
+class HostBlocked(Exception):
+    """El host está en backoff (429) más tiempo del que la solicitud puede esperar: se rechaza sin esperar."""
+
+    def __init__(self, host: str, retry_after: float):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"{host} está limitando las solicitudes (rate limit): reintenta en {retry_after:.0f}s")
+
+
+class ThrottleDetector:
+    """
+    Detecta una descarga estrangulada a partir de los datos del progress_hook:
+    velocidad media en una ventana deslizante de `window` segundos por debajo de
+    `min_speed`. Cada archivo empieza una ventana nueva. No es thread-safe: uno por descarga.
+    """
+
+    def __init__(self, min_speed: float, window: float):
+        self.min_speed = min_speed
+        self.window = window
+        self._filename: Optional[str] = None
+        self._samples: deque = deque()
+
+    def reset(self):
+        """Nueva conexión (reintento): la ventana vuelve a empezar."""
+        self._filename = None
+        self._samples.clear()
+
+    def update(self, filename: str, downloaded: int, now: Optional[float] = None) -> Optional[float]:
+        """Registra el progreso; devuelve la velocidad de la ventana si está estrangulada, o None."""
+        if not self.min_speed:
+            return None
+        now = time.monotonic() if now is None else now
+        if filename != self._filename:
+            self._filename = filename
+            self._samples.clear()
+        self._samples.append((now, downloaded))
+        # Se conserva la muestra más reciente que cubre la ventana entera
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+        first_at, first_bytes = self._samples[0]
+        span = now - first_at
+        if span < self.window:
+            return None
+        speed = (downloaded - first_bytes) / span
+        return speed if speed < self.min_speed else None
+
+
+class _Host:
+    """Token bucket, backoff y contadores de un host."""
+    __slots__ = ("tokens", "last", "blocked_until", "penalties", "counts", "waited")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.penalties = 0  # 429 seguidos: hacen crecer el backoff
+        self.counts: Dict[str, int] = {}
+        self.waited = 0.0
+
+
+class RequestGovernor:
+    """
+    Regulador de solicitudes por host, compartido por la extracción de metadatos
+    (vista previa, lotes, suscripciones) y las descargas.
+
+    - Token bucket por host: `rate` solicitudes/s con ráfagas de hasta `burst`.
+      `acquire(host)` bloquea el hilo que llama (siempre un hilo de yt-dlp,
+      nunca el event loop) hasta que haya un token.
+    - Backoff por host: un 429 (`record(host, RATE_LIMITED)`) bloquea el host
+      con espera exponencial y jitter; cada éxito reduce la penalización.
+    - Contadores por host y resultado: tasa de éxito y de estrangulamiento en `stats()`.
+
+    Thread-safe.
+    """
+
+    def __init__(self, rate: float, burst: float, backoff: float, backoff_max: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _Host] = {}
+
+    def _host(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(self.burst)
+        return state
+
+    def _reserve(self, host: str, max_wait: Optional[float] = None) -> float:
+        """
+        Toma un token (puede quedar en deuda) y devuelve cuántos segundos esperar.
+        Si la espera supera `max_wait`, devuelve el token y lanza HostBlocked.
+        """
+        with self._lock:
+            state = self._host(host)
+            now = time.monotonic()
+            wait = max(state.blocked_until - now, 0.0)
+            if self.rate:
+                state.tokens = min(self.burst, state.tokens + (now - state.last) * self.rate)
+                state.last = now
+                state.tokens -= 1
+                if state.tokens < 0:
+                    wait = max(wait, -state.tokens / self.rate)
+            if max_wait is not None and wait > max_wait:
+                if self.rate:
+                    state.tokens += 1
+                raise HostBlocked(host, wait)
+            state.waited += wait
+            return wait
+
+    def acquire(self, host: str, stop: Optional[threading.Event] = None, max_wait: Optional[float] = None) -> float:
+        """
+        Espera el turno de `host`; con `stop`, la espera se interrumpe si se activa.
+        Con `max_wait`, lanza HostBlocked en lugar de esperar más que eso (los hilos
+        de extracción no deben quedarse dormidos más allá de EXTRACT_TIMEOUT).
+        Devuelve los segundos esperados.
+        """
+        wait = self._reserve(host, max_wait)
+        GOVERNOR_WAIT_SECONDS.observe(wait)
+        if wait > 0:
+            if stop is not None:
+                stop.wait(wait)
+            else:
+                time.sleep(wait)
+        return wait
+
+    def record(self, host: str, outcome: str):
+        """Resultado de una solicitud: OK o un motivo de classify_error (RATE_LIMITED, THROTTLED...)."""
+        with self._lock:
+            state = self._host(host)
+            state.counts[outcome] = state.counts.get(outcome, 0) + 1
+            if outcome == RATE_LIMITED:
+                state.penalties += 1
+                delay = backoff_delay(state.penalties, self.backoff, self.backoff_max)
+                state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+            elif outcome == OK and state.penalties:
+                state.penalties -= 1
+        GOVERNOR_REQUESTS.inc(host=host, outcome=outcome)
+
+    def blocked_for(self, host: str) -> float:
+        with self._lock:
+            state = self._hosts.get(host)
+            return max(state.blocked_until - time.monotonic(), 0.0) if state else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            hosts = {}
+            for host, state in self._hosts.items():
+                total = sum(state.counts.values())
+                hosts[host] = {
+                    "requests": total,
+                    "outcomes": dict(state.counts),
+                    "success_rate": round(state.counts.get(OK, 0) / total, 3) if total else None,
+                    "throttle_rate": round((state.counts.get(THROTTLED, 0) + state.counts.get(RATE_LIMITED, 0))
+                                           / total, 3) if total else None,
+                    "blocked_for": round(max(state.blocked_until - now, 0.0), 1),
+                    "penalties": state.penalties,
+                    "waited_seconds": round(state.waited, 1),
+                }
+        return {"rate": self.rate, "burst": self.burst, "hosts": hosts}
+
+
+request_governor = RequestGovernor(
+    rate=settings.GOVERNOR_HOST_RATE,
+    burst=settings.GOVERNOR_HOST_BURST,
+    backoff=settings.GOVERNOR_BACKOFF,
+    backoff_max=settings.GOVERNOR_BACKOFF_MAX,
+)
@@ -0,0 +1,85 @@
+import sys
+import time
+from typing import List, Optional, Tuple
+
+
+class _TimedLoader:
+    """Envuelve el loader de un módulo para medir su `exec_module`."""
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        profiler = self._profiler
+        frame = [module.__name__, 0.0]  # [nombre, tiempo de los hijos]
+        profiler._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            profiler._stack.pop()
+            if profiler._stack:
+                profiler._stack[-1][1] += elapsed
+            profiler.records.append((module.__name__, elapsed - frame[1], elapsed, len(profiler._stack)))
+            # El módulo conserva su loader real (importlib.resources, pkgutil...)
+            if getattr(module, "__loader__", None) is self:
+                module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None and module.__spec__.loader is self:
+                module.__spec__.loader = self._loader
+
+
+class ImportProfiler:
+    """
+    Tiempo de importación por módulo, equivalente a `python -X importtime` pero
+    usable también en el ejecutable de PyInstaller (donde no se pueden pasar
+    opciones al intérprete). Uso:
+
+        with ImportProfiler() as profiler:
+            import app.main
+        print(profiler.report())
+    """
+
+    def __init__(self):
+        # (módulo, propio, acumulado, profundidad), en orden de finalización
+        self.records: List[Tuple[str, float, float, int]] = []
+        self._stack: List[list] = []
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.meta_path.remove(self)
+        return False
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    @property
+    def total(self) -> float:
+        return sum(cumulative for _, _, cumulative, depth in self.records if depth == 0)
+
+    def report(self, limit: Optional[int] = 30) -> str:
+        """Los `limit` módulos más costosos (tiempo acumulado), con el mismo formato que -X importtime."""
+        ordered = sorted(self.records, key=lambda record: record[2], reverse=True)
+        lines = [f"# {len(self.records)} módulos importados en {self.total:.3f}s",
+                 "import time: self [us] | cumulative | imported package"]
+        for name, own, cumulative, depth in ordered[:limit]:
+            lines.append(f"import time: {own * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}")
+        return "\n".join(lines)
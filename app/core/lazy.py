@@ -0,0 +1,36 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Sustituto de un módulo que lo importa en el primer acceso a un atributo.
+
+    Para dependencias pesadas que no hacen falta para arrancar el servidor
+    (yt-dlp importa cientos de módulos). `importlib.import_module` ya es seguro
+    entre hilos: si dos hilos acceden a la vez, el segundo espera al primero.
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def load(self) -> ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = importlib.import_module(self._name)
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name!r} ({'cargado' if self.loaded else 'pendiente'})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -1,28 +1,330 @@
-from typing import List
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
 from fastapi import WebSocket
 
+from .config import settings
+from .metrics import metrics
+
+WS_SEND_SECONDS = metrics.histogram(
+    "ws_send_seconds", "Time to send one WebSocket frame to a client",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+# Event types, also usable as subscription topics
+LOG = "log"            # Free-form log line (yt-dlp output, system messages)
+PROGRESS = "progress"  # Numeric download progress of a job
+STATE = "state"        # Job state transition (queued, running, completed...)
+TOPICS = (LOG, PROGRESS, STATE)
+
+
+def make_event(type: str, message: Optional[str] = None, job_id: Optional[int] = None,
+               level: str = "info", **fields: Any) -> Dict[str, Any]:
+    """
+    Builds a structured event. Numeric fields (bytes, speed, eta...) are sent as
+    numbers so clients do not have to parse display strings.
+    """
+    event: Dict[str, Any] = {"type": type, "job_id": job_id, "level": level, "ts": time.time()}
+    if message is not None:
+        event["message"] = message
+    event.update(fields)
+    return event
+
+
+class _Client:
+    """A connected WebSocket with its own bounded outbox, sender task and subscription."""
+
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        # None = every job; otherwise only events of these job ids (plus job-less events)
+        self.jobs: Optional[Set[int]] = None
+        self.topics: Set[str] = set(TOPICS)
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if event["type"] not in self.topics:
+            return False
+        job_id = event.get("job_id")
+        return self.jobs is None or job_id is None or job_id in self.jobs
+
+
 class LogManager:
     """
-    Manages WebSocket connections for streaming logs.
+    Manages WebSocket connections for streaming logs and job events.
+
+    Every client has a bounded queue drained by its own sender task, so a slow or
+    half-dead tab never delays the others. A client whose queue overflows (or whose
+    send times out) is evicted and its pending messages are counted as dropped.
+
+    Events are JSON objects (see `make_event`); each frame carries a JSON array of
+    one or more events. Clients can narrow what they receive to some jobs and/or
+    topics, either with query parameters on connect (`?jobs=1,2&topics=progress,state`)
+    or by sending `{"action": "subscribe" | "unsubscribe", "jobs": [...], "topics": [...]}`.
+    Subscribing to a job replays its latest state and progress snapshot.
+
+    Progress updates are coalesced per job: only the latest event of each job is
+    sent, at most WS_PROGRESS_RATE times per second.
+
+    `publish` must be called from the event loop; `publish_threadsafe` and
+    `publish_progress` may be called from any thread (e.g. yt-dlp hooks).
+
+    In a download worker process (app/worker.py) there are no clients: `relay`
+    receives the events published from threads instead, and the worker forwards
+    them to the web process, which publishes them here.
     """
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
 
-    async def connect(self, websocket: WebSocket):
+    def __init__(self, max_queue: int, send_timeout: float, progress_rate: float, max_snapshots: int = 500):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.progress_interval = 1.0 / progress_rate if progress_rate > 0 else 0.0
+        self.max_snapshots = max_snapshots
+
+        self.clients: Dict[WebSocket, _Client] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._lock = threading.Lock()
+        self._pending_progress: Dict[Any, Dict[str, Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_flush = 0.0
+        # job_id -> {"state": event, "progress": event}
+        self._snapshots: "OrderedDict[int, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        # Sink for events published from threads when there is no loop to publish to (worker mode)
+        self.relay: Optional[Callable[[Dict[str, Any]], None]] = None
+
+        # Counters
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.progress_received = 0
+        self.progress_coalesced = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Binds the manager to the running loop so worker threads can publish."""
+        self.loop = loop or asyncio.get_running_loop()
+
+    async def connect(self, websocket: WebSocket, client_id: str = "",
+                      jobs: Optional[Iterable[int]] = None, topics: Optional[Iterable[str]] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        if self.loop is None:
+            self.start()
+        client = _Client(websocket, client_id, self.max_queue)
+        client.task = asyncio.ensure_future(self._sender(client))
+        self.clients[websocket] = client
+        if jobs is not None or topics is not None:
+            self.subscribe(websocket, jobs=jobs, topics=topics, replace=True)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.task is not None:
+            client.task.cancel()
+
+    # --- Subscriptions ------------------------------------------------------
+
+    def subscribe(self, websocket: WebSocket, jobs: Optional[Iterable[int]] = None,
+                  topics: Optional[Iterable[str]] = None, replace: bool = False):
+        """
+        Narrows (or widens) what a client receives. With `replace`, the given jobs and
+        topics become the whole subscription; otherwise they are added to it.
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        new_jobs = None if jobs is None else {int(j) for j in jobs}
+        if topics is not None:
+            wanted = {t for t in topics if t in TOPICS}
+            client.topics = wanted if replace else client.topics | wanted
+        if new_jobs is not None:
+            client.jobs = new_jobs if replace or client.jobs is None else client.jobs | new_jobs
+        elif replace:
+            client.jobs = None
+        if new_jobs is not None:
+            self._replay(client, new_jobs)
+
+    def unsubscribe(self, websocket: WebSocket, jobs: Optional[Iterable[int]] = None,
+                    topics: Optional[Iterable[str]] = None):
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if topics is not None:
+            client.topics -= set(topics)
+        if jobs is not None and client.jobs is not None:
+            client.jobs -= {int(j) for j in jobs}
+
+    def handle_message(self, websocket: WebSocket, text: str):
+        """Processes a control message sent by the client over the socket."""
+        try:
+            command = json.loads(text)
+            action = command.get("action")
+            if action == "subscribe":
+                self.subscribe(websocket, command.get("jobs"), command.get("topics"), bool(command.get("replace")))
+            elif action == "unsubscribe":
+                self.unsubscribe(websocket, command.get("jobs"), command.get("topics"))
+        except (ValueError, TypeError, AttributeError):
+            # Malformed command: ignore it rather than dropping the connection
+            return
+
+    def _replay(self, client: _Client, jobs: Set[int]):
+        """Sends the latest snapshot of the given jobs to a new subscriber."""
+        for job_id in sorted(j for j in jobs if j in self._snapshots):
+            for kind in (STATE, PROGRESS):
+                event = self._snapshots[job_id].get(kind)
+                if event is not None and client.wants(event):
+                    self._deliver(client, json.dumps({**event, "replay": True}))
+
+    def _remember(self, event: Dict[str, Any]):
+        job_id = event.get("job_id")
+        if job_id is None or event["type"] not in (STATE, PROGRESS):
+            return
+        snapshot = self._snapshots.setdefault(job_id, {})
+        snapshot[event["type"]] = event
+        self._snapshots.move_to_end(job_id)
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+
+    # --- Publishing ---------------------------------------------------------
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # If sending fails, we might want to remove the connection, 
-                # but let's leave it to the disconnect handler for now to avoid modifying list while iterating
-                pass
-
-log_manager = LogManager()
+        """Kept for compatibility: publishes a plain log line."""
+        self.publish(make_event(LOG, message))
+
+    def publish(self, event: Dict[str, Any]):
+        """Queues `event` for every interested client, evicting the ones whose queue is full."""
+        self.published += 1
+        self._remember(event)
+        payload = None
+        for client in list(self.clients.values()):
+            if not client.wants(event):
+                continue
+            if payload is None:
+                payload = json.dumps(event)  # Serialized once, only if someone wants it
+            self._deliver(client, payload)
+
+    def _deliver(self, client: _Client, payload: str):
+        try:
+            client.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            client.dropped += 1
+            self._evict(client, reason="slow consumer")
+
+    def publish_threadsafe(self, event: Dict[str, Any]):
+        if self.relay is not None:
+            self.relay(event)
+            return
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.publish, event)
+
+    def publish_progress(self, key: Any, event: Dict[str, Any]):
+        """Coalesced progress update: only the latest event per `key` survives each flush."""
+        if self.relay is not None:
+            self.relay(event)
+            return
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        with self._lock:
+            self.progress_received += 1
+            if key in self._pending_progress:
+                self.progress_coalesced += 1
+            first = not self._pending_progress
+            self._pending_progress[key] = event
+        if first:
+            loop.call_soon_threadsafe(self._schedule_flush)
+
+    def _schedule_flush(self):
+        if self._flush_handle is not None:
+            return
+        delay = max(0.0, self._last_flush + self.progress_interval - self.loop.time())
+        self._flush_handle = self.loop.call_later(delay, self._flush_progress)
+
+    def _flush_progress(self):
+        self._flush_handle = None
+        self._last_flush = self.loop.time()
+        with self._lock:
+            pending, self._pending_progress = self._pending_progress, {}
+        for event in pending.values():
+            self.publish(event)
+
+    # --- Delivery -----------------------------------------------------------
+
+    async def _sender(self, client: _Client):
+        websocket = client.websocket
+        try:
+            while True:
+                batch = [await client.queue.get()]
+                # Batch whatever else is already waiting into a single frame
+                while not client.queue.empty() and len(batch) < 64:
+                    batch.append(client.queue.get_nowait())
+                frame = "[" + ",".join(batch) + "]"
+                started = time.perf_counter()
+                await asyncio.wait_for(websocket.send_text(frame), self.send_timeout)
+                WS_SEND_SECONDS.observe(time.perf_counter() - started)
+                client.sent += len(batch)
+                self.sent += len(batch)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict(client, reason="send timeout")
+        except Exception:
+            # Dead socket: forget it instead of failing on every future broadcast
+            self.disconnect(websocket)
+
+    def _evict(self, client: _Client, reason: str):
+        if self.clients.get(client.websocket) is not client:
+            return
+        self.evicted += 1
+        client.dropped += client.queue.qsize()
+        self.dropped += client.dropped
+        self.disconnect(client.websocket)
+        asyncio.ensure_future(self._close(client.websocket, reason))
+
+    @staticmethod
+    async def _close(websocket: WebSocket, reason: str):
+        try:
+            # 1013 = "Try Again Later"
+            await asyncio.wait_for(websocket.close(code=1013, reason=reason), 1.0)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "published": self.published,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "progress_received": self.progress_received,
+            "progress_coalesced": self.progress_coalesced,
+            "snapshots": len(self._snapshots),
+            "queue_depths": {client.client_id or str(i): client.queue.qsize()
+                             for i, client in enumerate(self.clients.values())},
+        }
+
+
+log_manager = LogManager(
+    max_queue=settings.WS_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    progress_rate=settings.WS_PROGRESS_RATE,
+)
+metrics.gauge("ws_connections", "Connected WebSocket log clients").set_function(lambda: len(log_manager.clients))
+metrics.gauge("ws_queue_depth_max", "Deepest per-client outbox").set_function(
+    lambda: max((client.queue.qsize() for client in list(log_manager.clients.values())), default=0)
+)
+metrics.counter("ws_events_total", "WebSocket events by outcome", ["outcome"]).set_function(lambda: {
+    "published": log_manager.published, "sent": log_manager.sent, "dropped": log_manager.dropped,
+    "progress_coalesced": log_manager.progress_coalesced,
+})
+metrics.counter("ws_evicted_total", "Clients evicted for being too slow").set_function(lambda: log_manager.evicted)
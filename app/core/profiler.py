@@ -0,0 +1,76 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Tuple
+
+# Pilas cuya última función está en estos módulos son hilos en espera (pool ocioso, select, locks)
+_IDLE_MODULES = {"threading.py", "selectors.py", "queue.py", "thread.py"}
+
+
+class ProfilerBusy(Exception):
+    """Ya hay un perfilado en curso."""
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de bajo coste: durante una ventana de tiempo captura
+    la pila de todos los hilos con sys._current_frames() y cuenta las repetidas.
+
+    El resultado usa el formato "collapsed" (`hilo;func (archivo);...;func (archivo:línea) N`),
+    compatible con flamegraph.pl y speedscope. Fuera de la ventana no añade coste.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def profile(self, seconds: float, interval: float = 0.005, limit: int = 50, include_idle: bool = False) -> str:
+        """Bloqueante: muestrea durante `seconds` y devuelve las `limit` pilas más frecuentes."""
+        with self._lock:
+            if self.running:
+                raise ProfilerBusy("Ya hay un perfilado en curso")
+            self.running = True
+        try:
+            stacks, samples = self._sample(seconds, interval, include_idle)
+        finally:
+            self.running = False
+
+        lines = [
+            f"# {samples} muestras en {seconds:.1f}s (intervalo {interval * 1000:.1f} ms), "
+            f"{len(stacks)} pilas distintas{'' if include_idle else ', sin hilos en espera'}"
+        ]
+        for (thread, frames), count in stacks.most_common(limit):
+            lines.append(";".join((thread, *frames)) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, include_idle: bool) -> Tuple[Counter, int]:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not include_idle and os.path.basename(frame.f_code.co_filename) in _IDLE_MODULES:
+                    continue
+                # Línea exacta solo en la función activa; en las demás fragmentaría la agregación
+                frames = [f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"]
+                frame = frame.f_back
+                while frame is not None:
+                    frames.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)})")
+                    frame = frame.f_back
+                # Los hilos de un mismo pool (download_0, download_1...) se agrupan
+                thread = re.sub(r"[_-]\d+$", "", names.get(ident, str(ident)))
+                stacks[(thread, tuple(reversed(frames)))] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+
+
+sampling_profiler = SamplingProfiler()
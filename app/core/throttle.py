@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+from .config import settings
+
+
+class BandwidthLimiter:
+    """
+    Token bucket thread-safe que limita el ancho de banda total de todas las descargas.
+
+    Los hilos de descarga llaman a `consume(n)` desde el progress_hook de yt-dlp
+    con los bytes recibidos desde la última llamada; si se agotan los tokens, el
+    hilo duerme lo necesario. Como el hook corre en el mismo hilo que lee de la
+    red, dormir ahí frena la descarga real.
+    """
+
+    def __init__(self, rate: int, burst_seconds: float = 1.0):
+        self._lock = threading.Lock()
+        self.burst_seconds = burst_seconds
+        self.set_rate(rate)
+
+    def set_rate(self, rate: int):
+        """Cambia el límite en caliente (bytes/s). 0 desactiva el límite."""
+        with self._lock:
+            self.rate = max(int(rate), 0)
+            self._capacity = self.rate * self.burst_seconds
+            self._tokens = self._capacity
+            self._last = time.monotonic()
+
+    def _reserve(self, amount: int) -> float:
+        """Descuenta `amount` bytes y devuelve cuántos segundos hay que esperar."""
+        if amount <= 0:
+            return 0.0
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Los tokens pueden quedar en negativo: el déficit se paga durmiendo
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, amount: int):
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def consume_async(self, amount: int):
+        """Igual que `consume`, para el event loop (envío de archivos a clientes)."""
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+bandwidth_limiter = BandwidthLimiter(settings.DOWNLOAD_RATE_LIMIT)
+# Envío de archivos descargados a los clientes (/files), compartido entre todas las conexiones
+serve_limiter = BandwidthLimiter(settings.SERVE_RATE_LIMIT)
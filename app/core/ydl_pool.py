@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .config import settings
+from .metrics import metrics
+
+_MISSING = object()
+
+
+class _Slot:
+    __slots__ = ("instance", "created", "uses", "busy")
+
+    def __init__(self, instance: Any):
+        self.instance = instance
+        self.created = time.monotonic()
+        self.uses = 0
+        self.busy = False
+
+
+class YoutubeDLPool:
+    """
+    Instancias de YoutubeDL reutilizables, una por hilo (los hilos del pool de
+    extracción son fijos, así que cada uno conserva su instancia "caliente").
+
+    Crear un YoutubeDL por llamada repite la inicialización de extractores,
+    cookies y contextos SSL, y pierde las conexiones keep-alive del
+    manejador HTTP de yt-dlp. Una instancia solo la usa su hilo, así que no
+    hace falta sincronizar su estado interno.
+
+    `acquire(factory, overlay)` aplica `overlay` sobre `ydl.params` durante la
+    llamada y lo restaura después. Solo sirve para opciones que yt-dlp lee en
+    cada llamada (extract_flat, playlistend, listsubs...), no para las que
+    procesa al construirse (hooks, postprocesadores, logger, formato).
+
+    Reciclado: una instancia se descarta tras `max_uses` usos, a los
+    `max_age` segundos o si la llamada lanza una excepción (su estado
+    interno puede haber quedado a medias).
+    """
+
+    def __init__(self, name: str, max_uses: int = 200, max_age: float = 600.0, enabled: bool = True):
+        self.name = name
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots: Dict[int, _Slot] = {}  # id del hilo -> slot (para cerrar todo al apagar)
+
+        # Contadores (protegidos por _lock)
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+
+    @contextmanager
+    def acquire(self, factory: Callable[[], Any], overlay: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        slot: Optional[_Slot] = getattr(self._local, "slot", None)
+        if not self.enabled or (slot is not None and slot.busy):
+            # Sin pool, o uso anidado en el mismo hilo: instancia de un solo uso
+            with self._lock:
+                self.created += 1
+            instance = factory()
+            try:
+                with self._overlay(instance, overlay):
+                    yield instance
+            finally:
+                instance.close()
+            return
+
+        if slot is not None and self._expired(slot):
+            self._discard(slot)
+            slot = None
+        if slot is None:
+            slot = self._local.slot = _Slot(factory())
+            with self._lock:
+                self.created += 1
+                self._slots[threading.get_ident()] = slot
+        else:
+            with self._lock:
+                self.reused += 1
+
+        slot.busy = True
+        slot.uses += 1
+        try:
+            with self._overlay(slot.instance, overlay):
+                yield slot.instance
+        except BaseException:
+            self._discard(slot)
+            raise
+        finally:
+            slot.busy = False
+
+    def _expired(self, slot: _Slot) -> bool:
+        return slot.uses >= self.max_uses or time.monotonic() - slot.created >= self.max_age
+
+    def _discard(self, slot: _Slot):
+        if getattr(self._local, "slot", None) is slot:
+            self._local.slot = None
+        with self._lock:
+            if self._slots.get(threading.get_ident()) is slot:
+                del self._slots[threading.get_ident()]
+            self.recycled += 1
+        try:
+            slot.instance.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    @contextmanager
+    def _overlay(instance: Any, overlay: Optional[Dict[str, Any]]):
+        if not overlay:
+            yield
+            return
+        params = instance.params
+        saved = {key: params.get(key, _MISSING) for key in overlay}
+        params.update(overlay)
+        try:
+            yield
+        finally:
+            for key, value in saved.items():
+                if value is _MISSING:
+                    params.pop(key, None)
+                else:
+                    params[key] = value
+
+    def close_all(self):
+        """Cierra las instancias inactivas de todos los hilos (al apagar la aplicación)."""
+        with self._lock:
+            slots = list(self._slots.values())
+            self._slots.clear()
+        for slot in slots:
+            slot.uses = self.max_uses  # Si su hilo vuelve a usarlo, se recrea
+            if not slot.busy:
+                try:
+                    slot.instance.close()
+                except Exception:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "instances": len(self._slots),
+                "created": self.created,
+                "reused": self.reused,
+                "recycled": self.recycled,
+                "max_uses": self.max_uses,
+                "max_age": self.max_age,
+            }
+
+
+extraction_ydl_pool = YoutubeDLPool(
+    "extraction",
+    max_uses=settings.YDL_POOL_MAX_USES,
+    max_age=settings.YDL_POOL_MAX_AGE,
+    enabled=settings.YDL_POOL_ENABLED,
+)
+metrics.gauge("ydl_pool_instances", "Instancias de YoutubeDL vivas en el pool de extracción").set_function(
+    lambda: extraction_ydl_pool.stats()["instances"]
+)
+metrics.counter("ydl_pool_events_total", "Instancias de YoutubeDL creadas, reutilizadas y recicladas", ["event"]).set_function(
+    lambda: {event: extraction_ydl_pool.stats()[event] for event in ("created", "reused", "recycled")}
+)
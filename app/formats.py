@@ -0,0 +1,271 @@
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Los trabajos guardan las reglas con este prefijo en el campo de formato;
+# el resto de valores son selectores de yt-dlp ('137+140', 'bv*+ba/b'...).
+RULE_PREFIX = "rule:"
+
+# Prefijo del codec (en minúsculas) -> familia
+_VIDEO_FAMILIES = (
+    ("av01", "av1"), ("av1", "av1"),
+    ("vp09", "vp9"), ("vp9", "vp9"), ("vp8", "vp8"),
+    ("avc", "avc"), ("h264", "avc"),
+    ("hev", "hevc"), ("hvc", "hevc"), ("h265", "hevc"),
+    ("theora", "theora"),
+)
+_AUDIO_FAMILIES = (
+    ("opus", "opus"), ("mp4a", "aac"), ("aac", "aac"), ("mp3", "mp3"), ("vorbis", "vorbis"),
+    ("flac", "flac"), ("alac", "alac"), ("ac-3", "ac3"), ("ac3", "ac3"), ("ec-3", "eac3"), ("eac3", "eac3"),
+)
+VIDEO_CODECS = frozenset(family for _, family in _VIDEO_FAMILIES)
+AUDIO_CODECS = frozenset(family for _, family in _AUDIO_FAMILIES)
+
+_SIZE_UNITS = {"": 1, "k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9, "t": 10 ** 12,
+               "ki": 2 ** 10, "mi": 2 ** 20, "gi": 2 ** 30, "ti": 2 ** 40}
+_LIMIT_RE = re.compile(r"^(<=|>=|≤|≥|<|>|=)?\s*(\d+(?:\.\d+)?)\s*([a-z]*)$")
+
+
+def codec_family(codec: Optional[str], families=_VIDEO_FAMILIES) -> Optional[str]:
+    """
+    'avc1.64001F' -> 'avc', 'opus' -> 'opus'. None solo si no hay codec (ausente o
+    'none'): un codec desconocido devuelve su prefijo ('mjpeg', 'pcm_s16le'), así el
+    formato sigue contando como pista de video/audio y las reglas lo ordenan
+    detrás de los codecs preferidos.
+    """
+    if not codec or codec == "none":
+        return None
+    codec = codec.lower()
+    for prefix, family in families:
+        if codec.startswith(prefix):
+            return family
+    return codec.split(".", 1)[0]
+
+
+def estimate_size(fmt: Dict[str, Any], duration: Optional[float]) -> Tuple[Optional[int], bool]:
+    """
+    Tamaño del formato en bytes y si es aproximado: `filesize`, si no
+    `filesize_approx`, si no tbr (kbit/s) × duración.
+    """
+    if fmt.get("filesize"):
+        return int(fmt["filesize"]), False
+    if fmt.get("filesize_approx"):
+        return int(fmt["filesize_approx"]), True
+    if fmt.get("tbr") and duration:
+        return int(fmt["tbr"] * 125 * duration), True  # kbit/s -> bytes/s
+    return None, False
+
+
+class Rung(NamedTuple):
+    """Un formato de la escalera, con los campos numéricos ya calculados."""
+    format_id: str
+    ext: str
+    protocol: str
+    height: int
+    fps: float
+    tbr: float
+    vcodec: Optional[str]   # Familia ('av1', 'vp9', 'avc'...) o None si no tiene video
+    acodec: Optional[str]   # Familia ('opus', 'aac'...) o None si no tiene audio
+    size: Optional[int]
+    size_approx: bool
+    raw: Dict[str, Any]     # Formato original de yt-dlp (resolución, codecs completos, nota...)
+
+    @property
+    def muxed(self) -> bool:
+        return self.vcodec is not None and self.acodec is not None
+
+
+class FormatLadder:
+    """
+    Escalera de calidad precalculada a partir de los formatos de yt-dlp:
+    `video` (incluye los formatos con audio y video juntos) y `audio`, cada una
+    ordenada de peor a mejor. Se calcula una vez por video y sirve tanto para
+    la UI como para resolver reglas sin volver a analizar cadenas.
+    """
+
+    def __init__(self, video: List[Rung], audio: List[Rung]):
+        self.video = video
+        self.audio = audio
+
+    @classmethod
+    def from_formats(cls, formats: Iterable[Dict[str, Any]], duration: Optional[float] = None) -> "FormatLadder":
+        video, audio = [], []
+        for f in formats:
+            vcodec = codec_family(f.get("vcodec"))
+            acodec = codec_family(f.get("acodec"), _AUDIO_FAMILIES)
+            if vcodec is None and acodec is None:
+                continue  # Miniaturas (storyboards) y formatos sin codecs conocidos
+            size, approx = estimate_size(f, duration)
+            rung = Rung(
+                format_id=str(f["format_id"]),
+                ext=f.get("ext") or "",
+                protocol=f.get("protocol") or "",
+                height=int(f.get("height") or 0),
+                fps=float(f.get("fps") or 0),
+                tbr=float(f.get("tbr") or f.get("vbr") or f.get("abr") or 0),
+                vcodec=vcodec,
+                acodec=acodec,
+                size=size,
+                size_approx=approx,
+                raw=f,
+            )
+            (video if vcodec is not None else audio).append(rung)
+        video.sort(key=lambda r: (r.height, r.fps, r.tbr, r.size or 0))
+        audio.sort(key=lambda r: (r.tbr, r.size or 0))
+        return cls(video, audio)
+
+
+def _parse_size(number: str, unit: str) -> int:
+    unit = unit.lower().rstrip("b")
+    if unit not in _SIZE_UNITS:
+        raise ValueError(f"Unidad de tamaño desconocida: {unit!r}")
+    return int(float(number) * _SIZE_UNITS[unit])
+
+
+class FormatRule:
+    """
+    Regla declarativa de selección de formato. Cláusulas separadas por comas:
+
+        prefer av1>vp9>avc   orden de preferencia de codecs (de video o de audio)
+        best opus            mejor audio, prefiriendo ese codec
+        <=1440p  >=720p      límites de altura
+        <=60fps              límite de fps
+        <=2GB  <=500MiB      límite del tamaño estimado (video + audio)
+        audio only           solo audio
+
+    El orden de prioridad es altura > codec > fps > bitrate: una preferencia
+    de codec desempata entre formatos de la misma altura, no baja de resolución.
+    """
+
+    def __init__(self, text: str = ""):
+        self.text = text.strip()
+        self.video_codecs: List[str] = []
+        self.audio_codecs: List[str] = []
+        self.max_height: Optional[int] = None
+        self.min_height: Optional[int] = None
+        self.max_fps: Optional[float] = None
+        self.max_size: Optional[int] = None
+        self.audio_only = False
+        for clause in re.split(r"[,;]", self.text.lower()):
+            clause = clause.strip()
+            if clause:
+                self._parse_clause(clause)
+
+    def __repr__(self):
+        return f"FormatRule({self.text!r})"
+
+    @property
+    def spec(self) -> str:
+        """Valor para el campo de formato de un trabajo."""
+        return RULE_PREFIX + self.text
+
+    def _parse_clause(self, clause: str):
+        words = clause.split(None, 1)
+        if clause in ("audio", "audio only", "solo audio"):
+            self.audio_only = True
+        elif words[0] in ("prefer", "best") and len(words) == 2:
+            codecs = [c.strip() for c in re.split(r"[>/]", words[1]) if c.strip()]
+            unknown = [c for c in codecs if c not in VIDEO_CODECS | AUDIO_CODECS]
+            if unknown:
+                raise ValueError(f"Codec desconocido en la regla: {', '.join(unknown)}")
+            self.video_codecs += [c for c in codecs if c in VIDEO_CODECS]
+            self.audio_codecs += [c for c in codecs if c in AUDIO_CODECS]
+        elif words[0] == "best" and len(words) == 1:
+            pass  # Es el comportamiento por defecto
+        else:
+            self._parse_limit(clause)
+
+    def _parse_limit(self, clause: str):
+        match = _LIMIT_RE.match(clause)
+        if not match:
+            raise ValueError(f"Cláusula no reconocida: {clause!r}")
+        op, number, unit = match.groups()
+        op = {"≤": "<=", "≥": ">=", None: "<="}.get(op, op)
+        if unit == "p":
+            value = int(float(number))
+            if op in ("<=", "<", "="):
+                self.max_height = value - 1 if op == "<" else value
+            if op in (">=", ">", "="):
+                self.min_height = value + 1 if op == ">" else value
+        elif unit == "fps" and op in ("<=", "<"):
+            self.max_fps = float(number) - (1 if op == "<" else 0)
+        elif unit and op in ("<=", "<"):
+            self.max_size = _parse_size(number, unit)
+        else:
+            raise ValueError(f"Límite no soportado: {clause!r}")
+
+    # --- Resolución -----------------------------------------------------------
+
+    @staticmethod
+    def _codec_rank(codec: Optional[str], preferred: List[str]) -> int:
+        try:
+            return len(preferred) - preferred.index(codec)
+        except ValueError:
+            return 0
+
+    def _fits(self, size: Optional[int]) -> bool:
+        # Tamaño desconocido: no se puede descartar
+        return self.max_size is None or size is None or size <= self.max_size
+
+    def _video_ok(self, rung: Rung) -> bool:
+        return ((self.max_height is None or rung.height <= self.max_height)
+                and (self.min_height is None or rung.height >= self.min_height)
+                and (self.max_fps is None or rung.fps <= self.max_fps))
+
+    def resolve(self, ladder: FormatLadder) -> Optional["Selection"]:
+        """
+        Elige formato en una pasada por cada lista de la escalera. None si
+        ningún formato cumple los límites.
+        """
+        audio = None
+        best_key = None
+        for rung in ladder.audio:
+            if not self._fits(rung.size):
+                continue
+            key = (self._codec_rank(rung.acodec, self.audio_codecs), rung.tbr)
+            if best_key is None or key > best_key:
+                audio, best_key = rung, key
+
+        if self.audio_only:
+            if audio is not None:
+                return Selection(audio.format_id, None, audio, audio.size, audio.size_approx)
+            return None
+
+        video = None
+        best_key = None
+        for rung in ladder.video:
+            if not self._video_ok(rung):
+                continue
+            size = rung.size
+            if not rung.muxed and audio is not None and size is not None and audio.size is not None:
+                size += audio.size
+            if not self._fits(size):
+                continue
+            key = (rung.height, self._codec_rank(rung.vcodec, self.video_codecs), rung.fps, rung.tbr)
+            if best_key is None or key > best_key:
+                video, best_key = rung, key
+        if video is None:
+            return None
+
+        if video.muxed or audio is None:
+            return Selection(video.format_id, video, None, video.size, video.size_approx)
+        size = video.size + audio.size if video.size is not None and audio.size is not None else None
+        return Selection(f"{video.format_id}+{audio.format_id}", video, audio, size,
+                         video.size_approx or audio.size_approx)
+
+
+class Selection(NamedTuple):
+    """Resultado de resolver una regla: selector concreto para yt-dlp y tamaño estimado."""
+    format_spec: str
+    video: Optional[Rung]
+    audio: Optional[Rung]
+    size: Optional[int]
+    size_approx: bool
+
+
+def is_rule(format_spec: str) -> bool:
+    return format_spec.startswith(RULE_PREFIX)
+
+
+def parse_rule(format_spec: str) -> FormatRule:
+    """FormatRule a partir del campo de formato de un trabajo ('rule:...'). ValueError si no es válida."""
+    return FormatRule(format_spec[len(RULE_PREFIX):] if is_rule(format_spec) else format_spec)
@@ -0,0 +1,930 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from .core.config import settings
+from .core.database import SessionLocal
+from .core.diskspace import disk_space, InsufficientSpace
+from .core.governor import request_governor, classify_error, backoff_delay, host_key, RETRYABLE
+from .core.log_manager import log_manager, make_event, LOG, PROGRESS, STATE
+from .core.metrics import metrics, SPEED_BUCKETS
+from .core.throttle import bandwidth_limiter
+from .models import DownloadJob, StoredFile
+from .services import DownloadControl, YtDlpService, yt_dlp
+from .store import download_store
+
+# Estados posibles de un trabajo
+QUEUED = "queued"
+RUNNING = "running"
+POSTPROCESSING = "postprocessing"
+PAUSED = "paused"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING, POSTPROCESSING)
+
+# Resultado de una solicitud de descarga
+SUBMIT_QUEUED = "queued"   # Trabajo nuevo
+SUBMIT_JOINED = "joined"   # Ya había un trabajo activo para el mismo archivo
+SUBMIT_EXISTS = "exists"   # El archivo ya está descargado (índice de app/store.py)
+
+JOB_STAGE_SECONDS = metrics.histogram(
+    "job_stage_seconds", "Duración de cada etapa de un trabajo (cola, descarga, post-procesado)", ["stage", "kind"])
+JOBS_FINISHED = metrics.counter(
+    "jobs_finished_total", "Ejecuciones de trabajos terminadas, por estado final", ["state", "kind"])
+JOB_BYTES = metrics.counter("job_bytes_total", "Bytes descargados por trabajos terminados", ["kind"])
+JOB_SPEED = metrics.histogram(
+    "job_speed_bytes_per_second", "Velocidad media de descarga de cada trabajo", ["kind"], buckets=SPEED_BUCKETS)
+CLIP_BYTES_SAVED = metrics.counter(
+    "clip_bytes_saved_total", "Bytes no descargados gracias a las descargas de tramos (frente al video completo)")
+JOB_RETRIES = metrics.counter(
+    "job_retries_total", "Trabajos fallidos reencolados automáticamente, por motivo (ver app/core/governor.py)", ["reason"])
+
+# Tipo de trabajo en métricas y estadísticas: el modo audio (extracción y conversión) se mide aparte
+AUDIO, VIDEO = "audio", "video"
+
+# Cada cuánto se vuelve a mirar el disco si hay trabajos esperando espacio
+# (puede liberarse desde fuera, sin que termine ningún trabajo)
+_SPACE_RECHECK = 30.0
+
+class JobStateError(Exception):
+    """La transición solicitada no es válida para el estado actual del trabajo."""
+
+
+class Submission(NamedTuple):
+    status: str                         # SUBMIT_QUEUED | SUBMIT_JOINED | SUBMIT_EXISTS
+    job: Optional[DownloadJob] = None   # Trabajo nuevo o al que se unió la solicitud
+    stored: Optional[StoredFile] = None # Archivo existente (SUBMIT_EXISTS)
+
+
+class RunStats(NamedTuple):
+    """Contabilidad de una ejecución, local o de un worker externo."""
+    bytes_downloaded: int
+    download_seconds: float
+    estimated_size: Optional[int]
+    queue_seconds: float
+    download_stage_seconds: float
+    postprocess_seconds: float
+    postprocessed: bool
+    full_size: Optional[int] = None  # Tamaño del video completo si solo se descargó un tramo
+
+    @property
+    def avg_speed(self) -> float:
+        return self.bytes_downloaded / self.download_seconds if self.download_seconds > 0 else 0.0
+
+
+class Lease:
+    """Trabajo cedido a un worker externo (worker.py); vale mientras el worker lo renueve."""
+    __slots__ = ("worker_id", "host", "expires_at", "persisted_until", "queue_seconds", "estimate", "phase",
+                 "stop_reason")
+
+    def __init__(self, worker_id: str, host: str, expires_at: float, queue_seconds: float = 0.0,
+                 estimate: Optional[int] = None, phase: str = RUNNING):
+        self.worker_id = worker_id
+        self.host = host
+        self.expires_at = expires_at
+        self.persisted_until = expires_at  # lease_expires_at guardado en la base de datos
+        self.queue_seconds = queue_seconds
+        self.estimate = estimate
+        self.phase = phase
+        self.stop_reason: Optional[str] = None  # Cancelar/pausar: se entrega en el próximo sondeo
+
+
+def job_kind(job: Optional[DownloadJob]) -> str:
+    return AUDIO if job is not None and (job.options or {}).get("audio_profile") else VIDEO
+
+
+def file_tag(dedup_key: Optional[str]) -> Optional[str]:
+    """Distintivo del nombre del archivo final (ver output_template): 8 caracteres de la clave de deduplicación."""
+    return dedup_key[:8] if dedup_key else None
+
+
+def file_url(job_id: int) -> str:
+    """URL de /files para el archivo final de un trabajo."""
+    return f"{settings.API_PREFIX}/files/{job_id}"
+
+
+class JobScheduler:
+    """
+    Planificador de descargas con cola persistente en SQLite.
+
+    - Concurrencia global (MAX_CONCURRENT_DOWNLOADS) y por host (MAX_DOWNLOADS_PER_HOST).
+    - Prioridades: mayor `priority` sale antes; a igual prioridad, orden de llegada.
+    - Estados: queued -> running -> postprocessing -> completed | failed | cancelled,
+      con paused como estado intermedio (pausar detiene la descarga y conserva el .part).
+    - Pipeline de dos etapas: la descarga (red) ocupa un cupo de descarga; el merge
+      y los post-procesadores FFmpeg (CPU) corren después en un pool propio de
+      POSTPROCESS_WORKERS hilos, así el siguiente trabajo arranca mientras tanto.
+
+    - Espacio en disco (app/core/diskspace.py): un trabajo reserva su tamaño estimado
+      antes de escribir nada. Si no cabe espera en la cola sin ocupar cupo hasta
+      que haya sitio; si no cabría nunca, falla sin descargar.
+
+    - Deduplicación: cada trabajo lleva la clave de su archivo final (app/store.py).
+      Si el archivo ya está en el índice no se descarga, y si otro trabajo activo
+      tiene la misma clave la solicitud se une a él en lugar de descargar dos veces.
+
+    - Reintentos: un trabajo que falla por una causa transitoria (429, descarga
+      estrangulada, 403, red; ver app/core/governor.py) vuelve a la cola tras un
+      backoff exponencial con jitter, hasta JOB_MAX_RETRIES veces. El motivo
+      clasificado queda en `error_reason`.
+
+    - Workers externos (worker.py): otros procesos o equipos sondean `worker_poll`,
+      que les cede trabajos de la misma cola con un lease de WORKER_LEASE_SECONDS,
+      renovado en cada sondeo. Si un worker deja de sondear, sus trabajos vuelven a
+      la cola. El límite por host se aplica por worker (cada uno tiene su propia IP
+      o conexión). Con `local=False` este proceso no descarga nada, solo reparte.
+
+    La cola en memoria es un heap que se reconstruye desde la base de datos al
+    arrancar; la base de datos es la fuente de verdad del estado de cada trabajo.
+    Todos los métodos públicos deben llamarse desde el event loop.
+    """
+
+    def __init__(self, service: YtDlpService, max_concurrent: int, max_per_host: int, postprocess_workers: int,
+                 local: bool = True, lease_seconds: float = 60.0):
+        self.service = service
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.postprocess_workers = postprocess_workers
+        self.local = local
+        self.lease_seconds = lease_seconds
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pp_pool: Optional[ThreadPoolExecutor] = None
+        self._heap: List[Tuple[int, int, int]] = []  # (-priority, secuencia, job_id)
+        self._queued: Dict[int, str] = {}            # job_id -> host (entradas válidas del heap)
+        self._running: Dict[int, Tuple[str, DownloadControl]] = {}
+        self._postprocessing: Dict[int, DownloadControl] = {}
+        self._enqueued_at: Dict[int, float] = {}  # job_id -> instante en que entró a la cola
+        # dedup_key -> job_id del trabajo activo (futuro pendiente mientras se inserta en la base de datos)
+        self._active_keys: Dict[str, "asyncio.Future[int]"] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._host_counts: Counter = Counter()
+        self._estimates: Dict[int, int] = {}  # job_id -> espacio necesario (trabajos en cola con tamaño conocido)
+        self._waiting_space: set = set()      # Trabajos en cola que no caben en disco ahora mismo
+        self._recheck: Optional[asyncio.TimerHandle] = None
+        self._retry_timers: Dict[int, asyncio.TimerHandle] = {}  # Trabajos fallidos esperando su reintento
+        self._leases: Dict[int, Lease] = {}
+        self._workers: Dict[str, float] = {}  # worker_id -> último sondeo
+        self._reaper: Optional[asyncio.Task] = None
+        # Totales por tipo de trabajo (audio/video) desde el arranque
+        self._throughput: Dict[str, Counter] = {AUDIO: Counter(), VIDEO: Counter()}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    # --- Ciclo de vida ------------------------------------------------------
+
+    async def start(self):
+        """Recupera los trabajos pendientes de una ejecución anterior y los encola."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="download")
+        self._pp_pool = ThreadPoolExecutor(max_workers=self.postprocess_workers, thread_name_prefix="postprocess")
+        pending, leased = await asyncio.to_thread(self._recover)
+        for job_id, priority, host, dedup_key, estimate in pending:
+            self._claim_key(dedup_key, job_id)
+            self._enqueue(job_id, priority, host, estimate)
+        for job_id, worker_id, host, dedup_key, expires_at, phase in leased:
+            # Sus workers siguen descargando mientras el lease no venza
+            self._claim_key(dedup_key, job_id)
+            self._leases[job_id] = Lease(worker_id, host, expires_at, phase=phase)
+        if pending or leased:
+            print(f"Reanudando {len(pending)} trabajos pendientes ({len(leased)} en workers externos)")
+        self._reaper = asyncio.ensure_future(self._reap_leases())
+        self._pump()
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Detiene las descargas en curso. Quedan como 'queued' en la base de datos,
+        por lo que se reanudan (continuando el .part) en el próximo arranque.
+        Un post-procesado no se puede interrumpir: si no termina a tiempo, el
+        trabajo queda 'postprocessing' y se repite al arrancar.
+        """
+        self._stopping = True  # Los trabajos que terminan ya no arrancan otros
+        if self._recheck is not None:
+            self._recheck.cancel()
+        for timer in self._retry_timers.values():
+            timer.cancel()  # Siguen 'queued' en la base de datos: se reintentan al arrancar
+        self._retry_timers.clear()
+        if self._reaper is not None:
+            # Los leases de los workers siguen en la base de datos: se recuperan al arrancar
+            self._reaper.cancel()
+        for _, control in self._running.values():
+            control.request_stop(QUEUED)
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pp_pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- API pública ----------------------------------------------------------
+
+    async def submit(self, url: str, title: str, format_id: str, subtitles: List[str],
+                     options: Dict[str, Any], priority: int = 0, estimated_size: Optional[int] = None) -> Submission:
+        submissions = await self.submit_many([(url, title)], format_id, subtitles, options, priority,
+                                             estimated_sizes=[estimated_size])
+        return submissions[0]
+
+    async def submit_many(self, items: List[Tuple[str, str]], format_id: str, subtitles: List[str],
+                          options: Dict[str, Any], priority: int = 0,
+                          estimated_sizes: Optional[List[Optional[int]]] = None) -> List[Submission]:
+        """
+        Encola varios trabajos (url, título) con la misma configuración en una sola transacción.
+        Las URLs ya descargadas o con un trabajo activo equivalente no crean trabajos nuevos.
+        `estimated_sizes` (opcional, uno por item) es el espacio en disco que se espera
+        que necesite cada uno; sin él se averigua al elegir los formatos.
+        """
+        video_keys = await YtDlpService.video_keys_async([url for url, _ in items])
+        keys = [download_store.key_for(video_key, format_id, subtitles, options) for video_key in video_keys]
+        stored = await download_store.lookup_many(keys)
+
+        # Sin awaits desde aquí hasta el insert: la reserva de claves es atómica en el event loop
+        now = time.time()
+        submissions: List[Optional[Submission]] = []
+        new: List[Tuple[int, DownloadJob, "asyncio.Future[int]"]] = []
+        joins: List[Tuple[int, "asyncio.Future[int]"]] = []
+        sizes = estimated_sizes or [None] * len(items)
+        for i, ((url, title), key, size) in enumerate(zip(items, keys, sizes)):
+            submissions.append(None)
+            if key in stored:
+                submissions[i] = Submission(SUBMIT_EXISTS, stored=stored[key])
+            elif key in self._active_keys:
+                joins.append((i, self._active_keys[key]))
+            else:
+                future = self._active_keys[key] = self._loop.create_future()
+                job = DownloadJob(
+                    url=url, title=title, format=format_id, subtitles=subtitles, options=options,
+                    host=host_key(url), priority=priority, state=QUEUED, dedup_key=key, created_at=now,
+                    estimated_size=size,
+                )
+                new.append((i, job, future))
+
+        try:
+            inserted = await asyncio.to_thread(self._insert, [job for _, job, _ in new]) if new else []
+        except BaseException as e:
+            for _, job, future in new:
+                self._active_keys.pop(job.dedup_key, None)
+                future.set_exception(e)
+                future.exception()  # Marcada como consultada: los que se unieron reciben el error
+            raise
+        for (i, _, future), job in zip(new, inserted):
+            future.set_result(job.id)
+            self._enqueue(job.id, job.priority, job.host, job.estimated_size)
+            self._publish_state(job.id, QUEUED, f"[job {job.id}] En cola: {job.title}", title=job.title)
+            submissions[i] = Submission(SUBMIT_QUEUED, job=job)
+        self._pump()
+
+        for i, future in joins:
+            submissions[i] = Submission(SUBMIT_JOINED, job=await self.get_job(await future))
+        return submissions
+
+    async def list_jobs(self, state: Optional[str] = None, limit: int = 100) -> List[DownloadJob]:
+        return await asyncio.to_thread(self._select, state, limit)
+
+    async def get_job(self, job_id: int) -> Optional[DownloadJob]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def cancel(self, job_id: int) -> DownloadJob:
+        return await self._stop(job_id, CANCELLED, allowed=(QUEUED, RUNNING, PAUSED))
+
+    async def pause(self, job_id: int) -> DownloadJob:
+        return await self._stop(job_id, PAUSED, allowed=(QUEUED, RUNNING))
+
+    async def resume(self, job_id: int) -> DownloadJob:
+        job = await self._require(job_id)
+        if job.state not in (PAUSED, FAILED, CANCELLED):
+            raise JobStateError(f"No se puede reanudar un trabajo en estado '{job.state}'")
+        if job.dedup_key and job.dedup_key in self._active_keys:
+            raise JobStateError("Otro trabajo activo ya está descargando este archivo")
+        self._claim_key(job.dedup_key, job_id)
+        try:
+            job = await asyncio.to_thread(self._update, job_id, state=QUEUED, error=None, error_reason=None,
+                                          attempts=0, finished_at=None)
+        except BaseException:
+            self._release_key(job.dedup_key, job_id)
+            raise
+        self._enqueue(job.id, job.priority, job.host, job.estimated_size)
+        self._publish_state(job_id, QUEUED, f"[job {job_id}] Reanudado", title=job.title)
+        self._pump()
+        return job
+
+    def live_control(self, job_id: int) -> Optional[DownloadControl]:
+        """Control de un trabajo que se está descargando o post-procesando (modo "tee" de /files)."""
+        running = self._running.get(job_id)
+        return running[1] if running else self._postprocessing.get(job_id)
+
+    def state_counts(self) -> Dict[str, int]:
+        """Trabajos vivos por estado (para las métricas), incluidos los de workers externos."""
+        remote = Counter(lease.phase for lease in self._leases.values())
+        return {QUEUED: len(self._queued) + len(self._retry_timers), RUNNING: len(self._running) + remote[RUNNING],
+                POSTPROCESSING: len(self._postprocessing) + remote[POSTPROCESSING]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_per_host": self.max_per_host,
+            "postprocess_workers": self.postprocess_workers,
+            "running": len(self._running),
+            "postprocessing": len(self._postprocessing),
+            "queued": len(self._queued),
+            "waiting_space": len(self._waiting_space),
+            "retrying": len(self._retry_timers),
+            "local": self.local,
+            "leased": len(self._leases),
+            "workers": {
+                worker_id: {"leases": sum(1 for lease in self._leases.values() if lease.worker_id == worker_id),
+                            "last_poll_seconds": round(time.time() - last_seen, 1)}
+                for worker_id, last_seen in self._workers.items()
+            },
+            "active_keys": len(self._active_keys),
+            "running_per_host": dict(self._host_counts),
+            "bandwidth_limit": bandwidth_limiter.rate,
+            "throughput": {kind: self._throughput_stats(totals) for kind, totals in self._throughput.items()},
+            "running_jobs": {
+                job_id: {"bytes_downloaded": control.bytes_downloaded, "avg_speed": round(control.avg_speed)}
+                for job_id, (_, control) in self._running.items()
+            },
+        }
+
+    @staticmethod
+    def _throughput_stats(totals: Counter) -> Dict[str, Any]:
+        completed = totals["completed"]
+        return {
+            "completed": completed,
+            "failed": totals["failed"],
+            "bytes": totals["bytes"],
+            "bytes_saved": totals["bytes_saved"],  # Descargas de tramos frente al video completo
+            "mb_per_second": round(totals["bytes"] / totals["download_seconds"] / (1024 * 1024), 2)
+            if totals["download_seconds"] else 0.0,
+            "avg_download_seconds": round(totals["download_stage_seconds"] / completed, 3) if completed else 0.0,
+            "avg_postprocess_seconds": round(totals["postprocess_seconds"] / completed, 3) if completed else 0.0,
+        }
+
+    # --- Workers externos (worker.py) ------------------------------------------
+
+    async def worker_poll(self, worker_id: str, jobs: Dict[int, str], slots: int,
+                          events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Sondeo de un worker externo: publica sus eventos, renueva el lease de los
+        trabajos que sigue ejecutando (`jobs`: job_id -> fase) y le cede hasta
+        `slots` trabajos nuevos. Devuelve los trabajos cedidos, las paradas
+        pendientes (cancelar/pausar) y los trabajos que ya no son suyos (lease
+        vencido y reasignado), que el worker debe abandonar.
+        """
+        now = time.time()
+        self._workers[worker_id] = now
+        for event in events:
+            self._relay(worker_id, event)
+
+        stop, lost, renew, phases = {}, [], {}, []
+        for job_id, phase in jobs.items():
+            lease = self._leases.get(job_id)
+            if lease is None or lease.worker_id != worker_id:
+                lost.append(job_id)
+                continue
+            lease.expires_at = now + self.lease_seconds
+            if lease.persisted_until - now < self.lease_seconds / 2:
+                # La base de datos solo se toca cada medio lease (sirve para recuperar tras reiniciar)
+                renew[job_id] = lease.persisted_until = lease.expires_at
+            if phase == POSTPROCESSING and lease.phase != POSTPROCESSING:
+                lease.phase = POSTPROCESSING
+                phases.append(job_id)
+            if lease.stop_reason:
+                stop[job_id] = lease.stop_reason
+
+        granted = self._grant(worker_id, max(slots, 0), now) if not self._stopping else []
+        rows: List[DownloadJob] = []
+        if granted or renew or phases:
+            try:
+                rows = await asyncio.to_thread(
+                    self._apply_leases, worker_id, {job_id: self._leases[job_id].expires_at for job_id, _ in granted},
+                    renew, phases, now)
+            except BaseException:
+                for job_id, priority in granted:
+                    # Sin registrar en la base de datos: de vuelta a la cola
+                    lease = self._leases.pop(job_id)
+                    self._enqueue(job_id, priority, lease.host, lease.estimate)
+                raise
+        for job_id in phases:
+            self._publish_state(job_id, POSTPROCESSING, f"[job {job_id}] Post-procesando en {worker_id}")
+        for job in rows:
+            self._publish_state(job.id, RUNNING, f"[job {job.id}] Iniciando en {worker_id}: {job.title}",
+                                title=job.title, worker_id=worker_id)
+        return {
+            "jobs": [
+                {"id": job.id, "url": job.url, "format": job.format, "subtitles": job.subtitles,
+                 "options": job.options, "estimated_size": job.estimated_size, "file_tag": file_tag(job.dedup_key)}
+                for job in rows
+            ],
+            "stop": stop,
+            "lost": lost,
+            "lease_seconds": self.lease_seconds,
+        }
+
+    async def worker_finish(self, worker_id: str, job_id: int, result: Dict[str, Any]) -> None:
+        """
+        Resultado de un trabajo cedido (ver WorkerResult). `files` son rutas relativas a DOWNLOAD_DIR
+        (compartido entre el worker y este proceso). Lanza JobStateError si el
+        trabajo ya no está cedido a ese worker (lease vencido y reasignado).
+        """
+        lease = self._leases.get(job_id)
+        if lease is None or lease.worker_id != worker_id:
+            raise JobStateError(f"El trabajo {job_id} no está cedido al worker {worker_id}")
+        state, error = result["state"], result.get("error")
+        if state not in (COMPLETED, FAILED, CANCELLED, PAUSED, QUEUED):
+            raise ValueError(f"Estado final no válido: {state}")
+        for event in result.get("events") or []:
+            self._relay(worker_id, event)  # Logs pendientes antes que el estado final
+        del self._leases[job_id]
+
+        final_files = []
+        for path in result.get("files") or []:
+            absolute = os.path.join(download_store.directory, path)
+            if download_store.relative_path(absolute) is not None:  # Nada fuera de DOWNLOAD_DIR
+                final_files.append(absolute)
+        if state == COMPLETED and not final_files:
+            state, error = FAILED, "El worker no dejó el archivo en DOWNLOAD_DIR"
+        job = None
+        try:
+            job = await self.get_job(job_id)
+            state = await self._finish_run(job_id, job, state, error, final_files, RunStats(
+                bytes_downloaded=result.get("bytes_downloaded") or 0,
+                download_seconds=result.get("download_seconds") or 0.0,
+                estimated_size=result.get("estimated_size"),
+                queue_seconds=lease.queue_seconds,
+                download_stage_seconds=result.get("download_stage_seconds") or 0.0,
+                postprocess_seconds=result.get("postprocess_seconds") or 0.0,
+                postprocessed=bool(result.get("postprocessed")), full_size=result.get("full_size"),
+            ), requeue=True, lease_expires_at=None)  # worker_id queda: quién lo ejecutó
+        finally:
+            if state != QUEUED and job is not None:
+                self._release_key(job.dedup_key, job_id)
+            self._pump()
+
+    def _grant(self, worker_id: str, slots: int, now: float) -> List[Tuple[int, int]]:
+        """Saca de la cola hasta `slots` trabajos para `worker_id` (sin awaits). Devuelve (job_id, prioridad)."""
+        hosts = Counter(lease.host for lease in self._leases.values()
+                        if lease.worker_id == worker_id and lease.phase == RUNNING)
+        granted, skipped = [], []
+        while self._heap and len(granted) < slots:
+            entry = heapq.heappop(self._heap)
+            job_id = entry[2]
+            host = self._queued.get(job_id)
+            if host is None:
+                continue  # Entrada obsoleta
+            if hosts[host] >= self.max_per_host:
+                skipped.append(entry)
+                continue
+            # Sin reserva de disco aquí: el worker la hace contra su propio DOWNLOAD_DIR
+            del self._queued[job_id]
+            self._waiting_space.discard(job_id)
+            queue_seconds = now - self._enqueued_at.pop(job_id, now)
+            self._leases[job_id] = Lease(worker_id, host, now + self.lease_seconds, queue_seconds,
+                                         self._estimates.pop(job_id, None))
+            hosts[host] += 1
+            granted.append((job_id, -entry[0]))
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return granted
+
+    def _relay(self, worker_id: str, event: Dict[str, Any]):
+        """Publica en el LogManager un evento de un worker (solo logs y progreso de sus propios trabajos)."""
+        if not isinstance(event, dict) or event.get("type") not in (LOG, PROGRESS):
+            return
+        job_id = event.get("job_id")
+        if job_id is not None:
+            lease = self._leases.get(job_id)
+            if lease is None or lease.worker_id != worker_id:
+                return
+        event["worker_id"] = worker_id
+        if event["type"] == PROGRESS and job_id is not None:
+            log_manager.publish_progress(job_id, event)
+        else:
+            log_manager.publish(event)
+
+    async def _reap_leases(self):
+        """Devuelve a la cola los trabajos de workers que dejaron de sondear."""
+        while True:
+            await asyncio.sleep(max(self.lease_seconds / 4, 0.5))
+            now = time.time()
+            for job_id, lease in list(self._leases.items()):
+                if lease.expires_at > now or self._leases.get(job_id) is not lease:
+                    continue
+                del self._leases[job_id]
+                # Una parada pendiente se aplica directamente; si no, el trabajo se reintenta
+                target = lease.stop_reason or QUEUED
+                try:
+                    job = await asyncio.to_thread(
+                        self._update, job_id, state=target, worker_id=None, lease_expires_at=None,
+                        finished_at=time.time() if target == CANCELLED else None)
+                except Exception as e:
+                    print(f"Error al liberar el trabajo {job_id} del worker {lease.worker_id}: {e}")
+                    continue
+                if target == QUEUED and not self._stopping:
+                    self._enqueue(job_id, job.priority, job.host, lease.estimate or job.estimated_size)
+                elif target != QUEUED:
+                    self._release_key(job.dedup_key, job_id)
+                self._publish_state(job_id, target, f"[job {job_id}] El worker {lease.worker_id} dejó de "
+                                    f"responder: {'de vuelta a la cola' if target == QUEUED else target}",
+                                    level="warning")
+            for worker_id, last_seen in list(self._workers.items()):
+                if now - last_seen > 10 * self.lease_seconds:
+                    del self._workers[worker_id]
+            self._pump()
+
+    # --- Planificación --------------------------------------------------------
+
+    async def _stop(self, job_id: int, target: str, allowed: Tuple[str, ...]) -> DownloadJob:
+        job = await self._require(job_id)
+        if job.state not in allowed:
+            raise JobStateError(f"No se puede pasar de '{job.state}' a '{target}'")
+
+        running = self._running.get(job_id)
+        if running is not None:
+            # El hilo de descarga se detendrá en el próximo progress_hook; _run fija el estado final
+            running[1].request_stop(target)
+            return job
+        if job_id in self._tasks:
+            # Descarga ya terminada (post-procesando o cerrando): la base de datos puede decir
+            # 'running' todavía, pero _run fijará el estado final y no se puede detener
+            raise JobStateError(f"El trabajo {job_id} ya terminó de descargarse: no se puede pasar a '{target}'")
+        lease = self._leases.get(job_id)
+        if lease is not None:
+            # Se entrega al worker en su próximo sondeo; worker_finish fija el estado final
+            lease.stop_reason = target
+            return job
+
+        timer = self._retry_timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._queued.pop(job_id, None)
+        self._enqueued_at.pop(job_id, None)
+        self._estimates.pop(job_id, None)
+        self._waiting_space.discard(job_id)
+        self._release_key(job.dedup_key, job_id)
+        finished_at = time.time() if target == CANCELLED else None
+        job = await asyncio.to_thread(self._update, job_id, state=target, finished_at=finished_at)
+        self._publish_state(job_id, target, f"[job {job_id}] Estado: {target}")
+        return job
+
+    def _claim_key(self, key: Optional[str], job_id: int):
+        if key:
+            future = self._loop.create_future()
+            future.set_result(job_id)
+            self._active_keys[key] = future
+
+    def _release_key(self, key: Optional[str], job_id: int):
+        future = self._active_keys.get(key) if key else None
+        if future is not None and future.done() and future.exception() is None and future.result() == job_id:
+            del self._active_keys[key]
+
+    def _enqueue(self, job_id: int, priority: int, host: str, estimate: Optional[int] = None):
+        self._queued[job_id] = host
+        self._enqueued_at[job_id] = time.time()
+        if estimate is not None:
+            self._estimates[job_id] = estimate
+        heapq.heappush(self._heap, (-priority, next(self._seq), job_id))
+
+    def _pump(self):
+        """Arranca trabajos de la cola mientras haya cupo global, por host y espacio en disco."""
+        if self._stopping or not self.local:
+            return
+        skipped, waiting, evaluated = [], set(), set()
+        while self._heap and len(self._running) < self.max_concurrent:
+            entry = heapq.heappop(self._heap)
+            job_id = entry[2]
+            host = self._queued.get(job_id)
+            if host is None:
+                continue  # Entrada obsoleta (cancelada o pausada mientras esperaba)
+            evaluated.add(job_id)
+            if self._host_counts[host] >= self.max_per_host:
+                skipped.append(entry)
+                continue
+            control = DownloadControl(job_id)
+            estimate = self._estimates.get(job_id)
+            if estimate is not None:
+                try:
+                    # Sin expulsar archivos (bloquearía el event loop): eso lo hace el hilo de descarga.
+                    # Se vuelve a comprobar en cada _pump: la espera se cuenta una vez, al empezar
+                    admitted = disk_space.reserve(job_id, estimate, lambda c=control: c.bytes_downloaded,
+                                                  evict=False, count_held=False)
+                except InsufficientSpace as e:
+                    self._reject(job_id, str(e))
+                    continue
+                if not admitted and not disk_space.fits(estimate, job_id):
+                    skipped.append(entry)
+                    waiting.add(job_id)
+                    continue
+            del self._queued[job_id]
+            self._estimates.pop(job_id, None)
+            queue_seconds = time.time() - self._enqueued_at.pop(job_id, time.time())
+            self._running[job_id] = (host, control)
+            self._host_counts[host] += 1
+            self._tasks[job_id] = asyncio.ensure_future(self._run(job_id, control, queue_seconds))
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+        for job_id in waiting - self._waiting_space:
+            disk_space.held()
+            self._publish_state(job_id, QUEUED, f"[job {job_id}] Esperando espacio en disco "
+                                f"({self._estimates[job_id] / (1024 * 1024):.1f} MB)", waiting_space=True)
+        # Los que no se evaluaron (se llenó el cupo antes) conservan su marca
+        self._waiting_space = waiting | {j for j in self._waiting_space if j in self._queued and j not in evaluated}
+        if self._waiting_space and self._recheck is None:
+            self._recheck = self._loop.call_later(_SPACE_RECHECK, self._recheck_space)
+
+    def _recheck_space(self):
+        self._recheck = None
+        self._pump()
+
+    def _reject(self, job_id: int, error: str):
+        """Falla un trabajo en cola que no cabría nunca en disco (desde _pump, sin awaits)."""
+        del self._queued[job_id]
+        self._enqueued_at.pop(job_id, None)
+        self._estimates.pop(job_id, None)
+
+        async def reject():
+            try:
+                job = await asyncio.to_thread(self._update, job_id, state=FAILED, error=error, finished_at=time.time())
+                self._release_key(job.dedup_key, job_id)
+                JOBS_FINISHED.inc(state=FAILED, kind=job_kind(job))
+                self._publish_state(job_id, FAILED, f"[job {job_id}] Estado: {FAILED} ({error})", level="error", error=error)
+            finally:
+                self._tasks.pop(job_id, None)
+        self._tasks[job_id] = asyncio.ensure_future(reject())
+
+    async def _run(self, job_id: int, control: DownloadControl, queue_seconds: float):
+        state, error, job, pending, final_files = COMPLETED, None, None, None, []
+        download_started = time.monotonic()
+        try:
+            job = await asyncio.to_thread(self._update, job_id, state=RUNNING, started_at=time.time(), error=None)
+            self._publish_state(job_id, RUNNING, f"[job {job_id}] Iniciando: {job.title}", title=job.title)
+            control.file_tag = file_tag(job.dedup_key)
+            pending = await self._loop.run_in_executor(
+                self._pool, self.service.download_stage,
+                job.url, job.format, job.subtitles, job.options, control,
+            )
+        except yt_dlp.utils.DownloadCancelled:
+            state = control.stop_reason or CANCELLED
+        except InsufficientSpace as e:
+            # No cabe ahora: vuelve a la cola y espera sitio; si no cabría nunca, falla
+            state, error = (QUEUED, None) if e.fits_ever else (FAILED, str(e))
+        except Exception as e:
+            state, error = FAILED, str(e)
+        finally:
+            host, _ = self._running.pop(job_id)
+            self._host_counts[host] -= 1
+            if self._host_counts[host] <= 0:
+                del self._host_counts[host]
+        download_stage_seconds = time.monotonic() - download_started
+
+        postprocess_seconds = 0.0
+        try:
+            if pending is not None:
+                # El cupo de descarga ya está libre: el siguiente trabajo arranca mientras este se post-procesa
+                self._pump()
+                self._postprocessing[job_id] = control
+                postprocess_started = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._update, job_id, state=POSTPROCESSING)
+                    self._publish_state(job_id, POSTPROCESSING, f"[job {job_id}] Post-procesando: {job.title}")
+                    final_files = await self._loop.run_in_executor(
+                        self._pp_pool, self.service.postprocess_stage, pending, job.url, control)
+                except Exception as e:
+                    state, error = FAILED, str(e)
+                finally:
+                    self._postprocessing.pop(job_id, None)
+                    postprocess_seconds = time.monotonic() - postprocess_started
+
+            if state == CANCELLED:
+                self._remove_temp_files(control)
+            state = await self._finish_run(job_id, job, state, error, final_files, RunStats(
+                bytes_downloaded=control.bytes_downloaded, download_seconds=control.download_seconds,
+                estimated_size=control.estimated_size, queue_seconds=queue_seconds,
+                download_stage_seconds=download_stage_seconds, postprocess_seconds=postprocess_seconds,
+                postprocessed=pending is not None, full_size=control.full_size,
+            ), requeue=control.stop_reason is None)
+        finally:
+            if state != QUEUED and job is not None:
+                self._release_key(job.dedup_key, job_id)
+            disk_space.release(job_id)
+            self._tasks.pop(job_id, None)
+            self._pump()
+
+    async def _finish_run(self, job_id: int, job: Optional[DownloadJob], state: str, error: Optional[str],
+                          final_files: List[str], stats: RunStats, requeue: bool, **fields) -> str:
+        """
+        Cierre común de una ejecución local (_run) o de un worker (worker_finish):
+        indexa el archivo, guarda estado y totales y publica el estado final. Con
+        `requeue`, un trabajo que vuelve a 'queued' (sin espacio) se encola de nuevo
+        y uno que falló por una causa transitoria se reintenta tras un backoff.
+        Devuelve el estado final guardado.
+        """
+        stored, output = None, {}
+        reason = classify_error(error) if state == FAILED else None
+        retry = (reason in RETRYABLE and requeue and not self._stopping and job is not None
+                 and (job.attempts or 0) < settings.JOB_MAX_RETRIES)
+        if retry:
+            state = QUEUED
+            fields["attempts"] = (job.attempts or 0) + 1
+        if state == COMPLETED and job is not None and job.dedup_key and len(final_files) == 1:
+            # Indexado antes de publicar 'completed': las próximas solicitudes ya lo encuentran
+            stored = await download_store.record(job.dedup_key, final_files[0], job.format, job.url, job_id)
+        if state == COMPLETED and final_files:
+            output["output_path"] = download_store.relative_path(final_files[0])
+        finished_at = time.time() if state in (COMPLETED, FAILED, CANCELLED) else None
+        totals = {
+            "bytes_downloaded": stats.bytes_downloaded,
+            "download_seconds": stats.download_seconds,
+            "queue_seconds": stats.queue_seconds,
+            "download_stage_seconds": stats.download_stage_seconds,
+            "postprocess_seconds": stats.postprocess_seconds,
+        }
+        if job is not None:
+            # Acumulado entre ejecuciones (pausa/reanudación)
+            totals = {name: (getattr(job, name) or 0) + value for name, value in totals.items()}
+        if stats.estimated_size is not None:
+            output["estimated_size"] = stats.estimated_size
+        if stats.full_size is not None:
+            output["full_size"] = stats.full_size
+        await asyncio.to_thread(self._update, job_id, state=state, error=error, error_reason=reason,
+                                finished_at=finished_at, **output, **totals, **fields)
+        if retry:
+            self._schedule_retry(job, fields["attempts"], reason, error, stats.estimated_size)
+            return state
+        if state in (QUEUED, PAUSED):
+            # Vuelve a la cola o se reanudará, no ha terminado: sin métricas ni totales de trabajos
+            # finalizados (los tiempos de esta ejecución ya quedan acumulados en el trabajo)
+            if state == PAUSED:
+                self._publish_state(job_id, PAUSED, f"[job {job_id}] Estado: {PAUSED}",
+                                    bytes_downloaded=stats.bytes_downloaded)
+            elif requeue and not self._stopping and job is not None:
+                # Sin espacio (o worker detenido): de vuelta a la cola con el tamaño ya conocido; _pump lo retiene hasta que quepa
+                self._enqueue(job_id, job.priority, job.host, stats.estimated_size)
+            return state
+        timings = {
+            "queue": round(stats.queue_seconds, 3),
+            "download": round(stats.download_stage_seconds, 3),
+            "postprocess": round(stats.postprocess_seconds, 3),
+        }
+        kind = job_kind(job)
+        for stage, seconds in timings.items():
+            if stage != "postprocess" or stats.postprocessed:
+                JOB_STAGE_SECONDS.observe(seconds, stage=stage, kind=kind)
+        JOBS_FINISHED.inc(state=state, kind=kind)
+        JOB_BYTES.inc(stats.bytes_downloaded, kind=kind)
+        if stats.download_seconds > 0:
+            JOB_SPEED.observe(stats.avg_speed, kind=kind)
+        totals = self._throughput[kind]
+        totals[state] += 1
+        totals["bytes"] += stats.bytes_downloaded
+        totals["download_seconds"] += stats.download_seconds
+        saved = None
+        if state == COMPLETED:
+            totals["download_stage_seconds"] += stats.download_stage_seconds
+            totals["postprocess_seconds"] += stats.postprocess_seconds
+            if stats.full_size:
+                saved = max(stats.full_size - stats.bytes_downloaded, 0)
+                totals["bytes_saved"] += saved
+                CLIP_BYTES_SAVED.inc(saved)
+        speed = f", {stats.avg_speed / (1024 * 1024):.2f} MB/s" if stats.bytes_downloaded else ""
+        if saved is not None:
+            speed += (f", tramo de {stats.bytes_downloaded / (1024 * 1024):.1f} MB "
+                      f"(ahorrados {saved / (1024 * 1024):.1f} MB de {stats.full_size / (1024 * 1024):.1f} MB)")
+        stages = f" [cola {stats.queue_seconds:.1f}s, descarga {stats.download_stage_seconds:.1f}s, post {stats.postprocess_seconds:.1f}s]"
+        self._publish_state(
+            job_id, state, f"[job {job_id}] Estado: {state}" + (f" ({error})" if error else "") + speed + stages,
+            level="error" if state == FAILED else "success" if state == COMPLETED else "info",
+            error=error, bytes_downloaded=stats.bytes_downloaded, avg_speed=round(stats.avg_speed),
+            timings=timings, path=stored.path if stored else None,
+            file_url=file_url(job_id) if output.get("output_path") else None,
+            error_reason=reason, bytes_saved=saved,
+        )
+        return state
+
+    def _schedule_retry(self, job: DownloadJob, attempt: int, reason: str, error: Optional[str],
+                        estimate: Optional[int]):
+        """Vuelve a encolar un trabajo fallido tras un backoff (nunca antes de que su host deje de estar penalizado)."""
+        delay = max(backoff_delay(attempt, settings.JOB_RETRY_BACKOFF, settings.JOB_RETRY_BACKOFF_MAX),
+                    request_governor.blocked_for(job.host))
+
+        def requeue():
+            if self._retry_timers.pop(job.id, None) is not None and not self._stopping:
+                self._enqueue(job.id, job.priority, job.host, estimate)
+                self._pump()
+
+        self._retry_timers[job.id] = self._loop.call_later(delay, requeue)
+        JOB_RETRIES.inc(reason=reason)
+        self._publish_state(job.id, QUEUED, f"[job {job.id}] Reintento {attempt}/{settings.JOB_MAX_RETRIES} "
+                            f"en {delay:.0f}s ({reason}: {error})", level="warning", error=error,
+                            error_reason=reason, retry_in=round(delay, 1), attempt=attempt)
+
+    @staticmethod
+    def _publish_state(job_id: int, state: str, message: str, level: str = "info", **fields):
+        log_manager.publish(make_event(STATE, message, job_id=job_id, level=level, state=state, **fields))
+
+    @staticmethod
+    def _remove_temp_files(control: DownloadControl):
+        for path in control.temp_files:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # --- Acceso a base de datos (en hilos) -----------------------------------
+
+    async def _require(self, job_id: int) -> DownloadJob:
+        job = await self.get_job(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    @staticmethod
+    def _insert(jobs: List[DownloadJob]) -> List[DownloadJob]:
+        with SessionLocal() as db:
+            db.add_all(jobs)
+            db.commit()
+            return jobs
+
+    @staticmethod
+    def _get(job_id: int) -> Optional[DownloadJob]:
+        with SessionLocal() as db:
+            return db.get(DownloadJob, job_id)
+
+    @staticmethod
+    def _update(job_id: int, **fields) -> DownloadJob:
+        with SessionLocal() as db:
+            job = db.get(DownloadJob, job_id)
+            for name, value in fields.items():
+                setattr(job, name, value)
+            db.commit()
+            return job
+
+    @staticmethod
+    def _select(state: Optional[str], limit: int) -> List[DownloadJob]:
+        with SessionLocal() as db:
+            query = select(DownloadJob).order_by(DownloadJob.id.desc()).limit(limit)
+            if state:
+                query = query.where(DownloadJob.state == state)
+            return list(db.scalars(query))
+
+    @staticmethod
+    def _apply_leases(worker_id: str, granted: Dict[int, float], renew: Dict[int, float], postprocessing: List[int],
+                      now: float) -> List[DownloadJob]:
+        """Registra en una sola transacción los trabajos cedidos, los leases renovados y los cambios de fase."""
+        with SessionLocal() as db:
+            rows = []
+            for job_id, expires_at in granted.items():
+                job = db.get(DownloadJob, job_id)
+                job.state, job.started_at, job.error = RUNNING, now, None
+                job.worker_id, job.lease_expires_at = worker_id, expires_at
+                rows.append(job)
+            for job_id, expires_at in renew.items():
+                db.get(DownloadJob, job_id).lease_expires_at = expires_at
+            for job_id in postprocessing:
+                db.get(DownloadJob, job_id).state = POSTPROCESSING
+            db.commit()
+            return rows
+
+    @staticmethod
+    def _recover() -> Tuple[List[Tuple[int, int, str, Optional[str], Optional[int]]],
+                            List[Tuple[int, str, str, Optional[str], float, str]]]:
+        """
+        Trabajos activos al arrancar: los de un worker con lease vigente siguen
+        cedidos a él; el resto (incluidos los que descargaba este proceso) vuelve a la cola.
+        """
+        now = time.time()
+        with SessionLocal() as db:
+            jobs = list(db.scalars(
+                select(DownloadJob).where(DownloadJob.state.in_(ACTIVE_STATES)).order_by(DownloadJob.id)
+            ))
+            pending, leased = [], []
+            for job in jobs:
+                if job.state != QUEUED and job.worker_id and (job.lease_expires_at or 0) > now:
+                    leased.append((job.id, job.worker_id, job.host, job.dedup_key, job.lease_expires_at, job.state))
+                    continue
+                job.state, job.worker_id, job.lease_expires_at = QUEUED, None, None
+                pending.append((job.id, job.priority, job.host, job.dedup_key, job.estimated_size))
+            db.commit()
+            return pending, leased
+
+
+job_scheduler = JobScheduler(
+    YtDlpService(),
+    max_concurrent=settings.MAX_CONCURRENT_DOWNLOADS,
+    max_per_host=settings.MAX_DOWNLOADS_PER_HOST,
+    postprocess_workers=settings.POSTPROCESS_WORKERS,
+    local=settings.LOCAL_DOWNLOADS,
+    lease_seconds=settings.WORKER_LEASE_SECONDS,
+)
+metrics.gauge("jobs", "Trabajos en cola, descargando o post-procesando", ["state"]).set_function(job_scheduler.state_counts)
@@ -1,5 +1,7 @@
+import asyncio
 import sys
 import os
+from contextlib import asynccontextmanager
 
 # Borramos el hack de sys.path ya que usaremos imports relativos y el launcher maneja el root
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -8,12 +10,19 @@ from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from .core.log_manager import log_manager
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-import webbrowser
-from threading import Timer
+from fastapi.responses import HTMLResponse, PlainTextResponse
 
 # Imports relativos (Mejor para paquete empaquetado)
-from .core.config import settings
+from .core.config import settings, ensure_download_dir
+from .core.database import init_db
+from .core.executor import extraction_executor
+from .core.ydl_pool import extraction_ydl_pool
+from .core.metrics import metrics, loop_lag_monitor
+from .jobs import job_scheduler
+from .batch import batch_registry
+from .subscriptions import subscription_poller
+from .services import YtDlpService, AUDIO_PROFILES
+from .store import download_store
 from .api.endpoints import router as api_router
 
 # Función para obtener rutas correctas ya sea en dev o en exe (PyInstaller)
@@ -32,8 +41,49 @@ def get_resource_path(relative_path):
         
     return os.path.join(os.path.dirname(__file__), relative_path)
 
+async def _warm_up():
+    """Importa yt-dlp en un hilo mientras el servidor ya atiende solicitudes."""
+    seconds = await asyncio.to_thread(YtDlpService.warm_up)
+    print(f"yt-dlp cargado en {seconds:.2f}s")
+
+
+async def _maintain_store():
+    """Revisa el índice contra el disco y, si hay retención configurada, la aplica periódicamente."""
+    result = await download_store.reconcile()
+    print(f"Índice de descargas revisado: {result}")
+    max_age = settings.STORAGE_RETENTION_DAYS * 86400 or None
+    max_bytes = settings.STORAGE_MAX_BYTES if settings.STORAGE_EVICT and settings.STORAGE_MAX_BYTES else None
+    while max_age or max_bytes:
+        await download_store.enforce_retention(max_age, max_bytes)
+        await asyncio.sleep(settings.STORAGE_RETENTION_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y apagado ordenado de los recursos compartidos."""
+    ensure_download_dir()
+    init_db()
+    log_manager.start()
+    loop_lag_monitor.start()
+    await job_scheduler.start()
+    if settings.SUBSCRIPTIONS_ENABLED:
+        await subscription_poller.start()
+    # Revisión incremental del índice de descargas contra el disco y retención, en segundo plano
+    maintenance = asyncio.ensure_future(_maintain_store())
+    # yt-dlp no se importa al arrancar: se carga aquí, sin bloquear el arranque
+    warm_up = asyncio.ensure_future(_warm_up())
+    yield
+    warm_up.cancel()
+    maintenance.cancel()
+    await subscription_poller.stop()
+    await job_scheduler.stop()
+    loop_lag_monitor.stop()
+    await batch_registry.shutdown()
+    extraction_executor.shutdown()
+    extraction_ydl_pool.close_all()
+
 # Inicialización de la aplicación FastAPI
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION, lifespan=lifespan)
 
 # Montar estáticos usando la función de ruta segura
 # NOTA: Como main.py está dentro de app/, dirname(__file__) es .../app/
@@ -57,16 +107,39 @@ templates = Jinja2Templates(directory=templates_dir)
 # Incluir Rutas
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return PlainTextResponse(metrics.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _csv_param(value):
+    """Convierte '1,2,3' en una lista; None si el parámetro no se envió."""
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 @app.websocket("/ws/logs/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    """
+    Flujo de eventos JSON (log, progress, state).
+    Filtros opcionales: ?jobs=1,2&topics=progress,state. El cliente puede cambiar
+    la suscripción enviando {"action": "subscribe" | "unsubscribe", "jobs": [...], "topics": [...]}.
+    """
     print(f"WS Connection request from {client_id}")
-    await log_manager.connect(websocket)
+    params = websocket.query_params
+    jobs = _csv_param(params.get("jobs"))
+    try:
+        jobs = [int(job_id) for job_id in jobs] if jobs is not None else None
+    except ValueError:
+        jobs = None
+    await log_manager.connect(websocket, client_id, jobs=jobs, topics=_csv_param(params.get("topics")))
     print(f"WS Connected {client_id}")
     try:
         while True:
-            # Mantener conexión viva, aunque solo enviamos info (server->client)
-            # Podríamos esperar mensajes del cliente si fuera necesario
-            await websocket.receive_text()
+            # Mensajes de control del cliente (cambios de suscripción)
+            log_manager.handle_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         print(f"WS Disconnected {client_id}")
         log_manager.disconnect(websocket)
@@ -86,7 +159,8 @@ async def read_root(request: Request):
     Returns:
         HTMLResponse: Renderiza el archivo 'index.html' con el contexto dado.
     """
-    return templates.TemplateResponse("index.html", {"request": request, "title": settings.PROJECT_NAME})
+    return templates.TemplateResponse("index.html", {"request": request, "title": settings.PROJECT_NAME, "settings": settings,
+                                                     "audio_profiles": AUDIO_PROFILES})
 
 # El bloque if __name__ == "__main__" se ha movido a launcher.py en la raíz
 # para evitar problemas de imports con PyInstaller.
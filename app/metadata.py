@@ -0,0 +1,172 @@
+import json
+import sys
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from .schemas import BatchEntry, SubtitleInfo, VideoFormat, VideoInfo
+
+# Representación interna de los metadatos (caché, vista previa, lotes, suscripciones).
+# Tuplas con nombre en lugar de modelos pydantic: sin __dict__ ni validación por
+# objeto, y las cadenas que se repiten entre formatos y videos (ext, codecs,
+# idiomas, nombres de subtítulos) se guardan una sola vez con sys.intern.
+# Los modelos de app/schemas.py quedan para la frontera: lo que se lee de disco
+# o de un cliente se valida con ellos y se convierte con from_schema/to_schema.
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+def _duration_str(seconds: int) -> str:
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    if h > 0:
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m}:{s:02d}"
+
+
+class Format(NamedTuple):
+    """Opción de formato de descarga (ver VideoFormat); incluye codecs para usuarios avanzados."""
+    format_id: str
+    ext: str
+    resolution: Optional[str] = "N/A"
+    fps: Optional[float] = None
+    filesize: Optional[int] = None
+    filesize_approx: bool = False  # Estimado (filesize_approx o bitrate × duración)
+    protocol: Optional[str] = None
+    vcodec: Optional[str] = None   # Codec de Video (ej: avc1, vp9)
+    acodec: Optional[str] = None   # Codec de Audio (ej: mp4a, opus)
+    note: Optional[str] = None
+
+    @classmethod
+    def from_rung(cls, rung) -> "Format":
+        """A partir de un peldaño de FormatLadder (app/formats.py)."""
+        f = rung.raw
+        return cls(
+            format_id=_intern(rung.format_id),
+            ext=_intern(rung.ext),
+            resolution=_intern(f.get('resolution') or 'N/A'),
+            fps=f.get('fps'),
+            filesize=rung.size,
+            filesize_approx=rung.size_approx,
+            protocol=_intern(rung.protocol),
+            vcodec=_intern(f.get('vcodec', 'none')),
+            acodec=_intern(f.get('acodec', 'none')),
+            note=_intern(f.get('format_note', '')),
+        )
+
+    @classmethod
+    def from_schema(cls, fmt: VideoFormat) -> "Format":
+        return cls(*(_intern(getattr(fmt, name)) for name in cls._fields))
+
+    def to_schema(self) -> VideoFormat:
+        return VideoFormat(**self._asdict())
+
+    @property
+    def filesize_mb(self) -> str:
+        if self.filesize:
+            return f"{'~' if self.filesize_approx else ''}{self.filesize / (1024 * 1024):.1f} MB"
+        return "N/A"
+
+    @property
+    def codec_summary(self) -> str:
+        """Resumen corto de codecs para la UI"""
+        v = self.vcodec if self.vcodec and self.vcodec != 'none' else None
+        a = self.acodec if self.acodec and self.acodec != 'none' else None
+        if v and a: return f"{v} + {a}"
+        if v: return f"{v} (Video)"
+        if a: return f"{a} (Audio)"
+        return "Unknown"
+
+
+class Subtitle(NamedTuple):
+    """Subtítulo disponible. Un video popular tiene cientos (subtítulos automáticos)."""
+    lang: str
+    name: str
+    ext: str
+
+    @classmethod
+    def create(cls, lang: str, name: str, ext: str) -> "Subtitle":
+        return cls(_intern(lang), _intern(name), _intern(ext))
+
+    @classmethod
+    def from_schema(cls, sub: SubtitleInfo) -> "Subtitle":
+        return cls.create(sub.lang, sub.name, sub.ext)
+
+    def to_schema(self) -> SubtitleInfo:
+        return SubtitleInfo(**self._asdict())
+
+
+class Video(NamedTuple):
+    """Metadatos de un video para la vista previa y la caché de metadatos (ver VideoInfo)."""
+    id: str
+    url: str
+    title: str
+    thumbnail: str
+    duration: int
+    uploader: str
+    video_formats: Tuple[Format, ...] = ()
+    audio_formats: Tuple[Format, ...] = ()
+    subtitles: Tuple[Subtitle, ...] = ()
+
+    @property
+    def duration_str(self) -> str:
+        return _duration_str(self.duration)
+
+    @classmethod
+    def from_schema(cls, info: VideoInfo) -> "Video":
+        return cls(
+            id=info.id,
+            url=info.url,
+            title=info.title,
+            thumbnail=info.thumbnail,
+            duration=info.duration,
+            uploader=_intern(info.uploader),
+            video_formats=tuple(Format.from_schema(f) for f in info.video_formats),
+            audio_formats=tuple(Format.from_schema(f) for f in info.audio_formats),
+            subtitles=tuple(Subtitle.from_schema(s) for s in info.subtitles),
+        )
+
+    def to_schema(self) -> VideoInfo:
+        return VideoInfo(
+            **self._asdict() | {
+                "video_formats": [f.to_schema() for f in self.video_formats],
+                "audio_formats": [f.to_schema() for f in self.audio_formats],
+                "subtitles": [s.to_schema() for s in self.subtitles],
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "Video":
+        """Desde el JSON de la caché en disco, validado con VideoInfo."""
+        return cls.from_schema(VideoInfo.model_validate_json(data))
+
+    def to_json(self) -> str:
+        """JSON compatible con VideoInfo, sin construir los modelos pydantic."""
+        data: Dict[str, Any] = self._asdict()
+        for key in ("video_formats", "audio_formats", "subtitles"):
+            data[key] = [item._asdict() for item in data[key]]
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class Entry(NamedTuple):
+    """
+    Entrada de una playlist/canal obtenida con extracción plana (ver BatchEntry).
+    Solo datos baratos; los formatos se resuelven cuando arranca el trabajo.
+    """
+    id: str
+    url: str
+    title: str
+    duration: int = 0
+    uploader: Optional[str] = None
+    thumbnail: Optional[str] = None
+
+    @property
+    def duration_str(self) -> str:
+        return _duration_str(self.duration) if self.duration else "--:--"
+
+    @classmethod
+    def from_schema(cls, entry: BatchEntry) -> "Entry":
+        return cls(entry.id, entry.url, entry.title, entry.duration, _intern(entry.uploader), entry.thumbnail)
+
+    def to_schema(self) -> BatchEntry:
+        return BatchEntry(**self._asdict())
@@ -0,0 +1,116 @@
+from typing import Optional
+
+from sqlalchemy import JSON, Boolean, Float, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .core.database import Base
+
+
+class CachedVideoInfo(Base):
+    """
+    Nivel en disco de la caché de metadatos.
+    Guarda el VideoInfo serializado en JSON, indexado por la clave canónica del video.
+    """
+    __tablename__ = "video_info_cache"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    data: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[float] = mapped_column(Float, index=True)
+
+
+class DownloadJob(Base):
+    """
+    Trabajo de descarga persistente. Sobrevive a reinicios: los trabajos
+    'queued' o 'running' se vuelven a encolar al arrancar.
+    """
+    __tablename__ = "download_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    url: Mapped[str] = mapped_column(String)
+    title: Mapped[str] = mapped_column(String, default="")
+    format: Mapped[str] = mapped_column(String)
+    subtitles: Mapped[list] = mapped_column(JSON, default=list)
+    options: Mapped[dict] = mapped_column(JSON, default=dict)
+    host: Mapped[str] = mapped_column(String, default="")
+    priority: Mapped[int] = mapped_column(Integer, default=0)
+
+    # queued | running | postprocessing | paused | completed | failed | cancelled
+    state: Mapped[str] = mapped_column(String, default="queued", index=True)
+    # Video + formato + opciones de salida (ver app/store.py); mismo valor = mismo archivo final
+    dedup_key: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Motivo clasificado del último fallo (rate_limited, throttled, network...; ver app/core/governor.py)
+    error_reason: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Reintentos automáticos tras fallos transitorios (se pone a 0 al reanudarlo a mano)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # Archivo final (relativo a DOWNLOAD_DIR) una vez completado; lo sirve /files/{id}
+    output_path: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Worker externo que lo está descargando (worker.py) y hasta cuándo vale su lease
+    worker_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    lease_expires_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # Espacio en disco que necesita (estimado al enviarlo o en la primera ejecución, ver app/core/diskspace.py)
+    estimated_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Tamaño del video completo cuando solo se descarga un tramo (options["clip"], ver app/clips.py)
+    full_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    created_at: Mapped[float] = mapped_column(Float)
+    started_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    # Contabilidad de transferencia (se actualiza al terminar cada ejecución)
+    bytes_downloaded: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    download_seconds: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+
+    # Tiempos por etapa del pipeline, acumulados entre ejecuciones (segundos)
+    queue_seconds: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+    download_stage_seconds: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+    postprocess_seconds: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+
+
+class StoredFile(Base):
+    """
+    Índice de descargas completadas (ver app/store.py). Una fila por archivo final,
+    indexada por la clave de deduplicación: video + selección de formato + opciones
+    de post-procesado. La ruta es relativa a DOWNLOAD_DIR.
+    """
+    __tablename__ = "download_index"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    video_key: Mapped[str] = mapped_column(String, index=True)
+    format: Mapped[str] = mapped_column(String)
+    path: Mapped[str] = mapped_column(String, index=True)
+    size: Mapped[int] = mapped_column(Integer)
+    mtime: Mapped[float] = mapped_column(Float)
+    sha256: Mapped[str] = mapped_column(String)
+    url: Mapped[str] = mapped_column(String, default="")
+    job_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[float] = mapped_column(Float)
+    # Último uso (solicitud que lo encontró o envío por /files); orden de la expulsión LRU
+    accessed_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True, index=True)
+
+
+class Subscription(Base):
+    """
+    Canal o playlist vigilado (ver app/subscriptions.py). Cada sondeo hace una
+    extracción plana y compara contra `seen_ids`: solo los videos nuevos se
+    encolan como trabajos de descarga con `format_rule`.
+    """
+    __tablename__ = "subscriptions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    url: Mapped[str] = mapped_column(String, unique=True)
+    title: Mapped[str] = mapped_column(String, default="")
+    format_rule: Mapped[str] = mapped_column(String)  # Regla declarativa (app/formats.py)
+    options: Mapped[dict] = mapped_column(JSON, default=dict)
+    enabled: Mapped[bool] = mapped_column(Boolean, default=True)
+    interval: Mapped[float] = mapped_column(Float)  # Segundos entre sondeos
+    backfill: Mapped[int] = mapped_column(Integer, default=0)  # Videos ya existentes a descargar en el primer sondeo
+
+    # Ids vistos en sondeos anteriores (los más recientes primero, acotado)
+    seen_ids: Mapped[list] = mapped_column(JSON, default=list)
+    next_poll_at: Mapped[float] = mapped_column(Float, index=True)
+    last_polled_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_new: Mapped[int] = mapped_column(Integer, default=0)
+    failures: Mapped[int] = mapped_column(Integer, default=0)  # Errores seguidos (backoff)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[float] = mapped_column(Float)
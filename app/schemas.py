@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+from typing import Any, List, Optional, Dict
 
 class VideoFormat(BaseModel):
     """
@@ -11,26 +11,12 @@ class VideoFormat(BaseModel):
     resolution: Optional[str] = "N/A"
     fps: Optional[float] = None
     filesize: Optional[int] = None
+    filesize_approx: bool = False # Estimado (filesize_approx o bitrate × duración)
+    protocol: Optional[str] = None
     vcodec: Optional[str] = None # Codec de Video (ej: avc1, vp9)
     acodec: Optional[str] = None # Codec de Audio (ej: mp4a, opus)
     note: Optional[str] = None
 
-    @property
-    def filesize_mb(self) -> str:
-        if self.filesize:
-            return f"{self.filesize / (1024 * 1024):.1f} MB"
-        return "N/A"
-    
-    @property
-    def codec_summary(self) -> str:
-        """Resumen corto de codecs para la UI"""
-        v = self.vcodec if self.vcodec and self.vcodec != 'none' else None
-        a = self.acodec if self.acodec and self.acodec != 'none' else None
-        if v and a: return f"{v} + {a}"
-        if v: return f"{v} (Video)"
-        if a: return f"{a} (Audio)"
-        return "Unknown"
-
 class SubtitleInfo(BaseModel):
     """Información sobre un subtítulo disponible"""
     lang: str
@@ -40,6 +26,7 @@ class SubtitleInfo(BaseModel):
 class VideoInfo(BaseModel):
     """
     Información general del video, ahora incluyendo subtítulos y formatos separados.
+    Solo en la frontera (JSON de la caché en disco); en memoria se usa app/metadata.py:Video.
     """
     id: str
     url: str
@@ -50,11 +37,106 @@ class VideoInfo(BaseModel):
     video_formats: List[VideoFormat]
     audio_formats: List[VideoFormat]
     subtitles: List[SubtitleInfo]
-    
+
+
+class BatchEntry(BaseModel):
+    """
+    Entrada de una playlist/canal obtenida con extracción plana.
+    Solo datos baratos; los formatos se resuelven cuando arranca el trabajo.
+    """
+    id: str
+    url: str
+    title: str
+    duration: int = 0
+    uploader: Optional[str] = None
+    thumbnail: Optional[str] = None
+
+
+class JobInfo(BaseModel):
+    """Estado de un trabajo de descarga (ver app/models.py:DownloadJob)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    url: str
+    title: str
+    format: str
+    host: str
+    priority: int
+    state: str
+    error: Optional[str] = None
+    error_reason: Optional[str] = None
+    attempts: int = 0
+    output_path: Optional[str] = None
+    estimated_size: Optional[int] = None
+    full_size: Optional[int] = None
+    worker_id: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    bytes_downloaded: int = 0
+    download_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    download_stage_seconds: float = 0.0
+    postprocess_seconds: float = 0.0
+
+    @computed_field
+    @property
+    def avg_speed(self) -> float:
+        """Velocidad media en bytes/s."""
+        return self.bytes_downloaded / self.download_seconds if self.download_seconds else 0.0
+
+    @computed_field
+    @property
+    def bytes_saved(self) -> Optional[int]:
+        """Bytes no descargados frente al video completo (solo tramos completados)."""
+        if self.full_size is None or self.state != "completed":
+            return None
+        return max(self.full_size - self.bytes_downloaded, 0)
+
+
+class WorkerPoll(BaseModel):
+    """Sondeo de un worker externo (ver app/worker.py y JobScheduler.worker_poll)."""
+    jobs: Dict[int, str] = Field(default_factory=dict)  # Trabajos que sigue ejecutando: job_id -> fase
+    slots: int = 0                                       # Trabajos nuevos que puede aceptar
+    events: List[Dict[str, Any]] = Field(default_factory=list)  # Logs y progreso desde el último sondeo
+
+
+class WorkerResult(BaseModel):
+    """Resultado de un trabajo ejecutado por un worker externo."""
+    state: str
+    error: Optional[str] = None
+    files: List[str] = Field(default_factory=list)  # Rutas relativas a DOWNLOAD_DIR
+    bytes_downloaded: int = 0
+    download_seconds: float = 0.0
+    estimated_size: Optional[int] = None
+    full_size: Optional[int] = None
+    download_stage_seconds: float = 0.0
+    postprocess_seconds: float = 0.0
+    postprocessed: bool = False
+    events: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class SubscriptionInfo(BaseModel):
+    """Canal o playlist vigilado (ver app/models.py:Subscription)."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    url: str
+    title: str
+    format_rule: str
+    enabled: bool
+    interval: float
+    backfill: int
+    next_poll_at: float
+    last_polled_at: Optional[float] = None
+    last_new: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    created_at: float
+    seen_ids: List[str] = Field(default_factory=list, exclude=True)
+
+    @computed_field
     @property
-    def duration_str(self) -> str:
-        m, s = divmod(self.duration, 60)
-        h, m = divmod(m, 60)
-        if h > 0:
-            return f"{h}:{m:02d}:{s:02d}"
-        return f"{m}:{s:02d}"
+    def seen(self) -> int:
+        """Videos ya conocidos (no se vuelven a encolar)."""
+        return len(self.seen_ids)
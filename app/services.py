@@ -1,14 +1,98 @@
-import yt_dlp
-from .schemas import VideoInfo, VideoFormat, SubtitleInfo
+from .metadata import Video, Format, Subtitle, Entry
+from .formats import FormatLadder, estimate_size, is_rule, parse_rule
+from .clips import ClipRange
 from .core.config import settings
-from .core.log_manager import log_manager
-from typing import List, Dict, Any
-import os
+from .core.diskspace import disk_space, InsufficientSpace
+from .core.governor import (request_governor, host_key, classify_error, backoff_delay, Throttled, ThrottleDetector,
+                            OK, THROTTLED)
+from .core.log_manager import log_manager, make_event, LOG, PROGRESS
+from .core.throttle import bandwidth_limiter
+from .core.ydl_pool import extraction_ydl_pool
+from .core.lazy import lazy_module
+from .core.metrics import metrics, SPEED_BUCKETS
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from functools import lru_cache
 import asyncio
+import hashlib
+import itertools
+import os
+import sys
+import time
+import threading
+
+EXTRACTION_SECONDS = metrics.histogram(
+    "extraction_seconds", "Duración de get_video_info (extracción de yt-dlp y procesado de formatos)", ["outcome"])
+DOWNLOAD_BYTES = metrics.counter("download_bytes_total", "Bytes recibidos por las descargas")
+DOWNLOAD_FILE_SECONDS = metrics.histogram("download_file_seconds", "Duración de la descarga de cada archivo")
+DOWNLOAD_FILE_SPEED = metrics.histogram(
+    "download_file_speed_bytes_per_second", "Velocidad media de descarga de cada archivo", buckets=SPEED_BUCKETS)
+# yt-dlp (y su árbol de extractores) se importa en el primer uso o en el
+# calentamiento en segundo plano (warm_up), no al importar la aplicación
+yt_dlp = lazy_module("yt_dlp")
+
+POSTPROCESSOR_SECONDS = metrics.histogram(
+    "postprocessor_seconds", "Duración de cada post-procesador de yt-dlp", ["postprocessor"])
+
+# Organización de DOWNLOAD_DIR (OUTPUT_LAYOUT): con decenas de miles de archivos en
+# un solo directorio listarlo se vuelve lento, así que se reparten en subdirectorios
+OUTPUT_LAYOUTS = {
+    "flat": "%(title)s [%(id)s].%(ext)s",
+    "uploader_date": "%(uploader,channel|Desconocido)s/%(upload_date>%Y-%m|sin-fecha)s/%(title)s [%(id)s].%(ext)s",
+    # Primeros 2 dígitos hex de un hash del id: 256 subdirectorios repartidos de forma uniforme
+    "id_hash": "%(id_hash)s/%(title)s [%(id)s].%(ext)s",
+}
+
+# Opciones cuyo post-procesado reescribe el archivo (durante un momento hay dos copias en disco)
+REWRITE_OPTIONS = ("embed_metadata", "embed_thumbnail", "embed_chapters", "embed_subs", "audio_profile")
+
+# Valor de video_format_id para descargar solo la pista de audio (modo audio)
+AUDIO_ONLY = "audio"
+
+# Caché de YtDlpService.video_key (URL -> clave), la más antigua sale primero
+_VIDEO_KEYS_MAX = 4096
+_video_keys: Dict[str, str] = {}
+_video_keys_lock = threading.Lock()
+
+# Perfiles del modo audio: (etiqueta, códec de FFmpegExtractAudio, calidad en kbps).
+# Si la pista descargada ya está en el códec pedido se copia sin recodificar
+# ("original" nunca recodifica: solo cambia el contenedor, ej. webm -> opus).
+AUDIO_PROFILES: Dict[str, Tuple[str, str, Optional[int]]] = {
+    "original": ("Original (sin recodificar)", "best", None),
+    "mp3-320": ("MP3 320 kbps", "mp3", 320),
+    "mp3-192": ("MP3 192 kbps", "mp3", 192),
+    "opus-160": ("Opus 160 kbps", "opus", 160),
+    "opus-96": ("Opus 96 kbps (voz, podcasts)", "opus", 96),
+    "aac-256": ("AAC (M4A) 256 kbps", "m4a", 256),
+    "flac": ("FLAC (sin pérdida)", "flac", None),
+}
+
+# Codificador y bitrate por defecto al normalizar el volumen de un archivo ya extraído (según su extensión)
+_LOUDNORM_ENCODERS = {
+    "mp3": ("libmp3lame", 192), "m4a": ("aac", 192), "opus": ("libopus", 128),
+    "ogg": ("libvorbis", 160), "flac": ("flac", None), "wav": ("pcm_s16le", None),
+}
+
+
+def output_template(layout: str, clip: Optional[ClipRange] = None, tag: Optional[str] = None) -> str:
+    """
+    Plantilla de yt-dlp (relativa a DOWNLOAD_DIR) para OUTPUT_LAYOUT: un nombre de OUTPUT_LAYOUTS o una plantilla propia.
+    Con `clip`, la etiqueta del tramo va en el nombre (no pisa el video completo ni otros tramos).
+    Con `tag` (ver DownloadControl.file_tag), otros formatos u opciones del mismo video tampoco lo pisan.
+    """
+    template = OUTPUT_LAYOUTS.get(layout) or (layout if "%(" in layout else None)
+    if template is not None:
+        labels = ([clip.file_label] if clip is not None else []) + ([tag] if tag else [])
+        if not labels:
+            return template
+        label = "".join(f" [{text}]" for text in labels).replace("%", "%%")
+        base, ext = (template[:-len(".%(ext)s")], ".%(ext)s") if template.endswith(".%(ext)s") else (template, "")
+        return f"{base}{label}{ext}"
+    raise ValueError(f"OUTPUT_LAYOUT desconocido: '{layout}' (opciones: {', '.join(OUTPUT_LAYOUTS)} o una plantilla de yt-dlp)")
+
 
 class YtDlpLogger:
-    def __init__(self, loop):
-        self.loop = loop
+    def __init__(self, job_id: Optional[int] = None):
+        self.job_id = job_id
 
     def debug(self, msg):
         # Ignoramos mensajes de debug muy verbosos, pero dejamos los útiles
@@ -19,21 +103,175 @@ class YtDlpLogger:
         self._send(msg)
 
     def warning(self, msg):
-        self._send(f"WARNING: {msg}")
+        self._send(f"WARNING: {msg}", "warning")
 
     def error(self, msg):
-        self._send(f"ERROR: {msg}")
+        self._send(f"ERROR: {msg}", "error")
+
+    def _send(self, msg, level="info"):
+        # Publicación desde el hilo de yt-dlp hacia el event loop (no bloquea)
+        log_manager.publish_threadsafe(make_event(LOG, msg, job_id=self.job_id, level=level))
+
+class DownloadControl:
+    """
+    Canal entre el planificador de trabajos y una descarga en curso.
+    Permite detener la descarga desde otro hilo, registra los archivos temporales
+    creados y contabiliza los bytes recibidos (bytes/s por trabajo).
+    """
+    def __init__(self, job_id: Optional[int] = None):
+        self.job_id = job_id
+        self.stop_event = threading.Event()
+        self.stop_reason: Optional[str] = None
+        self.temp_files: set = set()
+
+        # Archivo que se está escribiendo, para seguirlo mientras crece (modo "tee" de /files):
+        # el .part durante la descarga y la ruta final al terminar. `progressive` es False si
+        # lo escrito no será el archivo final (video+audio a combinar, HLS/DASH a remuxear).
+        self.live_path: Optional[str] = None
+        self.progressive: Optional[bool] = None
+        self.download_finished = False
+        # Espacio reservado al elegir los formatos (ver YtDlpService._admit)
+        self.estimated_size: Optional[int] = None
+        # Tamaño de los formatos completos cuando solo se descarga un tramo (bytes ahorrados)
+        self.full_size: Optional[int] = None
+        # Distintivo del archivo final (prefijo de la clave de deduplicación): dos trabajos del
+        # mismo video con otro formato u opciones no escriben en la misma ruta
+        self.file_tag: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._file_bytes: Dict[str, int] = {}
+        self.bytes_downloaded = 0
+        self.first_byte_at: Optional[float] = None
+        self.last_byte_at: Optional[float] = None
+
+    def record_progress(self, filename: str, downloaded: int) -> int:
+        """
+        Registra el total descargado de `filename` según yt-dlp y devuelve los
+        bytes nuevos desde la última llamada (los hooks informan acumulados).
+        """
+        with self._lock:
+            previous = self._file_bytes.get(filename, 0)
+            delta = downloaded - previous if downloaded >= previous else downloaded
+            self._file_bytes[filename] = downloaded
+            if delta > 0:
+                now = time.monotonic()
+                if self.first_byte_at is None:
+                    self.first_byte_at = now
+                self.last_byte_at = now
+                self.bytes_downloaded += delta
+            return delta
+
+    @property
+    def download_seconds(self) -> float:
+        if self.first_byte_at is None:
+            return 0.0
+        return self.last_byte_at - self.first_byte_at
+
+    @property
+    def avg_speed(self) -> float:
+        """Velocidad media en bytes/s desde el primer byte recibido."""
+        seconds = self.download_seconds
+        return self.bytes_downloaded / seconds if seconds > 0 else 0.0
+
+    def request_stop(self, reason: str):
+        self.stop_reason = reason
+        self.stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+class PipelineMixin:
+    """
+    Mezcla para YoutubeDL (ver `pipelined_ydl_class`) que aplaza el post-procesado
+    (merge, metadatos, miniatura, subtítulos incrustados) en lugar de ejecutarlo
+    en el hilo de descarga.
+
+    yt-dlp llama a `post_process` al terminar cada archivo; aquí solo se anota
+    lo necesario y `run_deferred` lo ejecuta después, en el pool de post-procesado.
+    """
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.deferred: List[tuple] = []
+        self.duration: Optional[float] = None
+        # Se llama con el info_dict ya con los formatos elegidos, antes de descargar nada (admisión por espacio)
+        self.admission = None
+
+    def process_video_result(self, info_dict, download=True):
+        # Duración del video en curso: la selección por reglas la usa para estimar tamaños
+        self.duration = info_dict.get('duration')
+        # Campo para la plantilla de salida 'id_hash' (OUTPUT_LAYOUT)
+        info_dict.setdefault('id_hash', hashlib.md5(str(info_dict.get('id')).encode()).hexdigest()[:2])
+        return super().process_video_result(info_dict, download)
+
+    def process_info(self, info_dict):
+        if self.admission is not None:
+            self.admission(info_dict)
+        return super().process_info(info_dict)
+
+    def post_process(self, filename, info, files_to_move=None):
+        info['filepath'] = filename
+        self.deferred.append((filename, info, files_to_move))
+        return info
+
+    def run_deferred(self) -> List[str]:
+        """Ejecuta el post-procesado pendiente y devuelve las rutas de los archivos finales."""
+        final_files = []
+        while self.deferred:
+            filename, info, files_to_move = self.deferred.pop(0)
+            info = super().post_process(filename, info, files_to_move)
+            final_files.append(info.get('filepath') or filename)
+        return final_files
+
+
+@lru_cache(maxsize=None)
+def loudnorm_pp_class() -> type:
+    """
+    Post-procesador de normalización de volumen (filtro loudnorm de FFmpeg), tras
+    extraer el audio. Recodifica con el mismo códec: con el bitrate del perfil o,
+    si el perfil no recodificaba, uno por defecto según la extensión.
+    """
+    FFmpegPostProcessor = yt_dlp.postprocessor.FFmpegPostProcessor
+
+    class LoudnormPP(FFmpegPostProcessor):
+        def __init__(self, downloader=None, target: str = settings.AUDIO_LOUDNORM, bitrate: Optional[int] = None):
+            super().__init__(downloader)
+            self.target = target
+            self.bitrate = bitrate
+
+        def run(self, info):
+            path = info['filepath']
+            encoder, default_bitrate = _LOUDNORM_ENCODERS.get(info.get('ext'), _LOUDNORM_ENCODERS['m4a'])
+            bitrate = self.bitrate or default_bitrate
+            # loudnorm remuestrea a 192 kHz: se vuelve a la frecuencia original (Opus solo admite 48 kHz)
+            rate = 48000 if encoder == 'libopus' else int(info.get('asr') or 48000)
+            opts = ['-map', '0:a', '-af', f'loudnorm={self.target}', '-ar', str(rate), '-acodec', encoder]
+            if bitrate:
+                opts += ['-b:a', f'{bitrate}k']
+            temp = yt_dlp.utils.prepend_extension(path, 'temp')
+            self.to_screen(f'Normalizando volumen de "{path}"')
+            self.run_ffmpeg(path, temp, opts)
+            os.replace(temp, path)
+            return [], info
+
+    return LoudnormPP
+
+
+@lru_cache(maxsize=None)
+def pipelined_ydl_class() -> type:
+    """YoutubeDL con PipelineMixin; la clase se crea en el primer uso para no importar yt-dlp antes."""
+    return type("PipelinedYoutubeDL", (PipelineMixin, yt_dlp.YoutubeDL), {})
 
-    def _send(self, msg):
-        if self.loop and not self.loop.is_closed():
-            # Broadcast asíncrono desde hilo síncrono
-            asyncio.run_coroutine_threadsafe(log_manager.broadcast(msg), self.loop)
 
 class YtDlpService:
     """
     Servicio encargado de interactuar con la librería yt-dlp.
     Encapsula la complejidad de la configuración y extracción de datos.
     """
+
+    # Extractores adicionales, con prioridad sobre los de yt-dlp (ej: el extractor
+    # local de bench/). Deben registrarse antes de crear instancias de YoutubeDL.
+    extra_extractors: List[type] = []
     
     def __init__(self):
         self.common_opts = {
@@ -42,59 +280,276 @@ class YtDlpService:
             'extract_flat': False,
         }
 
-    def get_video_info(self, url: str) -> VideoInfo:
+    @staticmethod
+    def video_key(url: str) -> str:
+        """
+        Clave canónica de un video a partir de su URL, sin acceso a red.
+        Usa el mismo extractor que elegiría yt-dlp: 'youtu.be/x' y
+        'youtube.com/watch?v=x&t=1' producen la misma clave 'Youtube:x'.
+
+        Bloqueante la primera vez por URL (importa yt-dlp y prueba ~1800 extractores,
+        compilando sus expresiones): desde el event loop, usar video_keys_async.
+        """
+        key = _video_keys.get(url)
+        if key is not None:
+            return key
+        key = f"url:{url.strip()}"
+        for ie in [*YtDlpService.extra_extractors, *yt_dlp.extractor.gen_extractor_classes()]:
+            if ie.ie_key() == 'Generic':
+                break
+            if ie.suitable(url):
+                video_id = ie.get_temp_id(url)
+                if video_id:
+                    key = f"{ie.ie_key()}:{video_id}"
+                break
+        with _video_keys_lock:
+            _video_keys[url] = key
+            while len(_video_keys) > _VIDEO_KEYS_MAX:
+                del _video_keys[next(iter(_video_keys))]
+        return key
+
+    @staticmethod
+    def clear_video_keys():
+        """Vacía la caché de video_key (tras cambiar `extra_extractors`)."""
+        with _video_keys_lock:
+            _video_keys.clear()
+
+    @staticmethod
+    async def video_keys_async(urls: List[str]) -> List[str]:
+        """video_key de varias URLs sin bloquear el event loop: las que no están en caché se resuelven en un hilo."""
+        if all(url in _video_keys for url in urls):
+            return [_video_keys[url] for url in urls]
+        return await asyncio.to_thread(lambda: [YtDlpService.video_key(url) for url in urls])
+
+    @staticmethod
+    async def video_key_async(url: str) -> str:
+        return (await YtDlpService.video_keys_async([url]))[0]
+
+    @staticmethod
+    def warm_up() -> float:
+        """
+        Importa yt-dlp y carga las clases de extractores, el coste que si no
+        pagaría la primera solicitud. Se ejecuta en un hilo al arrancar; devuelve los segundos.
+        """
+        started = time.perf_counter()
+        pipelined_ydl_class()
+        yt_dlp.extractor.gen_extractor_classes()
+        return time.perf_counter() - started
+
+    def _new_ydl(self, opts: Dict[str, Any], cls: Optional[type] = None) -> "yt_dlp.YoutubeDL":
+        """Crea la instancia de yt-dlp, registrando `extra_extractors` antes que los predeterminados."""
+        if cls is None:
+            cls = yt_dlp.YoutubeDL
+        if not self.extra_extractors:
+            return cls(opts)
+        ydl = cls(opts, auto_init=False)
+        for ie in self.extra_extractors:
+            ydl.add_info_extractor(ie())
+        ydl.add_default_info_extractors()
+        return ydl
+
+    def _pooled_ydl(self, overlay: Dict[str, Any]):
+        """
+        Instancia de extracción reutilizada del hilo actual (app/core/ydl_pool.py)
+        con `overlay` aplicado sobre `common_opts` durante el bloque `with`.
+        """
+        return extraction_ydl_pool.acquire(lambda: self._new_ydl(self.common_opts), overlay)
+
+    def get_video_info(self, url: str) -> Video:
         """
         Extrae metadatos extendidos: formatos con codecs, subtítulos, etc.
         """
-        opts = {**self.common_opts, 'listsubs': True}
+        started = time.perf_counter()
+        host = host_key(url)
+        request_governor.acquire(host, max_wait=settings.EXTRACT_TIMEOUT)
+        try:
+            with self._pooled_ydl({'listsubs': True}) as ydl:
+                info_dict = ydl.extract_info(url, download=False)
+        except Exception as e:
+            request_governor.record(host, classify_error(e))
+            EXTRACTION_SECONDS.observe(time.perf_counter() - started, outcome="error")
+            raise
+        request_governor.record(host, OK)
+        video_info = self._video(info_dict, url)
+        EXTRACTION_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+        return video_info
+
+    def _video(self, info_dict: Dict[str, Any], url: str) -> Video:
+        """Metadatos compactos (app/metadata.py) a partir del info_dict de yt-dlp."""
+        # Procesar y separar formatos
+        v_formats, a_formats = self._process_formats(info_dict.get('formats') or [], info_dict.get('duration'))
+        processed_subs = self._process_subtitles(info_dict)
         
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-            
-            # Procesar y separar formatos
-            v_formats, a_formats = self._process_formats(info_dict.get('formats', []))
-            processed_subs = self._process_subtitles(info_dict)
-            
-            return VideoInfo(
-                id=info_dict.get('id'),
-                url=info_dict.get('webpage_url', url),
-                title=info_dict.get('title'),
-                thumbnail=info_dict.get('thumbnail'),
-                duration=info_dict.get('duration', 0),
-                uploader=info_dict.get('uploader', 'Unknown'),
-                video_formats=v_formats,
-                audio_formats=a_formats,
-                subtitles=processed_subs
-            )
-
-    def download_video_background(self, url: str, format_id: str, subtitles: List[str] = None, options: Dict[str, Any] = None, loop=None):
-        """
-        Método sincrónico para ser ejecutado en BackgroundTasks.
+        return Video(
+            id=str(info_dict.get('id') or ''),
+            url=info_dict.get('webpage_url', url),
+            title=info_dict.get('title') or info_dict.get('id') or 'Sin título',
+            thumbnail=info_dict.get('thumbnail') or '',
+            duration=int(info_dict.get('duration') or 0),
+            uploader=sys.intern(info_dict.get('uploader') or 'Unknown'),
+            video_formats=v_formats,
+            audio_formats=a_formats,
+            subtitles=processed_subs
+        )
+
+    def iter_entries(self, url: str, limit: Optional[int] = None) -> Iterator[Entry]:
+        """
+        Enumera perezosamente los videos de una URL (video suelto, playlist o canal)
+        con extracción plana: solo id/título/duración, sin resolver formatos.
+        Las entradas se producen a medida que yt-dlp pagina la playlist.
+        """
+        overlay = {
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'playlistend': limit,
+        }
+        host = host_key(url)
+        request_governor.acquire(host, max_wait=settings.EXTRACT_TIMEOUT)
+        with self._pooled_ydl(overlay) as ydl:
+            try:
+                info = ydl.extract_info(url, download=False, process=False)
+                # Seguir redirecciones (ej: canal -> pestaña de videos) sin procesar entradas
+                for _ in range(5):
+                    if info.get('_type') not in ('url', 'url_transparent'):
+                        break
+                    info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+            except Exception as e:
+                request_governor.record(host, classify_error(e))
+                raise
+            request_governor.record(host, OK)
+
+            if info.get('_type') != 'playlist':
+                yield self._batch_entry(info, url)
+                return
+
+            for _, entry in yt_dlp.utils.PlaylistEntries(ydl, info).get_requested_items():
+                if entry:
+                    yield self._batch_entry(entry)
+
+    @staticmethod
+    def _batch_entry(entry: Dict[str, Any], fallback_url: str = None) -> Entry:
+        thumbnails = entry.get('thumbnails') or []
+        # El mismo canal se repite en todas las entradas de un lote: una sola copia
+        uploader = entry.get('uploader') or entry.get('channel')
+        return Entry(
+            id=str(entry.get('id') or ''),
+            url=entry.get('webpage_url') or entry.get('url') or fallback_url,
+            title=entry.get('title') or entry.get('id') or 'Sin título',
+            duration=int(entry.get('duration') or 0),
+            uploader=sys.intern(uploader) if uploader else None,
+            thumbnail=entry.get('thumbnail') or (thumbnails[-1].get('url') if thumbnails else None),
+        )
+
+    def download_video_background(self, url: str, format_id: str, subtitles: List[str] = None, options: Dict[str, Any] = None, control: Optional[DownloadControl] = None):
+        """
+        Descarga y post-procesa en el mismo hilo (sin pipeline); devuelve las rutas finales.
+        El planificador (app/jobs.py) usa las dos etapas por separado.
+        """
+        pending = self.download_stage(url, format_id, subtitles, options, control)
+        if pending is not None:
+            return self.postprocess_stage(pending, url, control)
+        return []
+
+    def download_stage(self, url: str, format_id: str, subtitles: List[str] = None, options: Dict[str, Any] = None, control: Optional[DownloadControl] = None) -> Optional[PipelineMixin]:
+        """
+        Primera etapa: método sincrónico, ejecutado en un hilo de descarga del planificador.
         Realiza la descarga real. format_id puede ser un ID simple o una combinación 'video+audio'.
+
+        Devuelve la instancia de yt-dlp con el post-procesado pendiente (ver
+        `postprocess_stage`), o None si no queda nada por hacer.
+
+        Si `control` se detiene, la descarga se interrumpe lanzando
+        yt_dlp.utils.DownloadCancelled. Cualquier error se propaga al llamador.
+
+        Con `options["clip"]` (ver app/clips.py) solo se descarga ese tramo: yt-dlp
+        lo pide a FFmpeg, que lee únicamente las partes necesarias del archivo remoto.
         """
         if options is None: options = {}
         print(f"Iniciando descarga de {url} formato {format_id} con subs: {subtitles} y opciones: {options}...")
 
+        job_id = control.job_id if control else None
+        progress_key = job_id if job_id is not None else url
+        host = host_key(url)
+        threshold = self._throttle_threshold(options)
+        detector = ThrottleDetector(threshold, settings.THROTTLE_WINDOW)
+        throttled: Dict[str, float] = {}
+        clip = ClipRange.from_options(options)
+
         # Callback para progreso
         def progress_hook(d):
+            if control is not None:
+                if d.get('tmpfilename'):
+                    control.temp_files.add(d['tmpfilename'])
+                if control.stopped:
+                    # yt-dlp interrumpe la descarga y conserva el .part (útil para pausar/reanudar)
+                    raise yt_dlp.utils.DownloadCancelled(f"Descarga detenida ({control.stop_reason})")
+                if d['status'] == 'downloading':
+                    if control.progressive is None:
+                        info = d.get('info_dict') or {}
+                        # Los formatos que se van a combinar se descargan aparte como 'nombre.f<id>.ext'
+                        partial = f".f{info.get('format_id')}." in os.path.basename(d.get('filename') or '')
+                        control.progressive = info.get('protocol') in ('http', 'https') and not partial
+                    control.live_path = d.get('tmpfilename') or d.get('filename')
+                elif d['status'] == 'finished':
+                    control.live_path = d.get('filename')
+                    if clip is not None and d.get('downloaded_bytes') is not None:
+                        # FFmpeg (tramos) solo informa al terminar: el tamaño del tramo es lo descargado
+                        DOWNLOAD_BYTES.inc(control.record_progress(d.get('filename', ''), d['downloaded_bytes']))
+            if d['status'] == 'downloading' and d.get('downloaded_bytes') is not None:
+                delta = control.record_progress(d.get('filename', ''), d['downloaded_bytes']) if control else 0
+                DOWNLOAD_BYTES.inc(delta)
+                # Límite global compartido: dormir aquí frena al hilo que lee de la red
+                bandwidth_limiter.consume(delta)
+                speed = detector.update(d.get('filename', ''), d['downloaded_bytes'])
+                if speed is not None:
+                    # Se corta la conexión conservando el .part; download_stage reconecta (ver abajo)
+                    throttled['speed'] = speed
+                    raise yt_dlp.utils.DownloadCancelled(f"Descarga estrangulada ({speed / 1024:.0f} KiB/s)")
             if d['status'] == 'downloading':
-                # Construimos un mensaje de progreso
-                try:
-                    p = d.get('_percent_str', '0%').replace('%','')
-                    speed = d.get('_speed_str', 'N/A')
-                    eta = d.get('_eta_str', 'N/A')
-                    msg = f"[download] {p}% of {d.get('_total_bytes_str') or d.get('_total_bytes_estimate_str')} at {speed} ETA {eta}"
-                    # Enviamos
-                    if loop and not loop.is_closed():
-                        asyncio.run_coroutine_threadsafe(log_manager.broadcast(msg), loop)
-                except Exception:
-                    pass
+                # Evento estructurado con valores numéricos (agrupado por trabajo, con tasa limitada)
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                downloaded = d.get('downloaded_bytes') or 0
+                log_manager.publish_progress(progress_key, make_event(
+                    PROGRESS, job_id=job_id, phase='downloading',
+                    filename=os.path.basename(d.get('filename') or ''),
+                    downloaded_bytes=downloaded,
+                    total_bytes=total,
+                    percent=round(downloaded * 100 / total, 1) if total else None,
+                    speed=d.get('speed'),
+                    eta=d.get('eta'),
+                    fragment_index=d.get('fragment_index'),
+                    fragment_count=d.get('fragment_count'),
+                ))
             elif d['status'] == 'finished':
-                if loop and not loop.is_closed():
-                    asyncio.run_coroutine_threadsafe(log_manager.broadcast(f"[finished] Download completed: {d.get('filename')}"), loop)
-        
-        # Configuración de Post-Procesadores
-        postprocessors = []
+                # 'elapsed' solo existe si el archivo se descargó ahora (no si ya estaba en disco)
+                elapsed, size = d.get('elapsed'), d.get('total_bytes') or d.get('downloaded_bytes')
+                if elapsed:
+                    DOWNLOAD_FILE_SECONDS.observe(elapsed)
+                    if size:
+                        DOWNLOAD_FILE_SPEED.observe(size / elapsed)
+                log_manager.publish_progress(progress_key, make_event(
+                    PROGRESS, f"[finished] Download completed: {d.get('filename')}", job_id=job_id,
+                    phase='finished', filename=os.path.basename(d.get('filename') or ''),
+                    downloaded_bytes=d.get('downloaded_bytes') or d.get('total_bytes'),
+                    total_bytes=d.get('total_bytes'), percent=100.0,
+                ))
+
+        pp_started: Dict[str, float] = {}
+
+        def postprocessor_hook(d):
+            name = d.get('postprocessor') or 'unknown'
+            if d.get('status') == 'started':
+                pp_started[name] = time.perf_counter()
+            elif d.get('status') == 'finished' and name in pp_started:
+                POSTPROCESSOR_SECONDS.observe(time.perf_counter() - pp_started.pop(name), postprocessor=name)
+            log_manager.publish_progress(progress_key, make_event(
+                PROGRESS, f"[{d.get('postprocessor')}] {d.get('status')}", job_id=job_id,
+                phase='postprocessing', postprocessor=d.get('postprocessor'), status=d.get('status'),
+            ))
+
+        # Configuración de Post-Procesadores (en orden: el audio se extrae antes de incrustar nada)
+        audio_profile = options.get('audio_profile')
+        postprocessors = self.audio_postprocessors(audio_profile, options.get('audio_normalize', False)) if audio_profile else []
 
         # 1. Metadatos (Título, Autor, Descripción...)
         if options.get('embed_metadata', False):
@@ -108,101 +563,272 @@ class YtDlpService:
         if options.get('embed_thumbnail', False):
             postprocessors.append({'key': 'EmbedThumbnail'})
 
-        # 3. Subtítulos (Si se incrustan)
-        if options.get('embed_subs', False):
+        # 3. Subtítulos (Si se incrustan; no en el modo audio)
+        if options.get('embed_subs', False) and not audio_profile:
             # FFmpegEmbedSubtitle asegura que se incrusten
             postprocessors.append({'key': 'FFmpegEmbedSubtitle'})
 
         ydl_opts = {
-            'format': format_id, 
-            'outtmpl': os.path.join(settings.DOWNLOAD_DIR, '%(title)s [%(id)s].%(ext)s'),
+            # Las reglas ('rule:...') se resuelven con los formatos reales, ver _rule_selector
+            'format': None if is_rule(format_id) else format_id, 
+            'outtmpl': os.path.join(settings.DOWNLOAD_DIR, output_template(settings.OUTPUT_LAYOUT, clip, control.file_tag if control else None)),
             'quiet': False,
-            'merge_output_format': 'mkv',
+            # Una sola pista en el modo audio: nada que combinar en mkv
+            'merge_output_format': None if audio_profile else 'mkv',
             
             # Subtítulos Config
             'writesubtitles': options.get('embed_subs', False) or bool(subtitles), 
             'subtitleslangs': subtitles if subtitles else [],
             # embedsubtitles=True también activa el postprocesador interno, pero lo dejamos explícito arriba o aquí
             # Lo dejamos aquí por compatibilidad
-            'embedsubtitles': options.get('embed_subs', False),
+            'embedsubtitles': options.get('embed_subs', False) and not audio_profile,
             'subtitlesformat': options.get('sub_format', 'best'), # 'best' permite conversión automática si es necesario
             
             # Metadatos / Thumbnail Config
             'writethumbnail': options.get('embed_thumbnail', False), # Necesario para bajarla antes de incrustar
             
-            # Lista de procesadores
-            'postprocessors': postprocessors,
-            
-            'logger': YtDlpLogger(loop) if loop else None,
-            'progress_hooks': [progress_hook] if loop else [],
+            # Los post-procesadores se registran tras crear la instancia (ver _add_postprocessors)
+
+            'logger': YtDlpLogger(job_id),
+            'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [postprocessor_hook],
+            # Las líneas de progreso de yt-dlp irían al logger sin agrupar; usamos solo el hook
+            'noprogress': True,
+
+            # Perfil de rendimiento (fragmentos paralelos, chunks, reintentos, reanudación)
+            **self._performance_opts(options),
         }
         
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if clip is not None:
+            # Tramo: una sola sección; con keyframes se re-codifican los bordes para cortar exacto
+            ydl_opts['download_ranges'] = lambda info, _: [clip.section(info)]
+            ydl_opts['force_keyframes_at_cuts'] = clip.keyframes
+
+        ydl = self._new_ydl(ydl_opts, pipelined_ydl_class())
+        self._add_postprocessors(ydl, postprocessors)
+        if is_rule(format_id):
+            ydl.format_selector = self._rule_selector(parse_rule(format_id), ydl, job_id)
+        if control is not None and job_id is not None:
+            ydl.admission = lambda info: self._admit(info, options, control)
+        stop_event = control.stop_event if control is not None else None
+        for attempt in itertools.count(1):
+            # Turno del host (token bucket y backoff tras un 429): la extracción también pide páginas al sitio
+            request_governor.acquire(host, stop_event)
+            try:
+                if control is not None and control.stopped:
+                    raise yt_dlp.utils.DownloadCancelled(f"Descarga detenida ({control.stop_reason})")
+                detector.reset()
                 ydl.download([url])
-            print(f"Descarga completada: {url}")
-            if loop and not loop.is_closed():
-                asyncio.run_coroutine_threadsafe(log_manager.broadcast(f"SUCCESS: Descarga completada para {url}"), loop)
+            except yt_dlp.utils.DownloadCancelled:
+                speed = throttled.pop('speed', None)
+                if speed is not None and not (control is not None and control.stopped):
+                    # Estrangulada: se vuelve a extraer (URLs firmadas nuevas) y se sigue desde el .part
+                    request_governor.record(host, THROTTLED)
+                    if attempt <= settings.THROTTLE_RETRIES:
+                        delay = backoff_delay(attempt, settings.GOVERNOR_BACKOFF, settings.GOVERNOR_BACKOFF_MAX)
+                        log_manager.publish_threadsafe(make_event(
+                            LOG, f"WARNING: Descarga estrangulada ({speed / 1024:.0f} KiB/s), reconectando en "
+                                 f"{delay:.0f}s ({attempt}/{settings.THROTTLE_RETRIES})", job_id=job_id, level="warning"))
+                        if stop_event is not None:
+                            stop_event.wait(delay)
+                        else:
+                            time.sleep(delay)
+                        continue
+                    ydl.close()
+                    error = Throttled(host, speed, settings.THROTTLE_WINDOW, threshold)
+                    log_manager.publish_threadsafe(make_event(LOG, f"ERROR: {error}", job_id=job_id, level="error"))
+                    raise error
+                ydl.close()
+                print(f"Descarga detenida: {url}")
+                raise
+            except InsufficientSpace as e:
+                ydl.close()
+                log_manager.publish_threadsafe(make_event(
+                    LOG, f"{'WARNING' if e.fits_ever else 'ERROR'}: {e}", job_id=job_id,
+                    level="warning" if e.fits_ever else "error"))
+                raise
+            except Exception as e:
+                ydl.close()
+                request_governor.record(host, classify_error(e))
+                print(f"Error descargando {url}: {e}")
+                log_manager.publish_threadsafe(make_event(LOG, f"ERROR: {str(e)}", job_id=job_id, level="error"))
+                raise
+            break
+        request_governor.record(host, OK)
+
+        print(f"Descarga completada: {url}")
+        if control is not None:
+            control.download_finished = True
+        if ydl.deferred:
+            return ydl
+        ydl.close()
+        log_manager.publish_threadsafe(make_event(LOG, f"SUCCESS: Descarga completada para {url}", job_id=job_id, level="success"))
+        return None
+
+    @staticmethod
+    def audio_postprocessors(profile: str, normalize: bool = False) -> List[Dict[str, Any]]:
+        """Post-procesadores del modo audio: extracción/conversión según AUDIO_PROFILES y, opcionalmente, normalización."""
+        if profile not in AUDIO_PROFILES:
+            raise ValueError(f"Perfil de audio desconocido: '{profile}' (opciones: {', '.join(AUDIO_PROFILES)})")
+        _, codec, quality = AUDIO_PROFILES[profile]
+        postprocessors = [{'key': 'FFmpegExtractAudio', 'preferredcodec': codec, 'preferredquality': quality}]
+        if normalize:
+            postprocessors.append({'key': 'Loudnorm', 'bitrate': quality})
+        return postprocessors
+
+    @staticmethod
+    def _add_postprocessors(ydl: PipelineMixin, postprocessors: List[Dict[str, Any]]):
+        """
+        Registra los post-procesadores en orden, como haría el parámetro 'postprocessors'
+        de yt-dlp, admitiendo además los propios ('Loudnorm').
+        """
+        for definition in postprocessors:
+            definition = dict(definition)
+            key, when = definition.pop('key'), definition.pop('when', 'post_process')
+            cls = loudnorm_pp_class() if key == 'Loudnorm' else yt_dlp.postprocessor.get_postprocessor(key)
+            ydl.add_post_processor(cls(ydl, **definition), when=when)
 
+    @staticmethod
+    def space_needed(sizes: List[Optional[int]], options: Dict[str, Any], remux: bool = False) -> Optional[int]:
+        """
+        Espacio en disco que ocupa una descarga en su punto máximo: la suma de los
+        formatos, el doble si el post-procesado escribe una copia nueva (combinar
+        video+audio, incrustar metadatos/miniatura/subtítulos, remux de HLS).
+        None si falta el tamaño de algún formato.
+        """
+        if not sizes or any(size is None for size in sizes):
+            return None
+        total = sum(sizes)
+        rewrite = remux or len(sizes) > 1 or any(options.get(name) for name in REWRITE_OPTIONS)
+        return total * 2 if rewrite else total
+
+    @staticmethod
+    def _admit(info: Dict[str, Any], options: Dict[str, Any], control: DownloadControl):
+        """
+        Reserva en disk_space el espacio de los formatos elegidos, antes de escribir nada.
+        Si no cabe, InsufficientSpace: el planificador deja el trabajo esperando (o lo
+        rechaza si no cabría nunca) en lugar de fallar al final tras bajar todo.
+        """
+        formats = info.get('requested_formats') or [info]
+        sizes = [estimate_size(f, info.get('duration'))[0] for f in formats]
+        remux = any(str(f.get('protocol') or '').startswith(('m3u8', 'http_dash')) for f in formats)
+        # Sin tamaño conocido se reserva 0: al menos se respeta el margen de espacio libre
+        size = YtDlpService.space_needed(sizes, options, remux) or 0
+        fraction = YtDlpService.clip_fraction(info)
+        if fraction is not None:
+            # Tramo: la parte proporcional de su duración (yt-dlp ya fijó section_start/section_end)
+            control.full_size = sum(sizes) if None not in sizes else None
+            size = int(size * fraction)
+        control.estimated_size = size
+        if not disk_space.reserve(control.job_id, size, lambda: control.bytes_downloaded):
+            raise InsufficientSpace(size, disk_space.available(control.job_id), disk_space.capacity())
+
+    @staticmethod
+    def clip_fraction(info: Dict[str, Any]) -> Optional[float]:
+        """Fracción del video que ocupa la sección elegida (download_ranges), o None si no es un tramo."""
+        start, end, duration = info.get('section_start'), info.get('section_end'), info.get('duration')
+        if start is None and end is None:
+            return None
+        if not duration:
+            return 1.0
+        return min(max(((end if end is not None else duration) - (start or 0)) / duration, 0.0), 1.0)
+
+    @staticmethod
+    def _rule_selector(rule, ydl: PipelineMixin, job_id: Optional[int]):
+        """
+        Selector de formato para yt-dlp que resuelve la regla sobre los formatos
+        del video y delega en el selector normal con el resultado ('video+audio').
+        """
+        def select(ctx):
+            selection = rule.resolve(FormatLadder.from_formats(ctx['formats'], ydl.duration))
+            if selection is None:
+                log_manager.publish_threadsafe(make_event(
+                    LOG, f"WARNING: Ningún formato cumple la regla '{rule.text}'", job_id=job_id, level="warning"))
+                return
+            size = f"{'~' if selection.size_approx else ''}{selection.size / (1024 * 1024):.1f} MB" if selection.size else "tamaño desconocido"
+            log_manager.publish_threadsafe(make_event(
+                LOG, f"Regla '{rule.text}': formato {selection.format_spec} ({size})", job_id=job_id))
+            yield from ydl.build_format_selector(selection.format_spec)(ctx)
+        return select
+
+    def postprocess_stage(self, ydl: PipelineMixin, url: str, control: Optional[DownloadControl] = None) -> List[str]:
+        """
+        Segunda etapa: merge y post-procesadores (FFmpeg, uso intensivo de CPU).
+        Se ejecuta en el pool de post-procesado, de modo que el hilo de descarga
+        queda libre para el siguiente trabajo mientras este archivo se remuxea.
+        Devuelve las rutas de los archivos finales.
+        """
+        job_id = control.job_id if control else None
+        try:
+            final_files = ydl.run_deferred()
+            print(f"Post-procesado completado: {url}")
+            log_manager.publish_threadsafe(make_event(LOG, f"SUCCESS: Descarga completada para {url}", job_id=job_id, level="success"))
+            return final_files
         except Exception as e:
-            print(f"Error descargando {url}: {e}")
-            if loop and not loop.is_closed():
-                asyncio.run_coroutine_threadsafe(log_manager.broadcast(f"ERROR: {str(e)}"), loop)
+            print(f"Error post-procesando {url}: {e}")
+            log_manager.publish_threadsafe(make_event(LOG, f"ERROR: {str(e)}", job_id=job_id, level="error"))
+            raise
+        finally:
+            ydl.close()
 
-    def _process_formats(self, raw_formats: List[Dict[str, Any]]) -> tuple[List[VideoFormat], List[VideoFormat]]:
-        video_formats = []
-        audio_formats = []
-        
-        for f in raw_formats:
-            if f.get('protocol') == 'm3u8_native': continue
-            
-            # Ignorar formatos sin codecs conocidos o irrelevantes
-            vcodec = f.get('vcodec', 'none')
-            acodec = f.get('acodec', 'none')
-            
-            if vcodec == 'none' and acodec == 'none': continue
-
-            # Crear objeto VideoFormat
-            fmt = VideoFormat(
-                format_id=f['format_id'],
-                ext=f['ext'],
-                resolution=f.get('resolution') or 'N/A',
-                fps=f.get('fps'),
-                filesize=f.get('filesize'),
-                vcodec=vcodec,
-                acodec=acodec,
-                note=f.get('format_note', '')
-            )
-            
-            # Clasificación
-            # Audio puro
-            if vcodec == 'none' and acodec != 'none':
-                audio_formats.append(fmt)
-            
-            # Video (puede tener audio o ser video only)
-            # Solo nos interesan los videos "reales" (mp4/webm), ignoramos cosas raras
-            elif vcodec != 'none':
-                video_formats.append(fmt)
-        
-        # Orden solicitado: "de peor a mejor calidad siempre"
-        # Ordenamos Audio por filesize (proxy de bitrate) ascendente (peor -> mejor)
-        audio_formats.sort(key=lambda x: x.filesize or 0)
-        
-        # Ordenamos Video por Altura (resolucion) y luego bitrate/filesize ascendente
-        # Extraemos altura '1080p' -> 1080 integer para ordenar bien
-        def get_height(res_str):
-            try:
-                return int(res_str.replace('p', '').split('x')[-1].strip())
-            except:
-                return 0
-                
-        video_formats.sort(key=lambda x: (get_height(x.resolution), x.filesize or 0))
+    @staticmethod
+    def _throttle_threshold(options: Dict[str, Any]) -> float:
+        """
+        Umbral de THROTTLE_MIN_SPEED para una descarga, o 0 (sin detección) si los
+        límites de velocidad propios (del trabajo o su parte del límite global)
+        ya la dejarían por debajo.
+        """
+        threshold = settings.THROTTLE_MIN_SPEED
+        limits = [int(options.get('rate_limit') or 0)]
+        if bandwidth_limiter.rate:
+            limits.append(bandwidth_limiter.rate // max(settings.MAX_CONCURRENT_DOWNLOADS, 1))
+        if any(0 < limit <= threshold for limit in limits):
+            return 0
+        return threshold
+
+    @staticmethod
+    def _performance_opts(options: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Opciones de yt-dlp del perfil de rendimiento. Los valores ausentes en
+        `options` toman el valor por defecto de Settings.
+        """
+        def pick(key, default):
+            value = options.get(key)
+            return default if value is None else value
+
+        backoff = float(pick('retry_backoff', settings.DOWNLOAD_RETRY_BACKOFF))
+        backoff_max = settings.DOWNLOAD_RETRY_BACKOFF_MAX
+
+        def sleep_for(attempt):
+            # Backoff exponencial: 1s, 2s, 4s... hasta backoff_max
+            return min(backoff * (2 ** attempt), backoff_max)
+
+        chunk_size = int(pick('http_chunk_size', settings.DOWNLOAD_CHUNK_SIZE))
+        rate_limit = int(pick('rate_limit', 0))
+        resume = bool(pick('resume', settings.DOWNLOAD_RESUME))
+        return {
+            'concurrent_fragment_downloads': int(pick('concurrent_fragments', settings.DOWNLOAD_CONCURRENT_FRAGMENTS)),
+            'http_chunk_size': chunk_size or None,
+            'retries': int(pick('retries', settings.DOWNLOAD_RETRIES)),
+            'fragment_retries': int(pick('retries', settings.DOWNLOAD_RETRIES)),
+            'retry_sleep_functions': {'http': sleep_for, 'fragment': sleep_for},
+            'continuedl': resume,
+            'nopart': False,
+            'ratelimit': rate_limit or None,  # Límite propio del trabajo (bytes/s)
+        }
 
-        return video_formats, audio_formats
+    def _process_formats(self, raw_formats: List[Dict[str, Any]], duration: Optional[float] = None) -> Tuple[Tuple[Format, ...], Tuple[Format, ...]]:
+        """
+        Formatos para la UI, de peor a mejor calidad, a partir de la escalera
+        precalculada (app/formats.py). Incluye los formatos HLS (m3u8).
+        """
+        ladder = FormatLadder.from_formats(raw_formats, duration)
+        return tuple(map(Format.from_rung, ladder.video)), tuple(map(Format.from_rung, ladder.audio))
 
-    def _process_subtitles(self, info_dict: Dict[str, Any]) -> List[SubtitleInfo]:
+    def _process_subtitles(self, info_dict: Dict[str, Any]) -> Tuple[Subtitle, ...]:
         """Extrae subtítulos manuales y automáticos"""
-        subs = []
+        # (idioma, nombre) -> subtítulo: deduplicación en O(1) (hay videos con cientos de idiomas automáticos)
+        subs: Dict[Tuple[str, str], Subtitle] = {}
         
         def add_subs(source_dict, is_auto=False):
             if not source_dict: return
@@ -223,8 +849,8 @@ class YtDlpService:
                     display_name = f"{lang} (Auto)" if is_auto else lang
 
                 # Evitar duplicados exactos si ya existe (por si acaso)
-                if not any(s.lang == lang and s.name == display_name for s in subs):
-                    subs.append(SubtitleInfo(lang=lang, name=display_name, ext=sub_data.get('ext', 'vtt')))
+                if (lang, display_name) not in subs:
+                    subs[(lang, display_name)] = Subtitle.create(lang, display_name, sub_data.get('ext', 'vtt'))
 
         # 1. Subtítulos manuales
         # Nota: Algunos videos NO tienen subs manuales, solo auto.
@@ -235,6 +861,4 @@ class YtDlpService:
         
         # Ordenar: Manuales primero, luego Autos. Alfabéticamente dentro de cada grupo.
         # Simple heurística: si tiene "(Auto)" va al final.
-        subs.sort(key=lambda x: (1 if "(Auto)" in x.name else 0, x.name))
-        
-        return subs
+        return tuple(sorted(subs.values(), key=lambda x: (1 if "(Auto)" in x.name else 0, x.name)))
@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select, update
+
+from .core.config import settings
+from .core.database import SessionLocal
+from .core.diskspace import disk_space
+from .core.metrics import metrics
+from .models import DownloadJob, StoredFile
+from .services import YtDlpService
+
+# Opciones que cambian el archivo final; las de rendimiento (fragmentos, reintentos...) no cuentan
+OUTPUT_OPTIONS = ("embed_metadata", "embed_thumbnail", "embed_chapters", "embed_subs", "sub_format")
+# Solo cuentan si están presentes (las claves de descargas anteriores al modo audio no cambian)
+AUDIO_OUTPUT_OPTIONS = ("audio_profile", "audio_normalize")
+
+# Manifiestos JSON (uno por archivo indexado) dentro de DOWNLOAD_DIR: permiten
+# reconstruir el índice desde el directorio aunque se pierda la base de datos.
+MANIFEST_DIR = ".index"
+
+_HASH_CHUNK = 1024 * 1024
+
+STORE_LOOKUPS = metrics.counter("store_lookups_total", "Consultas al índice de descargas por resultado", ["result"])
+STORE_EVICTIONS = metrics.counter("store_evictions_total", "Archivos borrados por la retención, por motivo", ["reason"])
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadStore:
+    """
+    Índice de descargas completadas, para no volver a descargar lo que ya está en disco.
+
+    La clave combina la clave canónica del video (YtDlpService.video_key), la
+    selección de formato y las opciones de post-procesado que cambian el archivo.
+    Cada entrada guarda ruta, tamaño, mtime y SHA-256 del archivo final.
+
+    Una entrada solo es válida si el archivo sigue en disco con el mismo tamaño;
+    `reconcile` (al arrancar) revisa todo el índice de forma incremental: solo
+    vuelve a calcular el checksum de los archivos cuyo tamaño o mtime cambió.
+
+    Retención: `evict` borra los archivos indexados usados hace más tiempo (LRU
+    por `accessed_at`) para hacer sitio a una descarga (ver app/core/diskspace.py),
+    y `enforce_retention` los que superan STORAGE_RETENTION_DAYS o STORAGE_MAX_BYTES.
+    Los archivos fuera del índice (trabajos con varios archivos finales) no se tocan.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.recorded = 0
+        self.evicted = 0
+        self.last_reconcile: Dict[str, Any] = {}
+        self._bytes_lock = threading.Lock()
+        self._bytes = 0  # Tamaño total de lo indexado (se calcula en reconcile)
+
+    @property
+    def manifest_dir(self) -> str:
+        return os.path.join(self.directory, MANIFEST_DIR)
+
+    @staticmethod
+    def key_for(video_key: str, format_id: str, subtitles: Optional[List[str]], options: Dict[str, Any]) -> str:
+        """Clave de deduplicación a partir de la clave del video (YtDlpService.video_keys_async), sin acceso a red."""
+        identity = {
+            "video": video_key,
+            "format": format_id,
+            "subtitles": sorted(subtitles or []),
+            "options": {name: options.get(name) for name in OUTPUT_OPTIONS},
+        }
+        if options.get("audio_profile"):
+            identity["audio"] = {name: options.get(name) for name in AUDIO_OUTPUT_OPTIONS}
+        if options.get("clip"):
+            identity["clip"] = options["clip"]  # Cada tramo es un archivo distinto (ver app/clips.py)
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:32]
+
+    def full_path(self, entry: StoredFile) -> str:
+        return os.path.join(self.directory, entry.path)
+
+    def relative_path(self, path: str) -> Optional[str]:
+        """Ruta relativa a DOWNLOAD_DIR, o None si `path` está fuera del directorio."""
+        try:
+            relative = os.path.relpath(os.path.realpath(path), os.path.realpath(self.directory))
+        except ValueError:
+            return None  # Otra unidad (Windows)
+        if relative == os.curdir or relative.split(os.sep)[0] == os.pardir:
+            return None
+        return relative
+
+    # --- API asíncrona (desde el event loop) ----------------------------------
+
+    async def lookup(self, key: str) -> Optional[StoredFile]:
+        return (await self.lookup_many([key])).get(key)
+
+    async def lookup_many(self, keys: List[str]) -> Dict[str, StoredFile]:
+        """Entradas válidas de las claves dadas, en un solo viaje a la base de datos."""
+        found = await asyncio.to_thread(self._lookup_many, keys)
+        STORE_LOOKUPS.inc(len(found), result="hit")
+        STORE_LOOKUPS.inc(len(set(keys)) - len(found), result="miss")
+        return found
+
+    async def record(self, key: str, path: str, format_id: str, url: str, job_id: Optional[int]) -> Optional[StoredFile]:
+        return await asyncio.to_thread(self._record, key, path, format_id, url, job_id)
+
+    async def reconcile(self) -> Dict[str, Any]:
+        self.last_reconcile = await asyncio.to_thread(self._reconcile)
+        return self.last_reconcile
+
+    async def touch(self, path: str):
+        """Marca como usado el archivo indexado en `path` (relativa a DOWNLOAD_DIR), para la LRU."""
+        await asyncio.to_thread(self._touch, path)
+
+    async def enforce_retention(self, max_age: Optional[float], max_bytes: Optional[int]) -> Dict[str, Any]:
+        """Borra lo que lleva más de `max_age` segundos sin usarse y, por LRU, lo que exceda `max_bytes`."""
+        return await asyncio.to_thread(self._evict, 0, max_age, max_bytes)
+
+    def indexed_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {"recorded": self.recorded, "indexed_bytes": self._bytes, "evicted": self.evicted,
+                "last_reconcile": self.last_reconcile}
+
+    # --- En hilos ---------------------------------------------------------------
+
+    def _lookup_many(self, keys: List[str]) -> Dict[str, StoredFile]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with SessionLocal() as db:
+            stale = []
+            # En bloques: SQLite limita el número de parámetros por consulta
+            for start in range(0, len(unique), 500):
+                query = select(StoredFile).where(StoredFile.key.in_(unique[start:start + 500]))
+                for entry in db.scalars(query):
+                    try:
+                        valid = os.path.getsize(self.full_path(entry)) == entry.size
+                    except OSError:
+                        valid = False
+                    if valid:
+                        found[entry.key] = entry
+                    else:
+                        stale.append(entry)
+            for entry in found.values():
+                entry.accessed_at = time.time()
+            if stale:
+                # Borrados o modificados desde fuera: la próxima solicitud los descarga de nuevo
+                for entry in stale:
+                    db.delete(entry)
+                    self._remove_manifest(entry.key)
+                    self._add_bytes(-entry.size)
+            if found or stale:
+                db.commit()
+        return found
+
+    def _record(self, key: str, path: str, format_id: str, url: str, job_id: Optional[int]) -> Optional[StoredFile]:
+        try:
+            stat = os.stat(path)
+            sha256 = file_sha256(path)
+        except OSError:
+            return None
+        relative = self.relative_path(path)
+        if relative is None:
+            return None  # Fuera de DOWNLOAD_DIR: no se indexa
+        now = time.time()
+        with SessionLocal() as db:
+            other = db.scalar(select(StoredFile.key).where(StoredFile.path == relative, StoredFile.key != key))
+        if other is not None:
+            # El archivo es de otra clave (otro formato u opciones): indexarlo serviría el archivo equivocado
+            print(f"No se indexa {relative}: ya pertenece a otra descarga ({other})")
+            return None
+        entry = StoredFile(
+            key=key, video_key=YtDlpService.video_key(url), format=format_id, path=relative,
+            size=stat.st_size, mtime=stat.st_mtime, sha256=sha256, url=url, job_id=job_id,
+            created_at=now, accessed_at=now,
+        )
+        with SessionLocal() as db:
+            previous = db.get(StoredFile, key)
+            self._add_bytes(stat.st_size - (previous.size if previous else 0))
+            entry = db.merge(entry)
+            db.commit()
+        self._write_manifest(entry)
+        self.recorded += 1
+        return entry
+
+    def _reconcile(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        result = {"checked": 0, "removed": 0, "rehashed": 0, "restored": 0}
+        manifests = self._read_manifests()
+        changed: List[StoredFile] = []
+        with SessionLocal() as db:
+            entries = {entry.key: entry for entry in db.scalars(select(StoredFile))}
+
+            for key, entry in entries.items():
+                result["checked"] += 1
+                status = self._refresh(entry)
+                if status is None:
+                    db.delete(entry)
+                    self._remove_manifest(key)
+                    result["removed"] += 1
+                elif status:
+                    changed.append(entry)
+
+            # Archivos con manifiesto pero sin fila (base de datos nueva o borrada)
+            for key, data in manifests.items():
+                if key in entries or not data.get("path"):
+                    continue
+                entry = StoredFile(**{column.name: data.get(column.name) for column in StoredFile.__table__.columns})
+                status = self._refresh(entry)
+                if status is None:
+                    self._remove_manifest(key)
+                    continue
+                db.add(entry)
+                result["restored"] += 1
+                if status:
+                    changed.append(entry)
+            db.commit()
+            with self._bytes_lock:
+                self._bytes = db.scalar(select(func.coalesce(func.sum(StoredFile.size), 0)))
+
+        for entry in changed:
+            self._write_manifest(entry)
+        result["rehashed"] = len(changed)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def _refresh(self, entry: StoredFile) -> Optional[bool]:
+        """
+        Comprueba una entrada contra el disco. None si el archivo ya no existe;
+        True si cambió (se recalcula el checksum); False si sigue igual (solo stat).
+        """
+        path = self.full_path(entry)
+        try:
+            stat = os.stat(path)
+            if stat.st_size == entry.size and stat.st_mtime == entry.mtime:
+                return False
+            entry.sha256 = file_sha256(path)
+        except OSError:
+            return None
+        entry.size, entry.mtime = stat.st_size, stat.st_mtime
+        return True
+
+    def _touch(self, path: str):
+        with SessionLocal() as db:
+            db.execute(update(StoredFile).where(StoredFile.path == path).values(accessed_at=time.time()))
+            db.commit()
+
+    def _add_bytes(self, delta: int):
+        with self._bytes_lock:
+            self._bytes += delta
+
+    def evict(self, needed: int) -> int:
+        """Borra archivos por LRU hasta liberar `needed` bytes; devuelve los liberados (en hilos)."""
+        return self._evict(needed, None, None)["freed"]
+
+    def _evict(self, needed: int, max_age: Optional[float], max_bytes: Optional[int]) -> Dict[str, Any]:
+        now = time.time()
+        last_used = func.coalesce(StoredFile.accessed_at, StoredFile.created_at)
+        freed, evicted, reasons = 0, [], {}
+        with SessionLocal() as db:
+            for entry in db.scalars(select(StoredFile).order_by(last_used)).all():
+                if freed < needed:
+                    reason = "space"
+                elif max_bytes is not None and self._bytes > max_bytes:
+                    reason = "quota"
+                elif max_age is not None and (entry.accessed_at or entry.created_at) < now - max_age:
+                    reason = "age"
+                else:
+                    break  # En orden LRU: los siguientes son más recientes
+                try:
+                    os.remove(self.full_path(entry))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"No se pudo borrar {entry.path}: {e}")
+                    continue
+                self._prune_dirs(os.path.dirname(self.full_path(entry)))
+                db.delete(entry)
+                self._remove_manifest(entry.key)
+                self._add_bytes(-entry.size)
+                freed += entry.size
+                evicted.append(entry.path)
+                reasons[reason] = reasons.get(reason, 0) + 1
+            if evicted:
+                # /files/{id} de esos trabajos responde 404 en lugar de buscar un archivo borrado
+                for start in range(0, len(evicted), 500):
+                    db.execute(update(DownloadJob).where(DownloadJob.output_path.in_(evicted[start:start + 500]))
+                               .values(output_path=None))
+                db.commit()
+        for reason, count in reasons.items():
+            STORE_EVICTIONS.inc(count, reason=reason)
+        self.evicted += len(evicted)
+        if evicted:
+            print(f"Retención: {len(evicted)} archivos borrados ({freed / (1024 * 1024):.1f} MB) {reasons}")
+        return {"evicted": len(evicted), "freed": freed, "reasons": reasons}
+
+    def _prune_dirs(self, directory: str):
+        """Borra los subdirectorios de OUTPUT_LAYOUT que quedaron vacíos, sin salir de DOWNLOAD_DIR."""
+        root = os.path.realpath(self.directory)
+        directory = os.path.realpath(directory)
+        while directory != root and directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return  # No vacío
+            directory = os.path.dirname(directory)
+
+    # --- Manifiestos --------------------------------------------------------------
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.manifest_dir, f"{key}.json")
+
+    def _write_manifest(self, entry: StoredFile):
+        data = {column.name: getattr(entry, column.name) for column in StoredFile.__table__.columns}
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        tmp = self._manifest_path(entry.key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._manifest_path(entry.key))
+
+    def _remove_manifest(self, key: str):
+        try:
+            os.remove(self._manifest_path(key))
+        except OSError:
+            pass
+
+    def _read_manifests(self) -> Dict[str, Dict[str, Any]]:
+        manifests = {}
+        try:
+            names = os.listdir(self.manifest_dir)
+        except OSError:
+            return manifests
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.manifest_dir, name), encoding="utf-8") as f:
+                    data = json.load(f)
+                manifests[data["key"]] = data
+            except (OSError, ValueError, KeyError):
+                continue
+        return manifests
+
+
+download_store = DownloadStore(settings.DOWNLOAD_DIR)
+disk_space.used = download_store.indexed_bytes
+if settings.STORAGE_EVICT:
+    disk_space.evict = download_store.evict
+metrics.gauge("store_indexed_bytes", "Tamaño total de los archivos del índice de descargas").set_function(
+    download_store.indexed_bytes
+)
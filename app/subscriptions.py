@@ -0,0 +1,307 @@
+import asyncio
+import itertools
+import random
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from .core.config import settings
+from .core.database import SessionLocal
+from .core.executor import extraction_executor, ExecutorSaturated
+from .core.governor import HostBlocked
+from .core.log_manager import log_manager, make_event, LOG
+from .core.metrics import metrics
+from .formats import FormatRule
+from .jobs import job_scheduler, SUBMIT_QUEUED
+from .models import Subscription
+from .metadata import Entry
+from .services import YtDlpService
+
+POLL_SECONDS = metrics.histogram("subscription_poll_seconds", "Duración de cada sondeo de suscripción", ["outcome"])
+POLL_NEW_VIDEOS = metrics.counter("subscription_new_videos_total", "Videos nuevos detectados en suscripciones")
+
+# Espera cuando el pool de extracción está lleno (no cuenta como error de la fuente)
+_SATURATED_RETRY = 30.0
+
+
+class SubscriptionExists(Exception):
+    """Ya hay una suscripción para esa URL."""
+
+
+class SubscriptionPoller:
+    """
+    Sondeo periódico de canales y playlists suscritos (tabla `subscriptions`).
+
+    Cada sondeo es una extracción plana (solo ids y títulos, ver
+    YtDlpService.iter_entries) de las SUBSCRIPTION_SCAN_LIMIT entradas más
+    recientes, comparada contra los ids ya vistos: solo los videos nuevos se
+    encolan en el planificador, que hace la extracción completa al arrancar
+    cada trabajo. El primer sondeo solo registra lo que ya existe (salvo
+    `backfill` videos).
+
+    Para que cientos de suscripciones no se disparen a la vez:
+      - como mucho `max_polls` sondeos simultáneos, en el pool de extracción;
+      - el siguiente sondeo se programa a `interval` ± `jitter`;
+      - tras errores seguidos la espera se duplica: `interval * 2^(errores-1)`, hasta `backoff_max`.
+
+    La base de datos es la fuente de verdad (`next_poll_at`); el bucle solo
+    despierta cuando vence el próximo sondeo o cuando cambia una suscripción.
+    Todos los métodos públicos deben llamarse desde el event loop.
+    """
+
+    def __init__(self, service: YtDlpService, max_polls: int, scan_limit: int, seen_max: int,
+                 jitter: float, backoff_max: float):
+        self.service = service
+        self.max_polls = max_polls
+        self.scan_limit = scan_limit
+        self.seen_max = seen_max
+        self.jitter = jitter
+        self.backoff_max = backoff_max
+
+        self._task: Optional[asyncio.Task] = None
+        self._polls: Dict[int, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+
+        self.polls = 0
+        self.errors = 0
+        self.new_videos = 0
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._polls.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    # --- API pública ----------------------------------------------------------
+
+    async def add(self, url: str, format_rule: str, interval: float, options: Dict[str, Any],
+                  backfill: int = 0) -> Subscription:
+        """
+        Crea la suscripción y la sondea en cuanto haya un hueco.
+        ValueError si la regla no es válida; SubscriptionExists si la URL ya está suscrita.
+        """
+        FormatRule(format_rule)
+        now = time.time()
+        subscription = Subscription(
+            url=url.strip(), format_rule=format_rule, options=options, enabled=True,
+            interval=max(interval, settings.SUBSCRIPTION_MIN_INTERVAL), backfill=max(backfill, 0),
+            seen_ids=[], next_poll_at=now, failures=0, created_at=now,
+        )
+        try:
+            subscription = await asyncio.to_thread(self._insert, subscription)
+        except IntegrityError:
+            raise SubscriptionExists(f"Ya existe una suscripción para {subscription.url}")
+        self._wake.set()
+        return subscription
+
+    async def list(self) -> List[Subscription]:
+        return await asyncio.to_thread(self._select)
+
+    async def remove(self, subscription_id: int) -> Subscription:
+        subscription = await asyncio.to_thread(self._delete, subscription_id)
+        poll = self._polls.get(subscription_id)
+        if poll is not None:
+            poll.cancel()
+        return subscription
+
+    async def set_enabled(self, subscription_id: int, enabled: bool) -> Subscription:
+        fields: Dict[str, Any] = {"enabled": enabled}
+        if enabled:
+            fields.update(next_poll_at=time.time(), failures=0)
+        subscription = await asyncio.to_thread(self._update, subscription_id, **fields)
+        self._wake.set()
+        return subscription
+
+    async def poll_now(self, subscription_id: int) -> Subscription:
+        """Adelanta el próximo sondeo (respeta el límite de sondeos simultáneos)."""
+        subscription = await asyncio.to_thread(self._update, subscription_id, next_poll_at=time.time())
+        self._wake.set()
+        return subscription
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "polling": len(self._polls),
+            "max_polls": self.max_polls,
+            "polls": self.polls,
+            "errors": self.errors,
+            "new_videos": self.new_videos,
+        }
+
+    # --- Bucle de planificación -------------------------------------------------
+
+    async def _run(self):
+        while True:
+            # Antes de consultar: un aviso que llegue durante la consulta no se pierde
+            self._wake.clear()
+            free = self.max_polls - len(self._polls)
+            due, next_at = [], None
+            if free > 0:
+                due, next_at = await asyncio.to_thread(self._due, time.time(), set(self._polls), free)
+            for subscription_id in due:
+                task = self._polls[subscription_id] = asyncio.ensure_future(self._poll(subscription_id))
+                task.add_done_callback(lambda t, sid=subscription_id: self._finished(sid, t))
+            if due:
+                continue  # Puede haber más vencidas si quedan huecos
+
+            # Dormir hasta el próximo vencimiento, un cambio o el fin de un sondeo
+            timeout = None if next_at is None else max(next_at - time.time(), 0.0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _finished(self, subscription_id: int, task: asyncio.Task):
+        self._polls.pop(subscription_id, None)
+        self._wake.set()
+        if not task.cancelled() and task.exception() is not None:
+            # Error propio (base de datos, suscripción borrada a mitad...), no de la fuente
+            print(f"Error en el sondeo de la suscripción {subscription_id}: {task.exception()!r}")
+
+    async def _poll(self, subscription_id: int):
+        subscription = await asyncio.to_thread(self._get, subscription_id)
+        if subscription is None or not subscription.enabled:
+            return
+        started = time.perf_counter()
+        now = time.time()
+        try:
+            entries: List[Entry] = await extraction_executor.run(self._scan, subscription.url)
+        except ExecutorSaturated:
+            # El pool está ocupado con vistas previas: no es culpa de la fuente
+            await asyncio.to_thread(self._update, subscription_id, next_poll_at=now + _SATURATED_RETRY)
+            return
+        except HostBlocked as e:
+            # El host está en backoff por un 429: se vuelve a sondear cuando termine, sin contar un fallo
+            await asyncio.to_thread(self._update, subscription_id, next_poll_at=now + e.retry_after)
+            return
+        except Exception as e:
+            failures = subscription.failures + 1
+            delay = min(subscription.interval * 2 ** (failures - 1), self.backoff_max)
+            await asyncio.to_thread(
+                self._update, subscription_id, failures=failures, last_error=str(e),
+                last_polled_at=now, next_poll_at=now + self._jittered(delay),
+            )
+            self.errors += 1
+            POLL_SECONDS.observe(time.perf_counter() - started, outcome="error")
+            log_manager.publish(make_event(
+                LOG, f"ERROR: [suscripción {subscription_id}] {subscription.url}: {e} (reintento en {delay:.0f}s)",
+                level="error", subscription_id=subscription_id,
+            ))
+            return
+
+        seen: Set[str] = set(subscription.seen_ids or [])
+        ids = [entry.id or entry.url for entry in entries]
+        new = [entry for entry, entry_id in zip(entries, ids) if entry_id not in seen]
+        if subscription.last_polled_at is None:
+            new = new[:subscription.backfill]  # Primer sondeo: lo existente ya "se vio"
+
+        queued = 0
+        if new:
+            # Más antiguos primero (los canales listan primero lo más reciente)
+            items = [(entry.url, entry.title) for entry in reversed(new)]
+            submissions = await job_scheduler.submit_many(
+                items, FormatRule(subscription.format_rule).spec, [], subscription.options or {})
+            queued = sum(1 for s in submissions if s.status == SUBMIT_QUEUED)
+
+        # Lo recién visto primero; lo que ya no aparece en la ventana se conserva hasta el límite
+        seen_ids = list(dict.fromkeys(itertools.chain(ids, subscription.seen_ids or [])))[:self.seen_max]
+        fields: Dict[str, Any] = {}
+        if not subscription.title and entries and entries[0].uploader:
+            fields["title"] = entries[0].uploader
+        await asyncio.to_thread(
+            self._update, subscription_id, seen_ids=seen_ids, failures=0, last_error=None,
+            last_polled_at=now, last_new=len(new), next_poll_at=now + self._jittered(subscription.interval), **fields,
+        )
+        self.polls += 1
+        self.new_videos += len(new)
+        POLL_NEW_VIDEOS.inc(len(new))
+        POLL_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+        if new:
+            log_manager.publish(make_event(
+                LOG, f"[suscripción {subscription_id}] {len(new)} videos nuevos ({queued} en cola): {subscription.url}",
+                level="success", subscription_id=subscription_id,
+            ))
+
+    def _scan(self, url: str) -> List[Entry]:
+        # En un hilo del pool de extracción
+        return list(self.service.iter_entries(url, self.scan_limit))
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # --- Base de datos (se ejecuta en hilos) -------------------------------------
+
+    @staticmethod
+    def _due(now: float, exclude: Set[int], limit: int):
+        """Hasta `limit` suscripciones vencidas (las más atrasadas primero) y el próximo vencimiento."""
+        with SessionLocal() as db:
+            query = (select(Subscription.id, Subscription.next_poll_at)
+                     .where(Subscription.enabled.is_(True))
+                     .order_by(Subscription.next_poll_at))
+            if exclude:
+                query = query.where(Subscription.id.not_in(exclude))
+            due, next_at = [], None
+            for subscription_id, next_poll_at in db.execute(query):
+                if next_poll_at > now or len(due) >= limit:
+                    next_at = next_poll_at
+                    break
+                due.append(subscription_id)
+            return due, next_at
+
+    @staticmethod
+    def _insert(subscription: Subscription) -> Subscription:
+        with SessionLocal() as db:
+            db.add(subscription)
+            db.commit()
+            db.refresh(subscription)
+            return subscription
+
+    @staticmethod
+    def _get(subscription_id: int) -> Optional[Subscription]:
+        with SessionLocal() as db:
+            return db.get(Subscription, subscription_id)
+
+    @staticmethod
+    def _select() -> List[Subscription]:
+        with SessionLocal() as db:
+            return list(db.scalars(select(Subscription).order_by(Subscription.id)))
+
+    @staticmethod
+    def _update(subscription_id: int, **fields) -> Subscription:
+        with SessionLocal() as db:
+            subscription = db.get(Subscription, subscription_id)
+            if subscription is None:
+                raise KeyError(subscription_id)
+            for name, value in fields.items():
+                setattr(subscription, name, value)
+            db.commit()
+            return subscription
+
+    @staticmethod
+    def _delete(subscription_id: int) -> Subscription:
+        with SessionLocal() as db:
+            subscription = db.get(Subscription, subscription_id)
+            if subscription is None:
+                raise KeyError(subscription_id)
+            db.delete(subscription)
+            db.commit()
+            return subscription
+
+
+subscription_poller = SubscriptionPoller(
+    YtDlpService(),
+    max_polls=settings.SUBSCRIPTION_MAX_POLLS,
+    scan_limit=settings.SUBSCRIPTION_SCAN_LIMIT,
+    seen_max=settings.SUBSCRIPTION_SEEN_MAX,
+    jitter=settings.SUBSCRIPTION_JITTER,
+    backoff_max=settings.SUBSCRIPTION_BACKOFF_MAX,
+)
+metrics.gauge("subscription_polls_active", "Sondeos de suscripciones en curso").set_function(
+    lambda: subscription_poller.stats()["polling"]
+)
@@ -0,0 +1,230 @@
+"""
+Worker de descargas externo: ejecuta trabajos de la cola de otro proceso (el
+front end web) en este proceso o en otro equipo.
+
+El worker sondea `POST /api/v1/workers/{id}/poll` cada WORKER_POLL_INTERVAL
+segundos. Cada sondeo sirve de latido (renueva el lease de sus trabajos),
+entrega los logs y el progreso acumulados desde el anterior (el front end los
+publica en su LogManager, así los clientes WebSocket no notan la diferencia) y
+devuelve trabajos nuevos si hay cupo. Al terminar un trabajo se informa con
+`POST /api/v1/workers/{id}/jobs/{job_id}/finish`.
+
+DOWNLOAD_DIR debe ser el mismo directorio para el worker y el front end (disco
+compartido o montado en red): los archivos se informan como rutas relativas y
+el front end los indexa y los sirve en /files.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .core.config import settings
+from .core.diskspace import InsufficientSpace
+from .core.log_manager import log_manager, PROGRESS
+from .services import DownloadControl, YtDlpService, yt_dlp
+from .store import download_store
+
+# Estados finales (los mismos valores que app/jobs.py, sin importar el planificador)
+QUEUED = "queued"
+RUNNING = "running"
+POSTPROCESSING = "postprocessing"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class EventRelay:
+    """
+    Eventos pendientes de enviar al front end. Los logs se conservan en orden
+    (hasta `max_logs`, luego se descartan los más antiguos); del progreso solo
+    interesa el último de cada trabajo, como en LogManager.publish_progress.
+    """
+
+    def __init__(self, max_logs: int = 1000):
+        self._lock = threading.Lock()
+        self._logs: deque = deque(maxlen=max_logs)
+        self._progress: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self.dropped = 0
+
+    def __call__(self, event: Dict[str, Any]):
+        with self._lock:
+            if event.get("type") == PROGRESS:
+                self._progress[event.get("job_id")] = event
+            else:
+                if len(self._logs) == self._logs.maxlen:
+                    self.dropped += 1
+                self._logs.append(event)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = list(self._logs) + list(self._progress.values())
+            self._logs.clear()
+            self._progress.clear()
+        return events
+
+
+class DownloadWorker:
+    """
+    Ejecuta los trabajos que le cede el front end con el mismo pipeline que el
+    planificador local: `concurrency` descargas (red) y `postprocess_workers`
+    merges/FFmpeg (CPU) en pools separados.
+    """
+
+    def __init__(self, server: str, worker_id: str, concurrency: int = settings.MAX_CONCURRENT_DOWNLOADS,
+                 postprocess_workers: int = settings.POSTPROCESS_WORKERS, token: str = settings.WORKER_TOKEN,
+                 poll_interval: float = settings.WORKER_POLL_INTERVAL):
+        self.server = server.rstrip("/")
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.service = YtDlpService()
+        self.relay = EventRelay()
+
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client = httpx.Client(base_url=f"{self.server}{settings.API_PREFIX}/workers/{worker_id}",
+                                    headers=headers, timeout=30.0)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="worker-download")
+        self._pp_pool = ThreadPoolExecutor(max_workers=postprocess_workers, thread_name_prefix="worker-postprocess")
+        self._lock = threading.Lock()
+        self._controls: Dict[int, DownloadControl] = {}
+        self._phases: Dict[int, str] = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self.completed = 0
+        self.failed = 0
+
+    def run(self):
+        """Bucle de sondeo hasta `stop()`. Los trabajos en curso al parar vuelven a la cola del front end."""
+        log_manager.relay = self.relay
+        print(f"Worker {self.worker_id} conectado a {self.server} ({self.concurrency} descargas)")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self._poll()
+                except httpx.HTTPError as e:
+                    # El front end no responde: se reintenta; si el lease vence, el trabajo se reasigna
+                    print(f"Error al sondear {self.server}: {e}")
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        finally:
+            with self._lock:
+                controls = list(self._controls.values())
+            for control in controls:
+                control.request_stop(QUEUED)
+            self._pool.shutdown(wait=True)
+            self._pp_pool.shutdown(wait=True)
+            self._client.close()
+            log_manager.relay = None
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def _poll(self):
+        with self._lock:
+            jobs = dict(self._phases)
+            downloading = sum(1 for phase in jobs.values() if phase == RUNNING)
+        slots = 0 if self._stopping.is_set() else self.concurrency - downloading
+        events = self.relay.drain()
+        try:
+            response = self._client.post("/poll", json={"jobs": jobs, "slots": slots, "events": events})
+            response.raise_for_status()
+        except httpx.HTTPError:
+            for event in events:
+                self.relay(event)  # Se reenvían en el próximo sondeo
+            raise
+        data = response.json()
+        with self._lock:
+            for job_id, reason in data["stop"].items():
+                control = self._controls.get(int(job_id))
+                if control is not None:
+                    control.request_stop(reason)
+            for job_id in data["lost"]:
+                # El lease venció y el trabajo pudo reasignarse: se abandona conservando el .part
+                control = self._controls.get(int(job_id))
+                if control is not None:
+                    control.request_stop(QUEUED)
+        for job in data["jobs"]:
+            control = DownloadControl(job["id"])
+            control.file_tag = job.get("file_tag")
+            with self._lock:
+                self._controls[job["id"]] = control
+                self._phases[job["id"]] = RUNNING
+            self._pool.submit(self._download, job, control)
+
+    def _download(self, job: Dict[str, Any], control: DownloadControl):
+        job_id, started = job["id"], time.monotonic()
+        state, error, pending = COMPLETED, None, None
+        try:
+            pending = self.service.download_stage(job["url"], job["format"], job["subtitles"], job["options"], control)
+        except yt_dlp.utils.DownloadCancelled:
+            state = control.stop_reason or CANCELLED
+        except InsufficientSpace as e:
+            state, error = (QUEUED, None) if e.fits_ever else (FAILED, str(e))
+        except Exception as e:
+            state, error = FAILED, str(e)
+        download_stage_seconds = time.monotonic() - started
+        if pending is None:
+            self._report(job_id, control, state, error, [], download_stage_seconds, 0.0, False)
+            return
+        with self._lock:
+            self._phases[job_id] = POSTPROCESSING
+        self._wake.set()  # Cupo de descarga libre: pedir otro trabajo ya
+        self._pp_pool.submit(self._postprocess, job, control, pending, download_stage_seconds)
+
+    def _postprocess(self, job: Dict[str, Any], control: DownloadControl, pending, download_stage_seconds: float):
+        started, state, error, final_files = time.monotonic(), COMPLETED, None, []
+        try:
+            final_files = self.service.postprocess_stage(pending, job["url"], control)
+        except Exception as e:
+            state, error = FAILED, str(e)
+        self._report(job["id"], control, state, error, final_files, download_stage_seconds,
+                     time.monotonic() - started, True)
+
+    def _report(self, job_id: int, control: DownloadControl, state: str, error: Optional[str], final_files: List[str],
+                download_stage_seconds: float, postprocess_seconds: float, postprocessed: bool):
+        if state == CANCELLED:
+            for path in control.temp_files:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    pass
+        result = {
+            "state": state,
+            "error": error,
+            "files": [path for path in map(download_store.relative_path, final_files) if path],
+            "bytes_downloaded": control.bytes_downloaded,
+            "download_seconds": control.download_seconds,
+            "estimated_size": control.estimated_size,
+            "full_size": control.full_size,
+            "download_stage_seconds": download_stage_seconds,
+            "postprocess_seconds": postprocess_seconds,
+            "postprocessed": postprocessed,
+        }
+        if state == COMPLETED:
+            self.completed += 1
+        elif state == FAILED:
+            self.failed += 1
+        # Los eventos pendientes se publican antes que el estado final (mismo orden que en modo local)
+        result["events"] = self.relay.drain()
+        try:
+            for attempt in range(10):
+                try:
+                    response = self._client.post(f"/jobs/{job_id}/finish", json=result)
+                    if response.status_code == 409:
+                        break  # El lease venció y el trabajo se reasignó: este resultado ya no cuenta
+                    response.raise_for_status()
+                    break
+                except httpx.HTTPError as e:
+                    print(f"Error al informar el trabajo {job_id} (intento {attempt + 1}): {e}")
+                    time.sleep(min(2 ** attempt, 30))
+        finally:
+            with self._lock:
+                self._controls.pop(job_id, None)
+                self._phases.pop(job_id, None)
+            self._wake.set()
@@ -0,0 +1,12 @@
+"""
+Benchmark integrado del servicio, 100% offline.
+
+Levanta un servidor HTTP local con medios sintéticos (progresivo y DASH) y un
+extractor de yt-dlp que apunta a él, arranca la aplicación con uvicorn y la
+somete a carga en /preview, /download y /ws/logs.
+
+Uso (desde la raíz del proyecto):
+
+    python -m bench --previews 200 --downloads 20 --concurrency 8 --json resultados.json
+    python -m bench --compare antes.json despues.json
+"""
@@ -0,0 +1,110 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict
+
+# Métricas principales: (ruta en el JSON, etiqueta, True si "más alto es mejor")
+HEADLINE = [
+    ("preview.latency_ms.p50", "preview p50 (ms)", False),
+    ("preview.latency_ms.p99", "preview p99 (ms)", False),
+    ("preview.requests_per_second", "preview req/s", True),
+    ("preview.skeleton_bytes.p50", "preview esqueleto (bytes)", False),
+    ("preview.fragments.latency_ms.p50", "preview fragmentos p50 (ms)", False),
+    ("download.throughput_mb_s", "descarga total (MB/s)", True),
+    ("download.per_job_mb_s.p50", "descarga por trabajo p50 (MB/s)", True),
+    ("download.stage_seconds.queue.p50", "espera en cola p50 (s)", False),
+    ("download.websocket.delivery_latency_ms.progress.p99", "WS progreso p99 (ms)", False),
+    ("download.websocket.delivery_latency_ms.state.p99", "WS estado p99 (ms)", False),
+    ("loop_lag_ms.p99", "lag del event loop p99 (ms)", False),
+    ("loop_lag_ms.max", "lag del event loop máx (ms)", False),
+    ("memory.max_rss_mb", "memoria máx (MB)", False),
+]
+
+
+def _lookup(data: Dict[str, Any], path: str):
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def print_report(result: Dict[str, Any]):
+    meta = result.get("meta", {})
+    print(f"Benchmark {meta.get('git') or ''} ({meta.get('timestamp', '')}, yt-dlp {meta.get('yt_dlp', '?')})")
+    for path, label, _ in HEADLINE:
+        value = _lookup(result, path)
+        if value is not None:
+            print(f"  {label:<36} {value}")
+    for phase in ("preview", "download"):
+        if phase in result:
+            print(f"  {phase} estados: {result[phase].get('status') or result[phase].get('states')}")
+
+
+def print_comparison(old: Dict[str, Any], new: Dict[str, Any]):
+    print(f"{'métrica':<36} {'antes':>10} {'después':>10} {'cambio':>9}")
+    for path, label, higher_is_better in HEADLINE:
+        before, after = _lookup(old, path), _lookup(new, path)
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        better = (after > before) == higher_is_better if after != before else None
+        mark = "" if better is None else (" ✓" if better else " ✗")
+        print(f"{label:<36} {before:>10} {after:>10} {change:>9}{mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark offline del servicio.")
+    parser.add_argument("--previews", type=int, default=100, help="Solicitudes a /preview (0 = omitir)")
+    parser.add_argument("--distinct", type=int, default=0, help="Videos distintos en /preview (0 = todos distintos)")
+    parser.add_argument("--downloads", type=int, default=10, help="Descargas a encolar (0 = omitir)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clientes simultáneos")
+    parser.add_argument("--size-mb", type=float, default=20.0, help="Tamaño de cada video sintético")
+    parser.add_argument("--formats", type=int, default=10, help="Formatos de video adicionales por video")
+    parser.add_argument("--format", default="18", help="Formato a descargar ('137+140' = DASH, requiere FFmpeg)")
+    parser.add_argument("--captions", type=int, default=7, help="Idiomas de subtítulos automáticos por video")
+    parser.add_argument("--extract-latency", type=float, default=0.05, help="Retraso (s) del servidor al servir metadatos")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Tiempo máximo (s) por fase")
+    parser.add_argument("--port", type=int, default=0, help="Puerto de la aplicación (0 = uno libre)")
+    parser.add_argument("--set", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="Sobrescribe un ajuste de app/core/config.py (ej: --set MAX_CONCURRENT_DOWNLOADS=6)")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="Muestra la salida de la aplicación")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DESPUES"), help="Compara dos resultados JSON")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print_comparison(json.load(f_old), json.load(f_new))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        # Los ajustes se leen al importar la aplicación: base de datos y descargas aisladas
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        # Todo el tráfico va a un único host local: sin token bucket por host (se mide en bench.resilience)
+        os.environ["GOVERNOR_HOST_RATE"] = "0"
+        for item in args.set:
+            key, _, value = item.partition("=")
+            os.environ[key.strip()] = value.strip()
+
+        from .runner import run_benchmark
+
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            result = run_benchmark(args)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
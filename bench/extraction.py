@@ -0,0 +1,110 @@
+"""
+Benchmark de extracción: latencia de YtDlpService.get_video_info creando un
+YoutubeDL por llamada (en frío) frente a reutilizar las instancias del pool
+de app/core/ydl_pool.py.
+
+    python -m bench.extraction --calls 200 --threads 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+from .stats import percentiles
+
+
+def _run_mode(service, pool, media, pooled: bool, calls: int, threads: int) -> Dict[str, Any]:
+    pool.enabled = pooled
+    pool.close_all()
+    before = pool.stats()
+    requests, connections = media.requests, media.connections
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(calls))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            service.get_video_info(media.video_url(f"x{i}"))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker, name=f"bench-extract-{n}") for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - start
+    after = pool.stats()
+    return {
+        "calls": calls,
+        "threads": threads,
+        "wall_seconds": round(wall, 3),
+        "calls_per_second": round(calls / wall, 2) if wall else None,
+        "latency_ms": percentiles(latencies, 1000),
+        "instances_created": after["created"] - before["created"],
+        "http_requests": media.requests - requests,
+        "tcp_connections": media.connections - connections,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.extraction",
+                                     description="Extracción con YoutubeDL en frío frente al pool por hilo.")
+    parser.add_argument("--calls", type=int, default=200, help="Extracciones por modo")
+    parser.add_argument("--threads", type=int, default=4, help="Hilos simultáneos (como EXTRACT_WORKERS)")
+    parser.add_argument("--formats", type=int, default=10, help="Formatos de video adicionales por video")
+    parser.add_argument("--extract-latency", type=float, default=0.0, help="Retraso (s) del servidor al servir metadatos")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        # Todo el tráfico va a un único host local: sin token bucket por host (se mide en bench.resilience)
+        os.environ["GOVERNOR_HOST_RATE"] = "0"
+
+        from app.core.ydl_pool import extraction_ydl_pool
+        from app.services import YtDlpService
+
+        from .extractor import BenchIE
+        from .media_server import MediaServer
+
+        media = MediaServer(size=1024 * 1024, extra_formats=args.formats, latency=args.extract_latency)
+        media.start()
+        YtDlpService.extra_extractors = [BenchIE, *YtDlpService.extra_extractors]
+        service = YtDlpService()
+        try:
+            # Primera llamada fuera de la medición: importación perezosa de extractores
+            service.get_video_info(media.video_url("warmup"))
+            result = {
+                "cold": _run_mode(service, extraction_ydl_pool, media, False, args.calls, args.threads),
+                "pooled": _run_mode(service, extraction_ydl_pool, media, True, args.calls, args.threads),
+            }
+        finally:
+            extraction_ydl_pool.close_all()
+            media.stop()
+
+    print(f"{'modo':<8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'llamadas/s':>11} {'instancias':>11} {'conexiones':>11}")
+    for mode, data in result.items():
+        latency = data["latency_ms"]
+        print(f"{mode:<8} {latency['p50']:>9} {latency['p99']:>9} {data['calls_per_second']:>11} "
+              f"{data['instances_created']:>11} {data['tcp_connections']:>11}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
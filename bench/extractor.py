@@ -0,0 +1,24 @@
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class BenchIE(InfoExtractor):
+    """
+    Extractor de yt-dlp para los videos sintéticos de bench/media_server.py.
+    Lee los metadatos por HTTP (como un extractor real) desde el servidor local.
+    """
+    IE_NAME = 'bench'
+    _VALID_URL = r'https?://(?P<host>127\.0\.0\.1|localhost):(?P<port>\d+)/watch/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        host, port, video_id = self._match_valid_url(url).group('host', 'port', 'id')
+        return self._download_json(f'http://{host}:{port}/api/videos/{video_id}.json', video_id)
+
+
+class BenchChannelIE(InfoExtractor):
+    """Canales sintéticos de bench/media_server.py (playlist de videos de BenchIE)."""
+    IE_NAME = 'bench:channel'
+    _VALID_URL = r'https?://(?P<host>127\.0\.0\.1|localhost):(?P<port>\d+)/channel/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        host, port, channel_id = self._match_valid_url(url).group('host', 'port', 'id')
+        return self._download_json(f'http://{host}:{port}/api/channels/{channel_id}.json', channel_id)
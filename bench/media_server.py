@@ -0,0 +1,276 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+MiB = 1024 * 1024
+
+# Bloque pseudoaleatorio que se repite para servir cualquier tamaño sin guardarlo en memoria
+_BLOCK = random.Random(0).randbytes(MiB)
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class MediaServer:
+    """
+    Servidor HTTP local (en un hilo aparte) con videos sintéticos.
+
+    Rutas:
+      /watch/<id>               página del video (la URL que recibe la aplicación)
+      /api/videos/<id>.json     metadatos que lee el extractor de bench
+      /media/<id>/<format_id>   contenido del formato (admite Range / 206)
+      /channel/<name>           canal (playlist) con los videos de `channels[name]`
+      /api/channels/<name>.json entradas del canal que lee el extractor de bench
+      /thumb/<id>.jpg           miniatura
+      /subs/<id>.<lang>.vtt     subtítulos
+
+    Todos los videos tienen los mismos formatos: un progresivo ('18'), un par
+    DASH video/audio ('137' + '140') y `extra_formats` variantes de video adicionales.
+
+    Fallos simulados del contenido (/media), por id de video:
+      `media_errors[id] = n`     las próximas n solicitudes responden 429 Too Many Requests
+      `throttled[id] = n`        las próximas n conexiones se sirven a `throttle_rate` bytes/s
+    """
+
+    def __init__(self, size: int, extra_formats: int = 10, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 captions: int = 7):
+        self.size = size
+        self.extra_formats = extra_formats
+        self.captions = captions
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0  # Conexiones TCP aceptadas (menos que requests = keep-alive)
+        self.bytes_sent = 0
+        self.channels: Dict[str, List[str]] = {}  # Canal -> ids de video, lo más reciente primero
+        self.channel_requests = 0
+        self.media_errors: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+        self.throttle_rate = 64 * 1024
+        self.rate_limited = 0       # Respuestas 429 enviadas
+        self.throttled_served = 0   # Conexiones servidas lentas
+        self.channel_errors: Dict[str, int] = {}  # Canal -> próximas respuestas 500 a devolver
+        self._channel_active = 0
+        self.peak_channel_active = 0  # Máximo de consultas de canal simultáneas
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.media = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def video_url(self, video_id: str) -> str:
+        return f"{self.base_url}/watch/{video_id}"
+
+    def channel_url(self, name: str) -> str:
+        return f"{self.base_url}/channel/{name}"
+
+    def publish(self, channel: str, *video_ids: str):
+        """Publica videos nuevos en un canal (aparecen al principio, como en YouTube)."""
+        with self._lock:
+            self.channels[channel] = [*reversed(video_ids), *self.channels.get(channel, [])]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="bench-media", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, sent: int):
+        with self._lock:
+            self.bytes_sent += sent
+
+    # --- Catálogo sintético ----------------------------------------------------
+
+    def formats(self, video_id: str) -> List[Dict[str, Any]]:
+        base = f"{self.base_url}/media/{video_id}"
+        formats = [
+            {"format_id": "18", "ext": "mp4", "width": 640, "height": 360, "fps": 30,
+             "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "tbr": 700},
+            {"format_id": "137", "ext": "mp4", "width": 1920, "height": 1080, "fps": 30,
+             "vcodec": "avc1.640028", "acodec": "none", "tbr": 4500},
+            {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 128, "tbr": 128},
+        ]
+        heights = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+        for i in range(self.extra_formats):
+            height = heights[i % len(heights)]
+            formats.append({
+                "format_id": f"{300 + i}", "ext": "webm", "width": height * 16 // 9, "height": height, "fps": 30,
+                "vcodec": "vp09.00.40.08", "acodec": "none", "tbr": height * 3,
+            })
+        for fmt in formats:
+            fmt["url"] = f"{base}/{fmt['format_id']}"
+            fmt["filesize"] = self.format_size(fmt["format_id"])
+            fmt["protocol"] = "http"
+        return formats
+
+    def format_size(self, format_id: str) -> int:
+        if format_id == "140":
+            return max(self.size // 8, 1)
+        if format_id == "137":
+            return self.size - self.size // 8
+        return self.size
+
+    def caption_languages(self) -> List[str]:
+        """Idiomas de subtítulos automáticos (YouTube llega a ofrecer cientos)."""
+        base = ["en", "es", "fr", "de", "pt", "it", "ja"]
+        return (base + [f"x{i}" for i in range(max(self.captions - len(base), 0))])[:self.captions]
+
+    def channel(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            video_ids = list(self.channels.get(name, []))
+        return {
+            "_type": "playlist",
+            "id": name,
+            "title": f"Bench channel {name}",
+            "entries": [
+                {"_type": "url", "ie_key": "Bench", "id": video_id, "url": self.video_url(video_id),
+                 "title": f"Bench video {video_id}", "uploader": f"Bench channel {name}"}
+                for video_id in video_ids
+            ],
+        }
+
+    def metadata(self, video_id: str) -> Dict[str, Any]:
+        base = self.base_url
+        return {
+            "id": video_id,
+            "title": f"Bench video {video_id}",
+            "duration": 600,
+            "uploader": "bench",
+            "webpage_url": self.video_url(video_id),
+            "thumbnail": f"{base}/thumb/{video_id}.jpg",
+            "formats": self.formats(video_id),
+            "subtitles": {
+                lang: [{"ext": "vtt", "url": f"{base}/subs/{video_id}.{lang}.vtt"}]
+                for lang in ("en", "es")
+            },
+            "automatic_captions": {
+                lang: [{"ext": "vtt", "url": f"{base}/subs/{video_id}.{lang}.vtt"}]
+                for lang in self.caption_languages()
+            },
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def media(self) -> MediaServer:
+        return self.server.media
+
+    def log_message(self, format, *args):
+        pass  # Sin ruido en la salida del benchmark
+
+    def setup(self):
+        super().setup()
+        with self.media._lock:
+            self.media.connections += 1
+
+    def do_GET(self):
+        media = self.media
+        with media._lock:
+            media.requests += 1
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "watch":
+            return self._send_bytes(f"<html><title>{parts[1]}</title></html>".encode(), "text/html")
+        if len(parts) == 3 and parts[:2] == ["api", "videos"] and parts[2].endswith(".json"):
+            if media.latency:
+                time.sleep(media.latency)  # Simula el coste de la extracción remota
+            return self._send_bytes(json.dumps(media.metadata(parts[2][:-5])).encode(), "application/json")
+        if len(parts) == 2 and parts[0] == "channel":
+            return self._send_bytes(f"<html><title>{parts[1]}</title></html>".encode(), "text/html")
+        if len(parts) == 3 and parts[:2] == ["api", "channels"] and parts[2].endswith(".json"):
+            return self._send_channel(parts[2][:-5])
+        if len(parts) == 3 and parts[0] == "media":
+            with media._lock:
+                failing = media.media_errors.get(parts[1], 0)
+                slow = not failing and media.throttled.get(parts[1], 0)
+                if failing:
+                    media.media_errors[parts[1]] = failing - 1
+                    media.rate_limited += 1
+                elif slow:
+                    media.throttled[parts[1]] = slow - 1
+                    media.throttled_served += 1
+            if failing:
+                return self.send_error(429)
+            return self._send_media(media.format_size(parts[2]), media.throttle_rate if slow else 0)
+        if len(parts) == 2 and parts[0] == "thumb":
+            return self._send_bytes(_BLOCK[:4096], "image/jpeg")
+        if len(parts) == 2 and parts[0] == "subs":
+            return self._send_bytes(b"WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nbench\n", "text/vtt")
+        self.send_error(404)
+
+    def _send_channel(self, name: str):
+        media = self.media
+        with media._lock:
+            media.channel_requests += 1
+            media._channel_active += 1
+            media.peak_channel_active = max(media.peak_channel_active, media._channel_active)
+            failing = media.channel_errors.get(name, 0)
+            if failing:
+                media.channel_errors[name] = failing - 1
+        try:
+            if media.latency:
+                time.sleep(media.latency)
+            if failing:
+                return self.send_error(500)
+            return self._send_bytes(json.dumps(media.channel(name)).encode(), "application/json")
+        finally:
+            with media._lock:
+                media._channel_active -= 1
+
+    def _send_bytes(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_media(self, size: int, rate: int = 0):
+        start, end = 0, size - 1
+        match = _RANGE_RE.fullmatch(self.headers.get("Range", "").strip())
+        if match:
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            elif match.group(2):
+                start = max(size - int(match.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        position, sent = start, 0
+        try:
+            while position <= end:
+                offset = position % MiB
+                chunk = _BLOCK[offset:offset + min(64 * 1024, end - position + 1, MiB - offset)]
+                if rate:
+                    chunk = chunk[:max(rate // 10, 1)]
+                    time.sleep(len(chunk) / rate)
+                self.wfile.write(chunk)
+                position += len(chunk)
+                sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.media._count(sent)
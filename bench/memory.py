@@ -0,0 +1,117 @@
+"""
+Benchmark de memoria de los metadatos en memoria: una playlist sintética grande
+con la representación anterior (modelos pydantic de app/schemas.py) frente a la
+compacta de app/metadata.py.
+
+    python -m bench.memory --entries 1000 --captions 150 --max-ratio 0.5
+
+Construye, a partir de info_dicts como los de yt-dlp (JSON ya decodificado), las
+entradas planas del lote (Entry / BatchEntry) y los metadatos completos de cada
+video (Video / VideoInfo, con formatos y subtítulos automáticos), y mide con
+tracemalloc lo que queda retenido de cada representación. Comprueba además que el
+JSON de la caché en disco es el mismo que el de VideoInfo y que la ida y vuelta
+conserva los datos. Sale con código 1 si la representación compacta ocupa más de
+`--max-ratio` veces la anterior o si alguna comprobación no se cumple.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+MB = 1024 * 1024
+
+
+def _measure(build: Callable[[], List[Any]]) -> Dict[str, Any]:
+    """Memoria retenida (bytes) y tiempo de `build()`; el resultado se conserva hasta medir."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    objects = build()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return {"bytes": retained, "seconds": round(seconds, 3)}
+
+
+def _playlist(media, entries: int) -> Dict[str, List[Dict[str, Any]]]:
+    """info_dicts decodificados de JSON (cadenas propias, como al leer la respuesta del sitio)."""
+    channel = f"c{entries}"
+    video_ids = [f"m{i}" for i in range(entries)]
+    media.publish(channel, *video_ids)
+    return {
+        "flat": json.loads(json.dumps(media.channel(channel)["entries"])),
+        "full": [json.loads(json.dumps(media.metadata(video_id))) for video_id in video_ids],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.memory",
+                                     description="Memoria de los metadatos: modelos pydantic frente a app/metadata.py.")
+    parser.add_argument("--entries", type=int, default=1000, help="Videos de la playlist sintética")
+    parser.add_argument("--captions", type=int, default=150, help="Subtítulos automáticos por video")
+    parser.add_argument("--formats", type=int, default=20, help="Formatos de video adicionales por video")
+    parser.add_argument("--max-ratio", type=float, default=0.5, help="Máximo compacta/pydantic aceptado")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    from app.metadata import Video
+    from app.services import YtDlpService
+
+    from .media_server import MediaServer
+
+    media = MediaServer(size=MB, extra_formats=args.formats, captions=args.captions)
+    media.start()
+    try:
+        data = _playlist(media, args.entries)
+    finally:
+        media.stop()
+    service = YtDlpService()
+    flat, full = data["flat"], data["full"]
+
+    def videos():
+        return [service._video(info, info["webpage_url"]) for info in full]
+
+    # La representación anterior se construye como antes (un modelo por formato y
+    # subtítulo); las cadenas internadas que comparte con la compacta la favorecen
+    results = {
+        "entries": {
+            "pydantic": _measure(lambda: [service._batch_entry(entry).to_schema() for entry in flat]),
+            "compact": _measure(lambda: [service._batch_entry(entry) for entry in flat]),
+        },
+        "videos": {
+            "pydantic": _measure(lambda: [video.to_schema() for video in videos()]),
+            "compact": _measure(videos),
+        },
+    }
+
+    failures = []
+    sample = service._video(full[0], full[0]["webpage_url"])
+    if json.loads(sample.to_json()) != json.loads(sample.to_schema().model_dump_json()):
+        failures.append("el JSON de la caché en disco no coincide con el de VideoInfo")
+    if Video.from_json(sample.to_json()) != sample:
+        failures.append("la ida y vuelta por JSON no conserva los metadatos")
+
+    print(f"  {args.entries} videos, {args.formats + 3} formatos y {args.captions + 2} subtítulos por video")
+    for name, result in results.items():
+        before, after = result["pydantic"], result["compact"]
+        result["ratio"] = round(after["bytes"] / before["bytes"], 3) if before["bytes"] else None
+        print(f"  {name}: pydantic {before['bytes'] / MB:.2f} MB en {before['seconds']}s, "
+              f"compacta {after['bytes'] / MB:.2f} MB en {after['seconds']}s (x{result['ratio']})")
+        if result["ratio"] is None or result["ratio"] > args.max_ratio:
+            failures.append(f"{name}: la representación compacta ocupa x{result['ratio']} (máximo x{args.max_ratio})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
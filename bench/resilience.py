@@ -0,0 +1,165 @@
+"""
+Benchmark de resiliencia ante límites del sitio (app/core/governor.py): respuestas
+429 y descargas estranguladas.
+
+    python -m bench.resilience --downloads 8 --rate-limited 2 --throttled 2
+
+El servidor sintético responde 429 a las primeras solicitudes de contenido de
+algunos videos y sirve otros a velocidad de goteo. Comprueba que los 429 se
+clasifican y se reintentan con backoff hasta completarse, que las descargas
+estranguladas se detectan y reconectan (siguiendo desde el .part), que un video
+que nunca deja de responder 429 falla tras JOB_MAX_RETRIES reintentos con su
+motivo, y que las tasas de éxito y de estrangulamiento del host se reflejan en
+las estadísticas del regulador. Sale con código 1 si alguna comprobación no se cumple.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+MB = 1024 * 1024
+
+
+async def _run(args, media) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.core.database import init_db
+    from app.core.governor import request_governor, host_key
+    from app.jobs import job_scheduler, COMPLETED, FAILED, CANCELLED
+    from app.store import download_store
+
+    init_db()
+    await download_store.reconcile()
+    await job_scheduler.start()
+    try:
+        kinds = {}
+        for i in range(args.downloads):
+            video_id = f"r{i}"
+            if i < args.rate_limited:
+                media.media_errors[video_id] = settings.JOB_MAX_RETRIES - 1
+                kinds[video_id] = "rate_limited"
+            elif i < args.rate_limited + args.throttled:
+                media.throttled[video_id] = 1
+                kinds[video_id] = "throttled"
+            else:
+                kinds[video_id] = "healthy"
+        # Nunca deja de responder 429: agota los reintentos
+        media.media_errors["r-blocked"] = 1000
+        kinds["r-blocked"] = "blocked"
+
+        started = time.perf_counter()
+        ids = {}
+        for video_id in kinds:
+            submission = await job_scheduler.submit(media.video_url(video_id), video_id, "18", [], {})
+            ids[submission.job.id] = video_id
+
+        deadline = time.monotonic() + args.timeout
+        jobs = []
+        while time.monotonic() < deadline:
+            jobs = await job_scheduler.list_jobs(limit=len(kinds))
+            if all(job.state in (COMPLETED, FAILED, CANCELLED) for job in jobs):
+                break
+            await asyncio.sleep(0.1)
+        seconds = time.perf_counter() - started
+
+        per_kind: Dict[str, Dict[str, Any]] = {}
+        for job in jobs:
+            entry = per_kind.setdefault(kinds[ids[job.id]], {"states": {}, "attempts": 0, "reasons": {}})
+            entry["states"][job.state] = entry["states"].get(job.state, 0) + 1
+            entry["attempts"] += job.attempts
+            if job.error_reason:
+                entry["reasons"][job.error_reason] = entry["reasons"].get(job.error_reason, 0) + 1
+        return {
+            "downloads": len(kinds),
+            "seconds": round(seconds, 3),
+            "per_kind": per_kind,
+            "media": {"rate_limited": media.rate_limited, "throttled": media.throttled_served},
+            "host": request_governor.stats()["hosts"].get(host_key(media.base_url), {}),
+            "max_retries": settings.JOB_MAX_RETRIES,
+        }
+    finally:
+        await job_scheduler.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.resilience",
+                                     description="Reintentos ante 429 y reconexión de descargas estranguladas.")
+    parser.add_argument("--downloads", type=int, default=8, help="Descargas a encolar")
+    parser.add_argument("--rate-limited", type=int, default=2, help="De ellas, cuántas reciben 429 al principio")
+    parser.add_argument("--throttled", type=int, default=2, help="De ellas, cuántas se sirven a velocidad de goteo")
+    parser.add_argument("--size-mb", type=int, default=4, help="Tamaño de cada video sintético")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Tiempo máximo (s)")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        # Esperas cortas para que el benchmark dure segundos
+        os.environ["GOVERNOR_HOST_RATE"] = "20"
+        os.environ["GOVERNOR_BACKOFF"] = "0.2"
+        os.environ["GOVERNOR_BACKOFF_MAX"] = "1"
+        os.environ["THROTTLE_MIN_SPEED"] = str(512 * 1024)
+        os.environ["THROTTLE_WINDOW"] = "1"
+        os.environ["JOB_MAX_RETRIES"] = "3"
+        os.environ["JOB_RETRY_BACKOFF"] = "0.2"
+        os.environ["JOB_RETRY_BACKOFF_MAX"] = "1"
+        os.environ["SUBSCRIPTIONS_ENABLED"] = "false"
+
+        from app.core.config import ensure_download_dir
+        from app.services import YtDlpService
+
+        from .extractor import BenchIE
+        from .media_server import MediaServer
+
+        ensure_download_dir()
+        media = MediaServer(size=args.size_mb * MB)
+        media.start()
+        YtDlpService.extra_extractors = [BenchIE, *YtDlpService.extra_extractors]
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(_run(args, media))
+        finally:
+            media.stop()
+
+    print(f"  {result['downloads']} descargas en {result['seconds']}s "
+          f"({result['media']['rate_limited']} respuestas 429, {result['media']['throttled']} conexiones lentas)")
+    for kind, entry in result["per_kind"].items():
+        print(f"  {kind}: {entry['states']}, reintentos {entry['attempts']}, motivos {entry['reasons']}")
+    host = result["host"]
+    print(f"  host: éxito {host.get('success_rate')}, estrangulamiento {host.get('throttle_rate')}, "
+          f"resultados {host.get('outcomes')}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    per_kind = result["per_kind"]
+    for kind in ("healthy", "rate_limited", "throttled"):
+        entry = per_kind.get(kind)
+        if entry and set(entry["states"]) != {"completed"}:
+            failures.append(f"las descargas '{kind}' no terminaron todas")
+    if args.rate_limited and not per_kind["rate_limited"]["attempts"]:
+        failures.append("los 429 no se reintentaron")
+    if per_kind.get("healthy", {}).get("attempts"):
+        failures.append("se reintentaron descargas sin fallos")
+    blocked = per_kind["blocked"]
+    if blocked["states"] != {"failed": 1} or blocked["reasons"] != {"rate_limited": 1} \
+            or blocked["attempts"] != result["max_retries"]:
+        failures.append("el video bloqueado no falló con motivo rate_limited tras agotar los reintentos")
+    outcomes = host.get("outcomes", {})
+    if args.throttled and outcomes.get("throttled", 0) < args.throttled:
+        failures.append("no se detectaron las descargas estranguladas")
+    if not outcomes.get("rate_limited") or not host.get("throttle_rate") or host.get("success_rate", 1) >= 1:
+        failures.append("las tasas por host no reflejan los 429 ni el estrangulamiento")
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import platform
+import socket
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+import websockets
+import yt_dlp
+
+from app.main import app
+from app.services import YtDlpService
+
+from .extractor import BenchIE
+from .media_server import MediaServer, MiB
+from .stats import percentiles
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+
+def max_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso (servidor + cliente del benchmark)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KiB, macOS en bytes
+    return round(rss / (MiB if platform.system() == "Darwin" else 1024), 1)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """La aplicación real servida por uvicorn en un hilo con su propio event loop."""
+
+    def __init__(self, port: int = 0):
+        self.port = port or _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._serve, name="bench-app", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def start(self, timeout: float = 30.0):
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("La aplicación no arrancó")
+            time.sleep(0.05)
+
+    def stop(self, timeout: float = 30.0):
+        self.server.should_exit = True
+        self._thread.join(timeout)
+
+
+class LoopLagMonitor:
+    """Mide el retraso del event loop de la aplicación: cuánto tarda en despertar un sleep."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.05):
+        self.loop = loop
+        self.interval = interval
+        self.samples: List[float] = []
+        self._future = None
+
+    async def _probe(self):
+        while True:
+            start = self.loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(self.loop.time() - start - self.interval, 0.0))
+
+    def start(self):
+        self._future = asyncio.run_coroutine_threadsafe(self._probe(), self.loop)
+
+    def stop(self):
+        if self._future is not None:
+            self._future.cancel()
+
+
+async def preview_phase(client: httpx.AsyncClient, media: MediaServer, requests: int,
+                        concurrency: int, distinct: int) -> Dict[str, Any]:
+    """
+    /preview con `concurrency` clientes; `distinct` videos distintos (el resto son aciertos de caché).
+    Tras el esqueleto pide los fragmentos de formatos y subtítulos como el navegador,
+    revalidando con If-None-Match los que ya recibió (304).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    fragment_latencies: List[float] = []
+    statuses: Counter = Counter()
+    fragment_statuses: Counter = Counter()
+    skeleton_bytes: List[int] = []
+    fragment_bytes: List[int] = []
+    etags: Dict[Tuple[str, str], str] = {}
+
+    async def one(i: int):
+        url = media.video_url(f"p{i % distinct}")
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/v1/preview", data={"url": url})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code != 200:
+                return
+            skeleton_bytes.append(len(response.content))
+            for fragment in ("formats", "subtitles"):
+                cached = etags.get((url, fragment))
+                start = time.perf_counter()
+                response = await client.get(f"/api/v1/preview/{fragment}", params={"url": url},
+                                            headers={"If-None-Match": cached} if cached else None)
+                fragment_latencies.append(time.perf_counter() - start)
+                fragment_statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    fragment_bytes.append(len(response.content))
+                    etags[(url, fragment)] = response.headers["etag"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "distinct_videos": distinct,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(requests / wall, 2) if wall else None,
+        "status": dict(statuses),
+        "latency_ms": percentiles(latencies, 1000),
+        "skeleton_bytes": percentiles(skeleton_bytes),
+        "fragments": {
+            "status": dict(fragment_statuses),
+            "latency_ms": percentiles(fragment_latencies, 1000),
+            "bytes": percentiles(fragment_bytes),
+        },
+    }
+
+
+async def download_phase(client: httpx.AsyncClient, app_server: AppServer, media: MediaServer, downloads: int,
+                         concurrency: int, format_id: str, timeout: float) -> Dict[str, Any]:
+    """
+    Encola `downloads` descargas mientras un cliente de /ws/logs recibe todos los
+    eventos; termina cuando todos los trabajos llegan a un estado final.
+    """
+    ws_url = app_server.base_url.replace("http", "ws", 1) + "/ws/logs/bench"
+    semaphore = asyncio.Semaphore(concurrency)
+    job_ids: set = set()
+    finished: Dict[int, str] = {}
+    delivery: Dict[str, List[float]] = defaultdict(list)
+    frames = 0
+    all_finished = asyncio.Event()
+
+    async def submit(i: int):
+        video_id = f"d{i}"
+        async with semaphore:
+            response = await client.post("/api/v1/download", data={
+                "url": media.video_url(video_id), "title": f"Bench video {video_id}", "video_format_id": format_id,
+            })
+            response.raise_for_status()
+            job_ids.add(response.json()["job_id"])
+
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        async def listen():
+            nonlocal frames
+            async for frame in ws:
+                received = time.time()
+                frames += 1
+                for event in json.loads(frame):
+                    delivery[event["type"]].append(received - event["ts"])
+                    if event["type"] == "state" and event.get("state") in TERMINAL_STATES:
+                        finished[event["job_id"]] = event["state"]
+                if len(job_ids) == downloads and job_ids <= finished.keys():
+                    all_finished.set()
+
+        listener = asyncio.ensure_future(listen())
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(submit(i) for i in range(downloads)))
+            await asyncio.wait_for(all_finished.wait(), timeout)
+        finally:
+            wall = time.perf_counter() - start
+            listener.cancel()
+
+    response = await client.get("/api/v1/jobs", params={"limit": max(downloads * 2, 100)})
+    jobs = [job for job in response.json() if job["id"] in job_ids]
+    total_bytes = sum(job["bytes_downloaded"] for job in jobs)
+    return {
+        "downloads": downloads,
+        "format": format_id,
+        "wall_seconds": round(wall, 3),
+        "states": dict(Counter(finished.values())),
+        "total_mb": round(total_bytes / MiB, 2),
+        "throughput_mb_s": round(total_bytes / MiB / wall, 2) if wall else None,
+        "per_job_mb_s": percentiles([job["avg_speed"] for job in jobs], 1 / MiB),
+        "stage_seconds": {
+            "queue": percentiles([job["queue_seconds"] for job in jobs]),
+            "download": percentiles([job["download_stage_seconds"] for job in jobs]),
+            "postprocess": percentiles([job["postprocess_seconds"] for job in jobs]),
+        },
+        "websocket": {
+            "frames": frames,
+            "events": sum(len(v) for v in delivery.values()),
+            "delivery_latency_ms": {kind: percentiles(values, 1000) for kind, values in sorted(delivery.items())},
+        },
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    media = MediaServer(size=int(args.size_mb * MiB), extra_formats=args.formats, latency=args.extract_latency,
+                        captions=args.captions)
+    media.start()
+    YtDlpService.extra_extractors = [BenchIE, *YtDlpService.extra_extractors]
+    YtDlpService.clear_video_keys()
+
+    app_server = AppServer(args.port)
+    app_server.start()
+    monitor = LoopLagMonitor(app_server.loop)
+    monitor.start()
+
+    async def drive() -> Dict[str, Any]:
+        async with httpx.AsyncClient(base_url=app_server.base_url, timeout=args.timeout) as client:
+            results: Dict[str, Any] = {}
+            if args.previews:
+                results["preview"] = await preview_phase(
+                    client, media, args.previews, args.concurrency, args.distinct or args.previews)
+            if args.downloads:
+                results["download"] = await download_phase(
+                    client, app_server, media, args.downloads, args.concurrency, args.format, args.timeout)
+            results["app_stats"] = (await client.get("/api/v1/stats")).json()
+            return results
+
+    try:
+        results = asyncio.run(drive())
+    finally:
+        monitor.stop()
+        app_server.stop()
+        media.stop()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "yt_dlp": yt_dlp.version.__version__,
+            "platform": platform.platform(),
+        },
+        "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        **results,
+        "loop_lag_ms": percentiles(monitor.samples, 1000),
+        "memory": {"max_rss_mb": max_rss_mb()},
+        "media_server": {"requests": media.requests, "mb_sent": round(media.bytes_sent / MiB, 2)},
+    }
@@ -0,0 +1,148 @@
+"""
+Benchmark de arranque en frío, con umbrales para detectar regresiones:
+
+    python -m bench.startup --runs 5 --max-import 1.5 --max-ready 3.0
+
+Mide en procesos nuevos (sin cachés del intérprete en memoria):
+  - import: tiempo de `import app.main`, y que no importe yt-dlp ni cree DOWNLOAD_DIR;
+  - ready: desde lanzar launcher.py hasta la primera respuesta 200 de "/";
+  - warm: hasta que el calentamiento en segundo plano termina de cargar yt-dlp.
+
+Sale con código 1 si se supera algún umbral o se rompe alguna de las comprobaciones.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from .stats import percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_SCRIPT = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app.main\n"
+    "print(json.dumps({'seconds': time.perf_counter() - start, 'yt_dlp': 'yt_dlp' in sys.modules}))\n"
+)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _env(workdir: str) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "DOWNLOAD_DIR": os.path.join(workdir, "media"),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "PYTHONUNBUFFERED": "1",  # Para leer "yt-dlp cargado" en cuanto se imprime
+    }
+
+
+def measure_import(workdir: str) -> Dict[str, Any]:
+    env = _env(workdir)
+    output = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["download_dir_created"] = os.path.exists(env["DOWNLOAD_DIR"])
+    return result
+
+
+def measure_launch(workdir: str, timeout: float) -> Dict[str, Optional[float]]:
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "launcher.py"), "--no-browser", "--port", str(port)],
+        cwd=ROOT, env=_env(workdir), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    warm = threading.Event()
+    warm_at: List[float] = []
+
+    def read_output():
+        for line in process.stdout:
+            if line.startswith("yt-dlp cargado"):
+                warm_at.append(time.perf_counter() - start)
+                warm.set()
+
+    threading.Thread(target=read_output, daemon=True).start()
+    ready = None
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        ready = time.perf_counter() - start
+                        break
+            except OSError:
+                time.sleep(0.02)
+        warm.wait(max(deadline - time.perf_counter(), 0))
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"ready": ready, "warm": warm_at[0] if warm_at else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description="Tiempo de arranque en frío.")
+    parser.add_argument("--runs", type=int, default=5, help="Repeticiones de cada medición")
+    parser.add_argument("--max-import", type=float, help="Umbral (s) de la mediana de import app.main")
+    parser.add_argument("--max-ready", type=float, help="Umbral (s) de la mediana hasta la primera respuesta")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Tiempo máximo (s) por arranque")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    imports, launches = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+            imports.append(measure_import(workdir))
+        with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+            launches.append(measure_launch(workdir, args.timeout))
+
+    result = {
+        "runs": args.runs,
+        "import_seconds": percentiles([r["seconds"] for r in imports]),
+        "ready_seconds": percentiles([r["ready"] for r in launches if r["ready"] is not None]),
+        "warm_seconds": percentiles([r["warm"] for r in launches if r["warm"] is not None]),
+        "yt_dlp_imported_eagerly": any(r["yt_dlp"] for r in imports),
+        "download_dir_created_on_import": any(r["download_dir_created"] for r in imports),
+    }
+
+    failures = []
+    if result["yt_dlp_imported_eagerly"]:
+        failures.append("import app.main importa yt-dlp")
+    if result["download_dir_created_on_import"]:
+        failures.append("import app.main crea DOWNLOAD_DIR")
+    if result["ready_seconds"]["count"] < args.runs:
+        failures.append("algún arranque no respondió a tiempo")
+    for key, limit in (("import_seconds", args.max_import), ("ready_seconds", args.max_ready)):
+        p50 = result[key]["p50"]
+        if limit is not None and (p50 is None or p50 > limit):
+            failures.append(f"{key} p50 = {p50} > {limit}")
+
+    for key, label in (("import_seconds", "import app.main"), ("ready_seconds", "primera respuesta"),
+                       ("warm_seconds", "yt-dlp cargado")):
+        print(f"  {label:<20} p50 {result[key]['p50']}s  máx {result[key]['max']}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    for failure in failures:
+        print(f"REGRESIÓN: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import statistics
+from typing import Dict, List, Optional
+
+
+def percentiles(values: List[float], scale: float = 1.0) -> Dict[str, Optional[float]]:
+    """Resumen de una muestra: p50/p90/p99/max/media (multiplicados por `scale`)."""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * scale, 3)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * scale, 3),
+        "mean": round(statistics.fmean(ordered) * scale, 3),
+    }
@@ -0,0 +1,141 @@
+"""
+Benchmark de almacenamiento: admisión por espacio en disco, retención LRU y
+reparto en subdirectorios (app/core/diskspace.py, DownloadStore.evict).
+
+    python -m bench.storage --downloads 12 --size-mb 8 --max-mb 40
+
+Encola más descargas de las que caben bajo STORAGE_MAX_BYTES (con STORAGE_EVICT
+activado) y una que no cabría nunca. Comprueba que todas las que caben terminan,
+que lo indexado nunca supera el tope, que la imposible se rechaza sin descargar
+y que los archivos quedan repartidos según OUTPUT_LAYOUT. Sale con código 1 si
+alguna comprobación no se cumple.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+MB = 1024 * 1024
+
+
+async def _run(args, media) -> Dict[str, Any]:
+    from app.core.database import init_db
+    from app.core.diskspace import disk_space
+    from app.jobs import job_scheduler, COMPLETED, FAILED
+    from app.store import download_store
+
+    init_db()
+    await download_store.reconcile()
+    await job_scheduler.start()
+    peak = 0
+    try:
+        started = time.perf_counter()
+        for i in range(args.downloads):
+            await job_scheduler.submit(media.video_url(f"s{i}"), f"s{i}", "18", [], {})
+        # Tamaño conocido de antemano (como el de la vista previa): se rechaza sin arrancar
+        oversized = await job_scheduler.submit(media.video_url("huge"), "huge", "18", [], {},
+                                               estimated_size=(args.max_mb + 1) * MB)
+
+        deadline = time.monotonic() + args.timeout
+        jobs = []
+        while time.monotonic() < deadline:
+            peak = max(peak, download_store.indexed_bytes())
+            jobs = await job_scheduler.list_jobs(limit=args.downloads + 1)
+            if all(job.state in (COMPLETED, FAILED) for job in jobs):
+                break
+            await asyncio.sleep(0.05)
+        seconds = time.perf_counter() - started
+
+        directories = set()
+        for root, _, files in os.walk(download_store.directory):
+            if files and os.path.basename(root) != ".index":
+                directories.add(os.path.relpath(root, download_store.directory))
+        states: Dict[str, int] = {}
+        for job in jobs:
+            if job.id != oversized.job.id:
+                states[job.state] = states.get(job.state, 0) + 1
+        rejected = next((job for job in jobs if job.id == oversized.job.id), None)
+        return {
+            "downloads": args.downloads,
+            "size_mb": args.size_mb,
+            "max_mb": args.max_mb,
+            "seconds": round(seconds, 3),
+            "states": states,
+            "peak_indexed_mb": round(peak / MB, 1),
+            "final_indexed_mb": round(download_store.indexed_bytes() / MB, 1),
+            "oversized_state": rejected.state if rejected else None,
+            "oversized_bytes": rejected.bytes_downloaded if rejected else None,
+            "directories": len(directories),
+            "disk": disk_space.stats(),
+            "store": download_store.stats(),
+        }
+    finally:
+        await job_scheduler.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.storage",
+                                     description="Admisión por espacio en disco y retención LRU.")
+    parser.add_argument("--downloads", type=int, default=12, help="Descargas a encolar")
+    parser.add_argument("--size-mb", type=int, default=8, help="Tamaño de cada video sintético")
+    parser.add_argument("--max-mb", type=int, default=40, help="Tope de almacenamiento (STORAGE_MAX_BYTES)")
+    parser.add_argument("--layout", default="id_hash", help="OUTPUT_LAYOUT")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Tiempo máximo (s)")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["OUTPUT_LAYOUT"] = args.layout
+        os.environ["STORAGE_MAX_BYTES"] = str(args.max_mb * MB)
+        os.environ["STORAGE_EVICT"] = "true"
+        os.environ["DISK_RESERVE_MARGIN"] = "0"
+
+        from app.core.config import ensure_download_dir
+        from app.services import YtDlpService
+
+        from .extractor import BenchIE
+        from .media_server import MediaServer
+
+        ensure_download_dir()
+        media = MediaServer(size=args.size_mb * MB)
+        media.start()
+        YtDlpService.extra_extractors = [BenchIE, *YtDlpService.extra_extractors]
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(_run(args, media))
+        finally:
+            media.stop()
+
+    print(f"  {result['downloads']} descargas de {result['size_mb']} MB con tope de {result['max_mb']} MB "
+          f"en {result['seconds']}s: {result['states']}")
+    print(f"  indexado: máx {result['peak_indexed_mb']} MB, final {result['final_indexed_mb']} MB; "
+          f"expulsados {result['store']['evicted']}")
+    print(f"  descarga imposible: {result['oversized_state']} ({result['oversized_bytes']} bytes descargados)")
+    print(f"  subdirectorios con archivos: {result['directories']} ({args.layout})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if result["states"] != {"completed": result["downloads"]}:
+        failures.append("no terminaron todas las descargas que caben")
+    if result["peak_indexed_mb"] > result["max_mb"]:
+        failures.append("lo indexado superó STORAGE_MAX_BYTES")
+    if result["oversized_state"] != "failed" or result["oversized_bytes"]:
+        failures.append("la descarga que no cabe no se rechazó antes de descargar")
+    if args.layout != "flat" and result["directories"] < 2:
+        failures.append("los archivos no se repartieron en subdirectorios")
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
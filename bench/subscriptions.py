@@ -0,0 +1,168 @@
+"""
+Benchmark de suscripciones: N canales sintéticos sondeados a la vez por
+app/subscriptions.py, para comprobar que no se disparan en estampida.
+
+    python -m bench.subscriptions --subscriptions 200 --max-polls 2
+
+Mide el tiempo hasta el primer sondeo de todos (línea base, sin descargas), el
+máximo de consultas de canal simultáneas (debe ser <= --max-polls), cuánto
+tarda en detectarse y encolarse un video nuevo, y que los canales que fallan
+pasan a backoff. Sale con código 1 si alguna comprobación no se cumple.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+from .stats import percentiles
+
+
+async def _wait_for(predicate, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(interval)
+    return False
+
+
+async def _run(args, media) -> Dict[str, Any]:
+    from app.core.database import init_db
+    from app.jobs import job_scheduler
+    from app.subscriptions import subscription_poller
+
+    init_db()
+    await job_scheduler.start()
+    await subscription_poller.start()
+    try:
+        for i in range(args.subscriptions):
+            media.publish(f"c{i}", *(f"c{i}-v{n}" for n in range(args.videos)))
+        start = time.perf_counter()
+        for i in range(args.subscriptions):
+            await subscription_poller.add(media.channel_url(f"c{i}"), "<=360p", args.interval, {})
+
+        async def all_polled():
+            return all(s.last_polled_at is not None for s in await subscription_poller.list())
+
+        baseline_ok = await _wait_for(all_polled, args.timeout)
+        baseline_seconds = time.perf_counter() - start
+        baseline_jobs = len(await job_scheduler.list_jobs(limit=100000))
+
+        # Videos nuevos en una parte de los canales; otros empiezan a fallar
+        updated = list(range(0, args.subscriptions, max(args.subscriptions // max(args.new, 1), 1)))[:args.new]
+        failing = [i for i in range(args.subscriptions) if i not in updated][:args.failing]
+        for i in failing:
+            media.channel_errors[f"c{i}"] = 1000
+        published_at = time.perf_counter()
+        for i in updated:
+            media.publish(f"c{i}", f"c{i}-new")
+
+        detected: Dict[str, float] = {}
+
+        async def all_detected():
+            for job in await job_scheduler.list_jobs(limit=100000):
+                if job.url not in detected:
+                    detected[job.url] = time.perf_counter() - published_at
+            return len(detected) >= len(updated)
+
+        detect_ok = await _wait_for(all_detected, args.timeout)
+        failing_urls = {media.channel_url(f"c{i}") for i in failing}
+        backoff = []
+
+        async def all_backing_off():
+            backoff[:] = [s for s in await subscription_poller.list() if s.url in failing_urls and s.failures]
+            return len(backoff) == len(failing_urls)
+
+        await _wait_for(all_backing_off, args.timeout)
+        return {
+            "subscriptions": args.subscriptions,
+            "max_polls": args.max_polls,
+            "interval": args.interval,
+            "baseline_ok": baseline_ok,
+            "baseline_seconds": round(baseline_seconds, 3),
+            "baseline_jobs": baseline_jobs,
+            "peak_channel_requests": media.peak_channel_active,
+            "channel_requests": media.channel_requests,
+            "new_videos": len(updated),
+            "detected": len(detected),
+            "detect_ok": detect_ok,
+            "detect_seconds": percentiles(list(detected.values())),
+            "failing": len(failing),
+            "failing_in_backoff": len(backoff),
+            "backoff_delay_seconds": percentiles([s.next_poll_at - s.last_polled_at for s in backoff]),
+            "stats": subscription_poller.stats(),
+        }
+    finally:
+        await subscription_poller.stop()
+        await job_scheduler.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.subscriptions",
+                                     description="Sondeo de muchas suscripciones a la vez.")
+    parser.add_argument("--subscriptions", type=int, default=200, help="Canales suscritos")
+    parser.add_argument("--videos", type=int, default=30, help="Videos ya publicados por canal")
+    parser.add_argument("--new", type=int, default=20, help="Canales que publican un video nuevo")
+    parser.add_argument("--failing", type=int, default=5, help="Canales que empiezan a fallar")
+    parser.add_argument("--max-polls", type=int, default=2, help="Sondeos simultáneos (SUBSCRIPTION_MAX_POLLS)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Segundos entre sondeos de cada canal")
+    parser.add_argument("--extract-latency", type=float, default=0.02, help="Retraso (s) del servidor por consulta")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Tiempo máximo (s) por fase")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["SUBSCRIPTION_MAX_POLLS"] = str(args.max_polls)
+        os.environ["SUBSCRIPTION_MIN_INTERVAL"] = "0"
+        os.environ["MAX_CONCURRENT_DOWNLOADS"] = "1"  # Se mide la detección; las descargas (64 KiB) son secundarias
+        os.environ["GOVERNOR_HOST_RATE"] = "0"        # Todos los canales en un único host local (ver bench.resilience)
+
+        from app.core.config import ensure_download_dir
+        from app.services import YtDlpService
+
+        from .extractor import BenchChannelIE, BenchIE
+        from .media_server import MediaServer
+
+        ensure_download_dir()
+        media = MediaServer(size=64 * 1024, latency=args.extract_latency)
+        media.start()
+        YtDlpService.extra_extractors = [BenchIE, BenchChannelIE, *YtDlpService.extra_extractors]
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(_run(args, media))
+        finally:
+            media.stop()
+
+    print(f"  línea base: {result['subscriptions']} canales en {result['baseline_seconds']}s, "
+          f"{result['baseline_jobs']} trabajos")
+    print(f"  consultas de canal simultáneas: máx {result['peak_channel_requests']} (límite {result['max_polls']})")
+    print(f"  videos nuevos: {result['detected']}/{result['new_videos']} detectados, "
+          f"p50 {result['detect_seconds']['p50']}s, máx {result['detect_seconds']['max']}s")
+    print(f"  canales con errores en backoff: {result['failing_in_backoff']}/{result['failing']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if not result["baseline_ok"] or result["baseline_jobs"]:
+        failures.append("la línea base no terminó o encoló descargas")
+    if result["peak_channel_requests"] > result["max_polls"]:
+        failures.append("se superó el límite de sondeos simultáneos")
+    if not result["detect_ok"] or result["detected"] != result["new_videos"]:
+        failures.append("no se detectaron todos los videos nuevos (o hubo duplicados)")
+    if result["failing_in_backoff"] != result["failing"]:
+        failures.append("algún canal con errores no entró en backoff")
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Benchmark de workers externos: un front end que solo reparte (LOCAL_DOWNLOADS=false)
+y N procesos worker (app/worker.py) descargando de su cola.
+
+    python -m bench.workers --workers 2 --downloads 12 --size-mb 8
+
+Mide el throughput total, cómo se reparten los trabajos entre workers y que
+el progreso de los workers llega a los clientes WebSocket del front end. Con
+--kill se mata (SIGKILL) un worker a mitad de su primera descarga: sus trabajos
+deben volver a la cola al vencer el lease y terminarlos otro worker. Sale con
+código 1 si alguna comprobación no se cumple.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+MB = 1024 * 1024
+
+
+def serve_worker(server: str, worker_id: str):
+    """Proceso worker del benchmark: el worker real con el extractor sintético registrado."""
+    from app.services import YtDlpService
+    from app.worker import DownloadWorker
+
+    from .extractor import BenchIE
+
+    YtDlpService.extra_extractors = [BenchIE, *YtDlpService.extra_extractors]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        DownloadWorker(server, worker_id).run()
+
+
+async def _watch(base_url: str, counts: Counter, stop: asyncio.Event):
+    """Cliente WebSocket del front end: cuenta los eventos de progreso y de estado que recibe."""
+    import websockets
+
+    url = base_url.replace("http", "ws", 1) + "/ws/logs/bench-workers?topics=progress,state"
+    async with websockets.connect(url) as websocket:
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(websocket.recv(), 0.2)
+            except asyncio.TimeoutError:
+                continue
+            for event in json.loads(frame):
+                counts[event["type"]] += 1
+                if event.get("worker_id"):
+                    counts["from_worker"] += 1
+
+
+async def _run(args, app_server, media, workers: Dict[str, subprocess.Popen]) -> Dict[str, Any]:
+    import httpx
+
+    base_url = app_server.base_url
+    counts: Counter = Counter()
+    stop = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch(base_url, counts, stop))
+    killed, victim, requeued = None, None, False
+    async with httpx.AsyncClient(base_url=f"{base_url}/api/v1", timeout=30.0) as client:
+        started = time.perf_counter()
+        for i in range(args.downloads):
+            response = await client.post("/download", data={
+                "url": media.video_url(f"w{i}"), "title": f"w{i}", "video_format_id": "18"})
+            response.raise_for_status()
+
+        deadline = time.monotonic() + args.timeout
+        jobs: List[Dict[str, Any]] = []
+        while time.monotonic() < deadline:
+            jobs = (await client.get("/jobs", params={"limit": args.downloads})).json()
+            if args.kill and killed is None:
+                # Matar al primer worker que tenga una descarga a medias
+                for job in jobs:
+                    if job["state"] == "running" and job["worker_id"] in workers:
+                        killed, victim = job["worker_id"], job["id"]
+                        workers[killed].kill()
+                        break
+            if all(job["state"] in ("completed", "failed", "cancelled") for job in jobs):
+                break
+            await asyncio.sleep(0.1)
+        seconds = time.perf_counter() - started
+        stats = (await client.get("/stats")).json()
+    await asyncio.sleep(0.5)  # Últimos eventos por WebSocket
+    stop.set()
+    await watcher
+
+    states = Counter(job["state"] for job in jobs)
+    per_worker = Counter(job["worker_id"] for job in jobs if job["state"] == "completed")
+    if killed is not None:
+        # La descarga interrumpida la terminó otro worker
+        requeued = any(job["id"] == victim and job["state"] == "completed" and job["worker_id"] != killed
+                       for job in jobs)
+    return {
+        "workers": args.workers,
+        "downloads": args.downloads,
+        "size_mb": args.size_mb,
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(args.downloads * args.size_mb / seconds, 2) if seconds else 0.0,
+        "states": dict(states),
+        "per_worker": dict(per_worker),
+        "killed": killed,
+        "requeued": requeued,
+        "ws_events": dict(counts),
+        "scheduler": stats["jobs"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.workers",
+                                     description="Front end que reparte trabajos y workers externos.")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos worker")
+    parser.add_argument("--concurrency", type=int, default=2, help="Descargas simultáneas por worker")
+    parser.add_argument("--downloads", type=int, default=12, help="Descargas a encolar")
+    parser.add_argument("--size-mb", type=int, default=8, help="Tamaño de cada video sintético")
+    parser.add_argument("--rate-mb", type=float, default=8.0, help="Límite de descarga de cada worker (MB/s)")
+    parser.add_argument("--lease", type=float, default=3.0, help="WORKER_LEASE_SECONDS")
+    parser.add_argument("--kill", action="store_true", help="Matar un worker a mitad de una descarga")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Tiempo máximo (s)")
+    parser.add_argument("--json", help="Guarda el resultado en este archivo")
+    parser.add_argument("--serve-worker", nargs=2, metavar=("SERVER", "ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_worker:
+        serve_worker(*args.serve_worker)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+        os.environ["DOWNLOAD_DIR"] = os.path.join(workdir, "media")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["LOCAL_DOWNLOADS"] = "false"
+        os.environ["WORKER_LEASE_SECONDS"] = str(args.lease)
+        os.environ["WORKER_POLL_INTERVAL"] = "0.2"
+        os.environ["MAX_CONCURRENT_DOWNLOADS"] = str(args.concurrency)
+        os.environ["DOWNLOAD_RATE_LIMIT"] = str(int(args.rate_mb * MB))
+        os.environ["SUBSCRIPTIONS_ENABLED"] = "false"
+
+        from .media_server import MediaServer
+        from .runner import AppServer
+
+        media = MediaServer(size=args.size_mb * MB)
+        media.start()
+        app_server = AppServer()
+        workers: Dict[str, subprocess.Popen] = {}
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                app_server.start()
+            for i in range(args.workers):
+                worker_id = f"bench-{i}"
+                workers[worker_id] = subprocess.Popen(
+                    [sys.executable, "-m", "bench.workers", "--serve-worker", app_server.base_url, worker_id])
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(_run(args, app_server, media, workers))
+        finally:
+            for process in workers.values():
+                process.terminate()
+            for process in workers.values():
+                process.wait(30)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                app_server.stop()
+            media.stop()
+
+    print(f"  {result['downloads']} descargas de {result['size_mb']} MB con {result['workers']} workers "
+          f"en {result['seconds']}s ({result['throughput_mb_s']} MB/s): {result['states']}")
+    print(f"  por worker: {result['per_worker']}")
+    if args.kill:
+        print(f"  worker matado: {result['killed']}; sus trabajos reasignados: {result['requeued']}")
+    print(f"  eventos WebSocket en el front end: {result['ws_events']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if result["states"] != {"completed": result["downloads"]}:
+        failures.append("no terminaron todas las descargas")
+    if len(result["per_worker"]) < min(args.workers - (1 if args.kill else 0), 2):
+        failures.append("los trabajos no se repartieron entre los workers")
+    if not result["ws_events"].get("progress") or not result["ws_events"].get("from_worker"):
+        failures.append("el progreso de los workers no llegó a los clientes WebSocket")
+    if args.kill and (result["killed"] is None or not result["requeued"]):
+        failures.append("los trabajos del worker caído no se reasignaron")
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
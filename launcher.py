@@ -1,13 +1,86 @@
-import uvicorn
+import argparse
 import os
+import socket
 import sys
+import threading
+import time
 import webbrowser
-from threading import Timer
-from app.main import app as fastapi_app
 
 # Este archivo sirve como punto de entrada (Entry Point) para:
 # 1. Ejecución directa (python launcher.py)
 # 2. PyInstaller (apuntando a este archivo se resuelven mejor los imports)
+#
+# La aplicación (FastAPI, SQLAlchemy...) se importa dentro de main(), después de
+# reservar el puerto; yt-dlp se carga en segundo plano cuando el servidor ya responde.
+
+
+def find_available_port(start_port=8000, max_attempts=10):
+    """Reserva un puerto libre iniciando desde start_port; devuelve el socket ya enlazado."""
+    for port in range(start_port, start_port + max_attempts):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(('127.0.0.1', port))
+            return sock
+        except OSError:
+            sock.close()
+    # Fallback: un puerto libre cualquiera
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+def profile_imports(limit):
+    """Modo --profile-imports: tiempo de importación por módulo (como python -X importtime)."""
+    from app.core.importtime import ImportProfiler
+
+    with ImportProfiler() as profiler:
+        import app.main  # noqa: F401
+    print("== Arranque (import app.main) ==")
+    print(profiler.report(limit))
+
+    from app.services import YtDlpService
+    with ImportProfiler() as profiler:
+        YtDlpService.warm_up()
+    print("\n== Calentamiento en segundo plano (yt-dlp) ==")
+    print(profiler.report(limit))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YTDL-NIS: servidor local y apertura del navegador.")
+    parser.add_argument("--port", type=int, default=8000, help="Primer puerto a probar")
+    parser.add_argument("--no-browser", action="store_true", help="No abrir el navegador")
+    parser.add_argument("--profile-imports", nargs="?", type=int, const=30, metavar="N",
+                        help="Muestra los N módulos más lentos de importar y sale")
+    args = parser.parse_args(argv)
+
+    if args.profile_imports:
+        profile_imports(args.profile_imports)
+        return
+
+    started = time.perf_counter()
+    sock = find_available_port(args.port)
+    port = sock.getsockname()[1]
+
+    import uvicorn
+    from app.main import app as fastapi_app
+
+    server = uvicorn.Server(uvicorn.Config(fastapi_app, host="127.0.0.1", port=port, reload=False))
+
+    def open_browser():
+        # Se abre cuando el servidor ya acepta conexiones (no tras un retraso fijo)
+        while not server.started:
+            if server.should_exit:
+                return
+            time.sleep(0.05)
+        print(f"Servidor listo en {time.perf_counter() - started:.2f}s")
+        if not args.no_browser:
+            webbrowser.open(f"http://127.0.0.1:{port}")
+
+    threading.Thread(target=open_browser, name="open-browser", daemon=True).start()
+
+    print(f"Iniciando servidor en http://127.0.0.1:{port}")
+    server.run(sockets=[sock])
+
 
 if __name__ == "__main__":
     # FIX: PyInstaller --windowed establece stdout/stderr como None.
@@ -18,30 +91,8 @@ if __name__ == "__main__":
     if sys.stderr is None:
         sys.stderr = open(os.devnull, "w")
 
-    import socket
-
-    def find_available_port(start_port=8000, max_attempts=10):
-        """Busca un puerto libre iniciando desde start_port"""
-        port = start_port
-        for _ in range(max_attempts):
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                if s.connect_ex(('127.0.0.1', port)) != 0:
-                    return port
-                port += 1
-        return start_port # Fallback to default if all usually taken
-
-    port = find_available_port()
-
-    def open_browser():
-        webbrowser.open(f"http://127.0.0.1:{port}")
-    
-    # Solo abrir navegador si no estamos en modo reload (debug)
-    # Pero para el exe final (sin reload) es util.
-    Timer(1.5, open_browser).start()
-    
     # freeze_support() es necesario para multiprocessing en Windows con PyInstaller
     from multiprocessing import freeze_support
     freeze_support()
-    
-    print(f"Iniciando servidor en http://127.0.0.1:{port}")
-    uvicorn.run(fastapi_app, host="127.0.0.1", port=port, reload=False)
+
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import signal
+import socket
+import sys
+
+# Punto de entrada de un worker de descargas externo (ver app/worker.py).
+# El front end (launcher.py, con LOCAL_DOWNLOADS=false si solo debe repartir)
+# hace de cola; se pueden lanzar tantos workers como se quiera, en este equipo
+# o en otros que compartan DOWNLOAD_DIR:
+#
+#     python worker.py --server http://127.0.0.1:8000 --concurrency 4
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YTDL-NIS: worker de descargas conectado a un front end.")
+    parser.add_argument("--server", default="http://127.0.0.1:8000", help="URL del front end")
+    parser.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}", help="Identificador del worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="Descargas simultáneas")
+    parser.add_argument("--postprocess-workers", type=int, default=None, help="Merge/FFmpeg simultáneos")
+    parser.add_argument("--token", default=None, help="WORKER_TOKEN del front end")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings, ensure_download_dir
+    from app.worker import DownloadWorker
+
+    ensure_download_dir()
+    worker = DownloadWorker(
+        args.server, args.id,
+        concurrency=args.concurrency or settings.MAX_CONCURRENT_DOWNLOADS,
+        postprocess_workers=args.postprocess_workers or settings.POSTPROCESS_WORKERS,
+        token=settings.WORKER_TOKEN if args.token is None else args.token,
+    )
+    # Ctrl+C / SIGTERM: los trabajos en curso se detienen y vuelven a la cola del front end
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == "__main__":
+    # PyInstaller --windowed deja stdout/stderr en None (ver launcher.py)
+    if sys.stdout is None:
+        sys.stdout = open(os.devnull, "w")
+    if sys.stderr is None:
+        sys.stderr = open(os.devnull, "w")
+
+    from multiprocessing import freeze_support
+    freeze_support()
+
+    main()